@@ -0,0 +1,118 @@
+'''
+Benchmark: laying out requirement hierarchy diagrams of several thousand nodes.
+
+A hierarchy diagram is built over a synthetic compartment, both with a client
+that has no requirement hierarchy (one is loaded for the diagram) and with the
+hierarchy shared by a run, and both graphs are checked against the hierarchy
+computed directly from the synthetic children. Synthetic graphs of increasing
+size, as trees and as trees with additional cross edges (e.g., traces), are then
+laid out in full and collapsed to a display budget, and laid out again through a
+layout cache as an unchanged graph would be. Run with `python -m bench.diagram_layout`.
+'''
+import time
+import random
+import collections
+
+from ve_diagram_generator.cache import ResultCache
+from ve_diagram_generator.hierarchy import RequirementHierarchy
+from ve_diagram_generator.layout import Graph, layout, to_svg
+from ve_diagram_generator.view_templates import diagram_registry
+
+from .snapshot_views import _SimulatedIncQuery, _compartment
+
+# sizes of graphs to lay out, in number of nodes
+A_NODE_COUNTS = [500, 1000, 2000, 5000]
+
+# cross edges per node added to the trace graphs
+X_CROSS_EDGES = 0.1
+
+# display budget of collapsed diagrams
+N_MAX_NODES = 400
+
+
+def _graph(nl_nodes: int, x_cross: float, y_random: random.Random) -> Graph:
+    a_nodes = [(f'_{i_node}', f'Requirement {i_node}') for i_node in range(nl_nodes)]
+
+    # each node is a child of an earlier one
+    a_edges = [(f'_{y_random.randrange(i_node)}', f'_{i_node}') for i_node in range(1, nl_nodes)]
+
+    # additional edges between arbitrary nodes, in either direction
+    for _ in range(int(nl_nodes*x_cross)):
+        a_edges.append((f'_{y_random.randrange(nl_nodes)}', f'_{y_random.randrange(nl_nodes)}'))
+
+    return Graph(nodes=a_nodes, edges=list(dict.fromkeys(a_edges)))
+
+
+def _time(f_run):
+    x_start = time.perf_counter()
+    z_result = f_run()
+    return time.perf_counter()-x_start, z_result
+
+
+def _hierarchy_diagram():
+    h_tables = _compartment(random.Random(0))
+    h_args = collections.defaultdict(list, {
+        'templateType': 'Requirement Hierarchy Diagram',
+        'level': 'L2',
+        'functionalArea': 'Sequencing',
+    })
+
+    f_diagram = diagram_registry[h_args['templateType']]
+
+    k_plain = _SimulatedIncQuery(h_tables)
+    x_plain, k_graph_plain = _time(lambda: f_diagram(k_plain, h_args))
+
+    k_server = _SimulatedIncQuery(h_tables)
+    x_hierarchy, k_graph_hierarchy = _time(lambda: f_diagram(RequirementHierarchy(k_server), h_args))
+
+    # expected; every requirement below the selected ones, and every child edge among them
+    h_children = collections.defaultdict(list)
+    for g_row in h_tables['artifactChildren']:
+        h_children[g_row['artifactId']].append(g_row['childId'])
+
+    as_roots = {g_row['artifactId'] for g_row in h_tables['artifactInfo']
+        if ('L2', 'System VAC', 'Sequencing') == (g_row['level'], g_row['attributeKey'], g_row['attributeValue'])}
+    as_nodes = set()
+    a_stack = list(as_roots)
+    while a_stack:
+        si_node = a_stack.pop()
+        if si_node not in as_nodes:
+            as_nodes.add(si_node)
+            a_stack.extend(h_children[si_node])
+
+    a_expected = (sorted(as_nodes), sorted((si_parent, si_child) for si_parent in as_nodes for si_child in h_children[si_parent]))
+
+    for s_mode, k_graph in [('without hierarchy', k_graph_plain), ('with hierarchy', k_graph_hierarchy)]:
+        if (sorted(si_node for si_node, _ in k_graph.nodes), sorted(k_graph.edges)) != a_expected:
+            raise Exception(f'Hierarchy diagram {s_mode} differs from the synthetic hierarchy')
+
+    print(f'hierarchy diagram of {len(k_graph_plain.nodes)} nodes: {x_plain:.2f}s with {k_plain.requests} queries (without hierarchy), {x_hierarchy:.2f}s with {k_server.requests} queries (with hierarchy)')
+    print()
+
+
+def main():
+    _hierarchy_diagram()
+
+    y_random = random.Random(0)
+    y_cache = ResultCache()
+
+    print(f'{"graph":>6} {"nodes":>6} {"edges":>6} {"layout":>8} {"cached":>8} {"crossings":>10} {"svg KiB":>8} {"collapsed":>10} {"drawn":>6} {"svg KiB":>8}')
+    for s_kind, x_cross in [('tree', 0), ('trace', X_CROSS_EDGES)]:
+        for nl_nodes in A_NODE_COUNTS:
+            k_graph = _graph(nl_nodes, x_cross, y_random)
+
+            # full layout, through the cache as in a run
+            f_layout = lambda: y_cache.get_or_compute((k_graph.digest(), None), lambda: layout(k_graph))
+            x_layout, k_layout = _time(f_layout)
+            x_cached, _ = _time(f_layout)
+            nb_svg = len(to_svg(k_layout))
+
+            # collapsed to the display budget
+            x_collapsed, k_collapsed = _time(lambda: layout(k_graph, max_nodes=N_MAX_NODES))
+            nb_collapsed = len(to_svg(k_collapsed))
+
+            print(f'{s_kind:>6} {nl_nodes:>6} {len(k_graph.edges):>6} {x_layout:>8.3f} {x_cached:>8.4f} {k_layout.crossings:>10} {nb_svg/1024:>8.0f} {x_collapsed:>10.3f} {len(k_collapsed.nodes):>6} {nb_collapsed/1024:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''
+Benchmark: cost of rendering every table directive on one page.
+
+Compares the per-directive parse/serialize flow (each view receives the page as a
+string and hands back a serialized string) against a single shared Document that
+is parsed once and serialized once. Run with `python -m bench.document_session`.
+'''
+import time
+
+from opl import QueryResultsTable
+
+from ve_diagram_generator.view import Document, Table
+
+# sizes of pages to benchmark, in number of directives
+A_DIRECTIVE_COUNTS = [10, 20, 40, 80, 160, 320]
+
+# filler paragraphs between directives
+N_FILLER = 20
+
+
+def _directive_xhtml(i_directive: int) -> str:
+    return f'''
+        <ac:structured-macro ac:name="span" ac:schema-version="1" ac:macro-id="macro-{i_directive}">
+            <ac:parameter ac:name="class">insertView</ac:parameter>
+            <ac:rich-text-body>
+                <p><ac:link><ri:page ri:space-key="BENCH" ri:content-title="_View: Table {i_directive}" /></ac:link></p>
+            </ac:rich-text-body>
+        </ac:structured-macro>
+    '''+''.join([f'<p>Paragraph {i_filler} following directive {i_directive}&nbsp;text.</p>' for i_filler in range(N_FILLER)])
+
+
+def _page(nl_directives: int) -> str:
+    return ''.join([_directive_xhtml(i_directive) for i_directive in range(nl_directives)])
+
+
+def _extras(i_directive: int):
+    return {
+        'directive_page_space': {'value': 'BENCH'},
+        'directive_page_title': {'value': f'_View: Table {i_directive}'},
+        'directive_page_id': {'value': str(i_directive)},
+        'directive_link_text': {'value': f'Table {i_directive}'},
+        'view_template_def': {'value': f'https://confluence.example.org/display/BENCH/{i_directive}'},
+    }
+
+
+K_RESULTS = QueryResultsTable(
+    rows=[{'identifier': f'REQ-{i_row}', 'name': f'Requirement {i_row}'} for i_row in range(5)],
+    labels={'identifier': 'ID', 'name': 'Name'},
+)
+
+
+# each view parses the page string and serializes the whole page after insertion
+def _render_per_directive(sx_page: str, nl_directives: int) -> str:
+    for i_directive in range(nl_directives):
+        k_table = Table(document=sx_page, directive_macro_id=f'macro-{i_directive}', extras=_extras(i_directive))
+        k_table.clear()
+        sx_page = k_table.render(K_RESULTS).to_string()
+
+    return sx_page
+
+
+# every view modifies a single shared document which is serialized once
+def _render_session(sx_page: str, nl_directives: int) -> str:
+    k_document = Document(sx_page)
+
+    for i_directive in range(nl_directives):
+        k_table = Table(document=k_document, directive_macro_id=f'macro-{i_directive}', extras=_extras(i_directive))
+        k_table.clear()
+        k_table.render(K_RESULTS)
+
+    return k_document.to_string()
+
+
+def _time(f_render, sx_page: str, nl_directives: int, nl_repeat: int=3) -> float:
+    x_best = float('inf')
+    for _ in range(nl_repeat):
+        x_start = time.perf_counter()
+        f_render(sx_page, nl_directives)
+        x_best = min(x_best, time.perf_counter() - x_start)
+    return x_best
+
+
+def main():
+    print(f'{"directives":>10} {"per-directive (s)":>18} {"ms/view":>8} {"session (s)":>12} {"ms/view":>8} {"speedup":>8}')
+    for nl_directives in A_DIRECTIVE_COUNTS:
+        sx_page = _page(nl_directives)
+
+        x_legacy = _time(_render_per_directive, sx_page, nl_directives)
+        x_session = _time(_render_session, sx_page, nl_directives)
+
+        print(f'{nl_directives:>10} {x_legacy:>18.4f} {1e3*x_legacy/nl_directives:>8.3f} {x_session:>12.4f} {1e3*x_session/nl_directives:>8.3f} {x_legacy/x_session:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
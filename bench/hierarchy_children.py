@@ -0,0 +1,66 @@
+'''
+Benchmark: listing children and deeper descendants of requirements.
+
+Evaluates system views (which list each requirement's children) against the
+simulated IncQuery server of `bench.snapshot_views`, first querying children per
+view and then from the hierarchy loaded with one query, and checks both agree.
+Then times descendant lookups over all levels, cold and cached, and limited to
+two levels. Run with `python -m bench.hierarchy_children`.
+'''
+import time
+import random
+
+from ve_diagram_generator.view_templates import _system_reqs
+from ve_diagram_generator.hierarchy import RequirementHierarchy
+
+from .snapshot_views import _SimulatedIncQuery, _compartment, _views, _run, _rows, N_ARTIFACTS, X_LATENCY
+
+# number of artifacts whose descendants are looked up
+N_LOOKUPS = 1000
+
+
+def _lookups(k_hierarchy, a_ids, max_depth=None):
+    x_start = time.perf_counter()
+    nl_found = sum(len(k_hierarchy.descendants(si_artifact, max_depth)) for si_artifact in a_ids)
+    return time.perf_counter()-x_start, nl_found
+
+
+def main():
+    y_random = random.Random(0)
+    h_tables = _compartment(y_random)
+    a_views = [(si_method, h_args) for si_method, h_args in _views(y_random) if 'Appendix Flight System Requirements' == si_method]
+
+    print(f'{N_ARTIFACTS} artifacts, {len(a_views)} views with children, {X_LATENCY*1000:.0f}ms per query')
+    print(f'{"mode":>9} {"seconds":>9} {"queries":>9}')
+
+    k_live = _SimulatedIncQuery(h_tables)
+    x_live, a_live = _run(k_live, a_views)
+    print(f'{"per view":>9} {x_live:>9.2f} {k_live.requests:>9}')
+
+    k_server = _SimulatedIncQuery(h_tables)
+    k_hierarchy = RequirementHierarchy(k_server)
+    x_hierarchy, a_hierarchy = _run(k_hierarchy, a_views)
+    print(f'{"hierarchy":>9} {x_hierarchy:>9.2f} {k_server.requests:>9}')
+
+    # both must agree
+    for (si_method, h_args), k_live_result, k_hierarchy_result in zip(a_views, a_live, a_hierarchy):
+        if _rows(k_live_result) != _rows(k_hierarchy_result):
+            raise Exception(f'Hierarchy disagrees with live queries for {si_method} {h_args}')
+
+    # descendant lookups from the top of the hierarchy down
+    a_ids = [f'_{i_artifact}' for i_artifact in range(N_LOOKUPS)]
+
+    print()
+    print(f'{"lookup":>9} {"seconds":>9} {"found":>9}')
+    for s_label, n_depth in [('cold', None), ('cached', None), ('2 levels', 2)]:
+        x_lookups, nl_found = _lookups(k_hierarchy, a_ids, n_depth)
+        print(f'{s_label:>9} {x_lookups:>9.3f} {nl_found:>9}')
+
+    # a deeper children column
+    x_start = time.perf_counter()
+    k_result = _system_reqs(k_hierarchy, {**a_views[0][1], 'childDepth': 'all'})
+    print(f'\nview with all descendants: {time.perf_counter()-x_start:.3f}s, {sum(len(g_row["children"]) for g_row in k_result.rows)} listed')
+
+
+if __name__ == '__main__':
+    main()
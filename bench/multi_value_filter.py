@@ -0,0 +1,87 @@
+'''
+Benchmark: evaluating a requirements view whose maturity filter has several values.
+
+Compares the 'union' strategy (one query against a disjunctive pattern) with the
+'fanout' strategy (one concurrent query per value, merged client-side) against a
+live IncQuery server. Uses the same INCQUERY_* environment variables as the CLI.
+
+    python -m bench.multi_value_filter -c <compartment-uri> --level L3 \
+        --functional-area Sequencing -M Concept -M Preliminary -M Baseline -M Final -M Verified
+'''
+import argparse
+import threading
+import time
+from os import environ
+
+import opl
+
+from ve_diagram_generator import ve_patterns
+from ve_diagram_generator.view_templates import _req_system_vac
+
+
+class _CountingIncQuery:
+    '''
+    Forwards to an IncQuery client while counting executed queries
+    '''
+    def __init__(self, k_incquery):
+        self._k_incquery = k_incquery
+        self._y_lock = threading.Lock()
+        self.requests = 0
+
+    def __getattr__(self, si_attr):
+        return getattr(self._k_incquery, si_attr)
+
+    def execute(self, *args, **kwargs):
+        with self._y_lock:
+            self.requests += 1
+        return self._k_incquery.execute(*args, **kwargs)
+
+
+def main():
+    y_parser = argparse.ArgumentParser(prog='bench.multi_value_filter')
+    y_parser.add_argument('-c', '--compartment-uri', required=True)
+    y_parser.add_argument('--level', required=True)
+    y_parser.add_argument('--functional-area', required=True)
+    y_parser.add_argument('-M', '--maturity', action='append', required=True)
+    y_parser.add_argument('--repeat', type=int, default=3)
+    y_parser.add_argument('--incquery-server')
+    g_args = y_parser.parse_args()
+
+    k_iqs = opl.IncQueryProject(
+        compartment=g_args.compartment_uri,
+        server=environ.get('INCQUERY_SERVER') or g_args.incquery_server,
+        username=environ.get('INCQUERY_USER'),
+        password=environ.get('INCQUERY_PASS'),
+        patterns={
+            **opl.patterns['basic'],
+            **ve_patterns,
+        },
+    )
+
+    h_args = {
+        'level': g_args.level,
+        'functionalArea': g_args.functional_area,
+        'maturity': g_args.maturity,
+    }
+
+    h_ids = {}
+    print(f'{len(g_args.maturity)}-value maturity filter, best of {g_args.repeat}')
+    print(f'{"strategy":>8} {"seconds":>9} {"requests":>9} {"rows":>6}')
+    for s_strategy in ['union', 'fanout']:
+        x_best = float('inf')
+        for _ in range(g_args.repeat):
+            k_counting = _CountingIncQuery(k_iqs)
+            x_start = time.perf_counter()
+            k_result = _req_system_vac(k_counting, h_args, True, strategy=s_strategy)
+            x_best = min(x_best, time.perf_counter() - x_start)
+
+        h_ids[s_strategy] = {g_row['artifactId'] for g_row in k_result.rows}
+        print(f'{s_strategy:>8} {x_best:>9.3f} {k_counting.requests:>9} {len(k_result.rows):>6}')
+
+    # both strategies must agree
+    if h_ids['union'] != h_ids['fanout']:
+        print(f'WARNING: strategies disagree on {len(h_ids["union"] ^ h_ids["fanout"])} artifact(s)')
+
+
+if __name__ == '__main__':
+    main()
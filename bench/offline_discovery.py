@@ -0,0 +1,268 @@
+'''
+Benchmark: discovering directives from a dump of the space graph.
+
+Generates a synthetic space with plain, annotated and external link directives,
+including links nested in macros (which must be excluded unless annotated),
+`owl:sameAs` aliases and proxies, links to another space's template of the same
+title and pages with several root containers. Then compares evaluating
+`directives.rq` with rdflib's generic SPARQL engine against the indexed
+evaluation in `SpaceGraph.directives`, checking that both produce the same rows,
+down to which blank node each directive and link is bound to.
+Run with `python -m bench.offline_discovery`.
+'''
+import time
+import tempfile
+import collections
+from os import path
+
+import opl
+import rdflib
+from rdflib import RDF, OWL, BNode, Literal, URIRef
+from rdflib.collection import Collection
+
+from ve_diagram_generator.offline import SpaceGraph, NS_CFL, NS_AC
+
+PD_ASSET = path.join(path.dirname(path.dirname(path.abspath(__file__))), 've_diagram_generator', 'asset')
+
+# page counts to benchmark
+A_PAGE_COUNTS = [2, 100, 1000, 5000]
+
+# pages checked against the generic engine, each in a space of its own, since its evaluation
+# of the nested paths grows steeply with the size of the space; the first page links to the
+# template whose title also exists in another space
+A_SPARQL_PAGES = [0, 1]
+
+# paragraphs of filler text per page
+N_FILLER = 10
+
+# number of view templates
+N_TEMPLATES = 10
+
+SI_SPACE = 'BENCH'
+P_SPACE = 'https://wiki.example/display/BENCH'
+
+# another space holding a template of the same title as one of BENCH's
+SI_OTHER_SPACE = 'OTHER'
+P_NS = 'https://wiki.example/rdf/'
+
+A_COMMANDS = ['insertView', 'insertHover']
+A_TITLE_PREFIXES = ['_View:']
+A_HREF_PREFIXES = ['https://wiki.example/']
+
+
+def _list(y_graph, a_items):
+    z_head = BNode()
+    Collection(y_graph, z_head, a_items)
+    return z_head
+
+
+def _container(y_graph, z_type, a_body, s_predicate='body'):
+    z_node = BNode()
+    y_graph.add((z_node, RDF.type, z_type))
+    y_graph.add((z_node, NS_CFL[s_predicate], _list(y_graph, a_body)))
+    return z_node
+
+
+def _page_ref(y_graph, i_template, b_space=False, si_space=SI_SPACE):
+    z_link = BNode()
+    y_graph.add((z_link, RDF.type, NS_CFL.PageReference))
+    y_graph.add((z_link, NS_CFL.ref, Literal(f'_View: T{i_template}')))
+    y_graph.add((z_link, NS_CFL.text, Literal(f'template {i_template}')))
+    if b_space:
+        y_graph.add((z_link, NS_CFL.spaceKey, Literal(si_space)))
+    return z_link
+
+
+# external link whose target is a proxy of a template page
+def _proxy_link(y_graph, i_page, i_template):
+    z_href = BNode()
+    p_proxy = URIRef(f'https://proxy.example/{i_page}')
+    y_graph.add((z_href, RDF.type, NS_CFL.ExternalLink))
+    y_graph.add((z_href, NS_CFL.hrefLinked, p_proxy))
+    y_graph.add((p_proxy, OWL.sameAs, URIRef(f'{P_NS}template/{i_template}')))
+    return z_href
+
+
+def _macro(y_graph, s_id, a_body, s_class=None):
+    z_macro = _container(y_graph, NS_CFL.Macro, a_body)
+    y_graph.add((z_macro, NS_AC.name, Literal('span')))
+    y_graph.add((z_macro, NS_AC['macro-id'], Literal(s_id)))
+    if s_class:
+        z_param = BNode()
+        y_graph.add((z_param, NS_AC.name, Literal('class')))
+        y_graph.add((z_param, NS_CFL.value, Literal(s_class)))
+        y_graph.add((z_macro, NS_CFL.parameter, z_param))
+    return z_macro
+
+
+def _space(nl_pages: int, i_first: int=0) -> rdflib.Graph:
+    y_graph = rdflib.Graph()
+
+    # view templates
+    for i_template in range(N_TEMPLATES):
+        p_doc = URIRef(f'{P_NS}template/{i_template}')
+        y_graph.add((p_doc, RDF.type, NS_CFL.Document))
+        y_graph.add((p_doc, NS_CFL.pageId, Literal(str(900000+i_template))))
+        y_graph.add((p_doc, NS_CFL.title, Literal(f'_View: T{i_template}')))
+        y_graph.add((p_doc, NS_CFL.spaceKey, Literal(SI_SPACE)))
+
+    # same title as the first template, in another space
+    p_doc = URIRef(f'{P_NS}template/other')
+    y_graph.add((p_doc, RDF.type, NS_CFL.Document))
+    y_graph.add((p_doc, NS_CFL.pageId, Literal('999999')))
+    y_graph.add((p_doc, NS_CFL.title, Literal('_View: T0')))
+    y_graph.add((p_doc, NS_CFL.spaceKey, Literal(SI_OTHER_SPACE)))
+
+    for i_page in range(i_first, i_first+nl_pages):
+        i_template = i_page % N_TEMPLATES
+
+        a_body = [_container(y_graph, NS_CFL.Paragraph, [Literal(f'Filler paragraph {i_filler}.')]) for i_filler in range(N_FILLER)]
+
+        # plain link directive, inside a list
+        a_body.append(_container(y_graph, NS_CFL.List, [
+            _container(y_graph, NS_CFL.ListItem, [_page_ref(y_graph, i_template)]),
+        ], 'items'))
+
+        # annotated directive
+        a_body.append(_macro(y_graph, f'm{i_page}', [
+            _container(y_graph, NS_CFL.Paragraph, [_page_ref(y_graph, i_template, True)]),
+        ], 'insertView'))
+
+        # link inside an unrelated macro; not a directive
+        a_body.append(_macro(y_graph, f'x{i_page}', [
+            _container(y_graph, NS_CFL.Paragraph, [_page_ref(y_graph, i_template)]),
+        ]))
+
+        # external link to a special domain
+        z_href = BNode()
+        y_graph.add((z_href, RDF.type, NS_CFL.ExternalLink))
+        y_graph.add((z_href, NS_CFL.hrefLinked, URIRef(f'https://wiki.example/pages/{i_page}')))
+        a_body.append(_container(y_graph, NS_CFL.Paragraph, [z_href]))
+
+        # annotated directive nested in an unrelated macro, itself nested in another
+        a_body.append(_macro(y_graph, f'y{i_page}', [
+            _macro(y_graph, f'z{i_page}', [
+                _macro(y_graph, f'n{i_page}', [
+                    _container(y_graph, NS_CFL.Paragraph, [_page_ref(y_graph, i_template)]),
+                ], 'insertHover'),
+                # plain link two macros deep; not a directive
+                _container(y_graph, NS_CFL.Paragraph, [_page_ref(y_graph, i_template)]),
+            ]),
+        ]))
+
+        # plain link through an alias of the page reference
+        z_alias = BNode()
+        y_graph.add((z_alias, OWL.sameAs, _page_ref(y_graph, (i_template+1) % N_TEMPLATES)))
+        a_body.append(_container(y_graph, NS_CFL.Paragraph, [z_alias]))
+
+        # annotated directive whose link goes through a proxy of the template page
+        a_body.append(_macro(y_graph, f'p{i_page}', [
+            _container(y_graph, NS_CFL.Paragraph, [_proxy_link(y_graph, i_page, i_template)]),
+        ], 'insertView'))
+
+        # links to a template title that also exists in another space, without and with a space key
+        a_body.append(_container(y_graph, NS_CFL.Paragraph, [_page_ref(y_graph, 0)]))
+        a_body.append(_container(y_graph, NS_CFL.Paragraph, [_page_ref(y_graph, 0, True, SI_OTHER_SPACE)]))
+
+        # space key of a space that has no such template
+        a_body.append(_container(y_graph, NS_CFL.Paragraph, [_page_ref(y_graph, 1, True, SI_OTHER_SPACE)]))
+
+        # second root container
+        a_second = [_container(y_graph, NS_CFL.List, [
+            _container(y_graph, NS_CFL.ListItem, [_page_ref(y_graph, (i_template+2) % N_TEMPLATES, True)]),
+        ], 'items')]
+
+        p_doc = URIRef(f'{P_NS}page/{i_page}')
+        y_graph.add((p_doc, RDF.type, NS_CFL.Document))
+        y_graph.add((p_doc, NS_CFL.pageId, Literal(str(i_page))))
+        y_graph.add((p_doc, NS_CFL.title, Literal(f'Page {i_page}')))
+        y_graph.add((p_doc, NS_CFL.spaceKey, Literal(SI_SPACE)))
+        y_graph.add((p_doc, NS_CFL.content, _list(y_graph, [
+            _container(y_graph, NS_CFL.Container, a_body),
+            _container(y_graph, NS_CFL.Container, a_second),
+        ])))
+
+    return y_graph
+
+
+def _query() -> str:
+    def _inject(a_values):
+        return ' '.join(Literal(s_value).n3() for s_value in a_values)
+
+    with open(path.join(PD_ASSET, 'directives.rq'), 'r') as d:
+        return opl.Sparql.load(
+            template=d.read(),
+            variables={
+                'SPACE_GRAPH': P_SPACE,
+            },
+            injections={
+                'SOURCE_PAGE': '',
+                'DIRECTIVE_COMMANDS': _inject(A_COMMANDS),
+                'DIRECTIVE_PAGE_TITLE_PREFIXES': _inject(A_TITLE_PREFIXES),
+                'DIRECTIVE_LINK_HREF_PREFIXES': _inject(A_HREF_PREFIXES),
+                'SPACES': f'values (?space_id ?space_iri) {{ ({Literal(SI_SPACE).n3()} {URIRef(P_SPACE).n3()}) }}',
+            },
+        )
+
+
+# rows as a multiset; both sides read the same parsed graph, so blank node labels are comparable
+def _normalize(a_rows) -> collections.Counter:
+    return collections.Counter(
+        tuple(sorted((si_var, g_term['type'], g_term['value']) for si_var, g_term in g_row.items()))
+            for g_row in a_rows
+    )
+
+
+def _dump(y_graph, pd_tmp: str, s_name: str) -> str:
+    pr_dump = path.join(pd_tmp, f'{s_name}.nt')
+    y_graph.serialize(pr_dump, format='nt', encoding='utf-8')
+    return pr_dump
+
+
+def _directives(k_space):
+    return k_space.directives(A_COMMANDS, A_TITLE_PREFIXES, A_HREF_PREFIXES, {SI_SPACE: P_SPACE})
+
+
+def main():
+    sq_directives = _query()
+
+    with tempfile.TemporaryDirectory() as pd_tmp:
+        # check against the generic engine
+        print(f'{"page":>6} {"indexed":>9} {"sparql":>9} {"rows":>6}')
+        for i_page in A_SPARQL_PAGES:
+            k_space = SpaceGraph(_dump(_space(1, i_page), pd_tmp, f'page-{i_page}'))
+
+            x_start = time.perf_counter()
+            a_rows = _directives(k_space)
+            x_indexed = time.perf_counter()-x_start
+
+            x_start = time.perf_counter()
+            a_expected = k_space.fetch(sq_directives)
+            x_sparql = time.perf_counter()-x_start
+
+            if _normalize(a_rows) != _normalize(a_expected):
+                raise Exception(f'Indexed evaluation differs from the SPARQL engine on page {i_page}: {len(a_rows)} vs {len(a_expected)} row(s)')
+
+            print(f'{i_page:>6} {x_indexed:>8.3f}s {x_sparql:>8.3f}s {len(a_rows):>6}')
+
+        print()
+
+        # scale
+        print(f'{"pages":>6} {"triples":>8} {"load+index":>11} {"indexed":>9} {"rows":>6}')
+        for nl_pages in A_PAGE_COUNTS:
+            y_graph = _space(nl_pages)
+            pr_dump = _dump(y_graph, pd_tmp, f'space-{nl_pages}')
+
+            x_start = time.perf_counter()
+            k_space = SpaceGraph(pr_dump)
+            x_load = time.perf_counter()-x_start
+
+            x_start = time.perf_counter()
+            a_rows = _directives(k_space)
+            x_indexed = time.perf_counter()-x_start
+
+            print(f'{nl_pages:>6} {len(y_graph):>8} {x_load:>10.3f}s {x_indexed:>8.3f}s {len(a_rows):>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Benchmark: throughput of rendering many large pages in page threads versus in
+worker processes.
+
+Each page holds table directives whose query results are evaluated up front, so
+only the page string and the rows cross into the workers, as in a real run.
+Run with `python -m bench.render_processes`.
+'''
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from opl import QueryResultsTable
+
+from ve_diagram_generator.view import DirectiveRender, Table, render_page
+
+from .document_session import _page, _extras
+
+# number of pages and directives per page
+N_PAGES = 32
+N_DIRECTIVES = 40
+
+# rows per rendered table
+N_ROWS = 200
+
+
+K_RESULTS = QueryResultsTable(
+    rows=[{'identifier': f'REQ-{i_row}', 'name': f'Requirement {i_row}', 'text': f'The system shall satisfy requirement {i_row}.'} for i_row in range(N_ROWS)],
+    labels={'identifier': 'ID', 'name': 'Name', 'text': 'Text'},
+)
+
+A_RENDERS = [DirectiveRender(
+    view=Table,
+    directive=_extras(i_directive),
+    macro_id=f'macro-{i_directive}',
+    render_args=(K_RESULTS,),
+) for i_directive in range(N_DIRECTIVES)]
+
+
+def _run(y_pool, sx_page: str) -> float:
+    x_start = time.perf_counter()
+    for _ in y_pool.map(render_page, [sx_page]*N_PAGES, [A_RENDERS]*N_PAGES):
+        pass
+    return time.perf_counter() - x_start
+
+
+def main():
+    sx_page = _page(N_DIRECTIVES)
+    nl_cpus = os.cpu_count() or 1
+
+    with ThreadPoolExecutor(max_workers=nl_cpus) as y_pool:
+        x_threads = _run(y_pool, sx_page)
+
+    print(f'{"workers":>8} {"pages/s":>8} {"speedup":>8}')
+    print(f'{"threads":>8} {N_PAGES/x_threads:>8.1f} {1:>7.1f}x')
+
+    for nl_processes in sorted({1, 2, 4, nl_cpus}):
+        with ProcessPoolExecutor(max_workers=nl_processes) as y_pool:
+            # warm up the workers
+            list(y_pool.map(abs, range(nl_processes)))
+
+            x_processes = _run(y_pool, sx_page)
+
+        print(f'{nl_processes:>8} {N_PAGES/x_processes:>8.1f} {x_threads/x_processes:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
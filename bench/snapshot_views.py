@@ -0,0 +1,163 @@
+'''
+Benchmark: evaluating many views with per-view IncQuery queries versus from a
+snapshot of the compartment.
+
+A simulated IncQuery server answers the `ve_patterns` queries over synthetic
+requirements after a fixed round-trip delay. Each view in a set of system and
+subsystem views over several levels, functional areas and maturities is
+evaluated both ways, and the results are checked to be identical. Run with
+`python -m bench.snapshot_views`.
+'''
+import re
+import time
+import random
+import itertools
+import threading
+import collections
+
+from ve_diagram_generator.view_templates import method_registry
+from ve_diagram_generator.snapshot import ArtifactSnapshot
+
+# synthetic compartment
+N_ARTIFACTS = 5000
+A_LEVELS = ['L2', 'L3', 'L4', 'L5']
+A_AREAS = ['Sequencing', 'Telecom', 'Power', 'Thermal', 'Guidance', 'Propulsion', 'Avionics', 'Structures']
+A_MATURITIES = ['Concept', 'Preliminary', 'Baseline', 'Final']
+A_SYSTEMS = ['Flight System', 'Ground System', 'Launch Vehicle']
+
+# patterns built by `combine_keys`, e.g., `artifactAttributeStringArrayKeys_artifactId_64`, and their key bindings
+R_KEYS_PATTERN = re.compile(r'^(\w+?)Keys_')
+R_KEY_BINDING = re.compile(r'^(\w+)Key(\d+)$')
+
+# simulated round trip of one query, in seconds
+X_LATENCY = 0.02
+
+# number of views to evaluate
+N_VIEWS = 200
+
+
+class _SimulatedIncQuery:
+    '''
+    Answers the base patterns over synthetic rows after a fixed delay, counting queries
+    '''
+    def __init__(self, h_tables):
+        self._h_tables = h_tables
+        self._y_lock = threading.Lock()
+        self._s_compartment = 'bench'
+        self._h_patterns = {}
+        self.requests = 0
+
+    def execute(self, name, patterns={}, bindings={}, w_url_provider=None):
+        with self._y_lock:
+            self.requests += 1
+
+        time.sleep(X_LATENCY)
+
+        # pattern binding several join keys; any key tuple matches
+        m_keys = R_KEYS_PATTERN.match(name)
+        if m_keys:
+            h_fixed = {}
+            h_keys = collections.defaultdict(dict)
+            for si_key, z_value in bindings.items():
+                m_binding = R_KEY_BINDING.match(si_key)
+                if m_binding:
+                    h_keys[m_binding[2]][m_binding[1]] = z_value
+                else:
+                    h_fixed[si_key] = z_value
+
+            a_cols = sorted(next(iter(h_keys.values())))
+            as_keys = {tuple(h_key[si_col] for si_col in a_cols) for h_key in h_keys.values()}
+
+            return [dict(g_row) for g_row in self._h_tables[m_keys[1]]
+                if tuple(g_row.get(si_col) for si_col in a_cols) in as_keys
+                    and all(g_row.get(si_key) == z_value for si_key, z_value in h_fixed.items())]
+
+        return [dict(g_row) for g_row in self._h_tables[name] if all(g_row.get(si_key) == z_value for si_key, z_value in bindings.items())]
+
+
+def _compartment(y_random):
+    a_info = []
+    a_arrays = []
+    a_children = []
+    for i_artifact in range(N_ARTIFACTS):
+        si_artifact = f'_{i_artifact}'
+
+        h_arrays = {
+            'System VAC': y_random.sample(A_AREAS, y_random.randint(1, 2)),
+            'Key/Driver [S]': y_random.sample(['Key', 'Driver'], y_random.randint(0, 2)),
+            'Specified Element': y_random.sample(A_SYSTEMS, y_random.randint(1, 2)),
+        }
+
+        g_info = {
+            'artifactName': f'Requirement {i_artifact}',
+            'artifactId': si_artifact,
+            'artifactURL': f'https://dng.example/{i_artifact}',
+            'artifactShapeName': 'Requirement',
+            'level': y_random.choice(A_LEVELS),
+            'identifier': f'REQ-{i_artifact}',
+            'primaryText': f'The system shall satisfy requirement {i_artifact}.',
+            'maturity': y_random.choice(A_MATURITIES),
+        }
+
+        for si_key, a_values in h_arrays.items():
+            for s_value in a_values:
+                a_info.append({**g_info, 'attributeKey': si_key, 'attributeValue': s_value})
+                a_arrays.append({'artifactId': si_artifact, 'attributeKey': si_key, 'itemValue': s_value})
+
+        # parent among earlier artifacts
+        if i_artifact:
+            i_parent = y_random.randrange(i_artifact)
+            a_children.append({'artifactId': f'_{i_parent}', 'child': si_artifact, 'childId': si_artifact, 'childName': g_info['artifactName']})
+
+    return {
+        'artifactInfo': a_info,
+        'artifactAttributeStringArray': a_arrays,
+        'artifactChildren': a_children,
+    }
+
+
+def _views(y_random):
+    a_combinations = list(itertools.product(sorted(method_registry), A_LEVELS, A_AREAS))
+    return [(si_method, {
+        'level': s_level,
+        'functionalArea': s_area,
+        'maturity': y_random.sample(A_MATURITIES, y_random.randint(1, 3)),
+    }) for si_method, s_level, s_area in (a_combinations*(N_VIEWS//len(a_combinations)+1))[:N_VIEWS]]
+
+
+def _run(k_incquery, a_views):
+    x_start = time.perf_counter()
+    a_results = [method_registry[si_method](k_incquery, h_args) for si_method, h_args in a_views]
+    return time.perf_counter()-x_start, a_results
+
+
+# comparable form of a view's rows
+def _rows(k_result):
+    return sorted((g_row['artifactId'], sorted(g_row['keyDrivers']), sorted(g_row['systems']), sorted(g_row.get('children', []))) for g_row in k_result.rows)
+
+
+def main():
+    y_random = random.Random(0)
+    h_tables = _compartment(y_random)
+    a_views = _views(y_random)
+
+    print(f'{N_ARTIFACTS} artifacts, {N_VIEWS} views, {X_LATENCY*1000:.0f}ms per query')
+    print(f'{"mode":>8} {"seconds":>9} {"queries":>9}')
+
+    k_live = _SimulatedIncQuery(h_tables)
+    x_live, a_live = _run(k_live, a_views)
+    print(f'{"live":>8} {x_live:>9.2f} {k_live.requests:>9}')
+
+    k_server = _SimulatedIncQuery(h_tables)
+    k_snapshot = ArtifactSnapshot(k_server, bindings={'artifactShapeName': 'Requirement'})
+    x_snapshot, a_snapshot = _run(k_snapshot, a_views)
+    print(f'{"snapshot":>8} {x_snapshot:>9.2f} {k_server.requests:>9}')
+
+    # both must agree
+    for (si_method, h_args), k_live_result, k_snapshot_result in zip(a_views, a_live, a_snapshot):
+        if _rows(k_live_result) != _rows(k_snapshot_result):
+            raise Exception(f'Snapshot disagrees with live queries for {si_method} {h_args}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''
+Benchmark: building the rendered element for a table of query results.
+
+Compares generating the XHTML string and parsing it back into an element with
+building the elements directly. Reports time and how much the resident set of
+the process grows while building, measured in a fresh process per case so that
+libxml2's own allocations are included (reads `/proc`, so Linux only), at several
+table sizes. Run with `python -m bench.table_render`.
+'''
+import gc
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from opl import QueryResultsTable
+
+from ve_diagram_generator.view import _lxml_from_string, _table_element
+
+# table sizes to benchmark, in number of rows
+A_ROW_COUNTS = [100, 1000, 10000]
+
+H_LABELS = {
+    'identifier': 'ID',
+    'artifactName': 'Requirement Name',
+    'primaryText': 'Requirement Text',
+    'systems': 'Affected Systems',
+    'maturity': 'Maturity',
+}
+
+
+def _results(nl_rows: int) -> QueryResultsTable:
+    return QueryResultsTable(
+        rows=[{
+            'identifier': f'REQ-{i_row}',
+            'artifactName': f'Requirement {i_row}',
+            'primaryText': f'The system shall satisfy requirement {i_row} & all of its <derived> constraints. '*3,
+            'systems': ['Flight System', 'Ground System'],
+            'maturity': 'Baseline',
+        } for i_row in range(nl_rows)],
+        labels=H_LABELS,
+    )
+
+
+# XHTML string, parsed back into an element
+def _via_string(k_results: QueryResultsTable):
+    return _lxml_from_string(k_results.to_confluence_xhtml(span_id='ve-render-table-bench', macro_id='bench'))[0]
+
+
+# elements built directly
+def _direct(k_results: QueryResultsTable):
+    return _table_element(k_results, span_id='ve-render-table-bench', macro_id='bench')
+
+
+# resident set size of this process and its peak since the last reset, in bytes
+def _rss():
+    h_status = {}
+    with open('/proc/self/status') as y_status:
+        for s_line in y_status:
+            si_key, _, s_value = s_line.partition(':')
+            if si_key in ('VmRSS', 'VmHWM'):
+                h_status[si_key] = int(s_value.split()[0])*1024
+
+    return (h_status['VmRSS'], h_status['VmHWM'])
+
+
+# growth of the resident set while running a function once
+def _rss_growth(f_run, z_input) -> int:
+    gc.collect()
+
+    # reset the peak to the current resident set
+    with open('/proc/self/clear_refs', 'w') as y_refs:
+        y_refs.write('5')
+
+    (nb_before, _) = _rss()
+    f_run(z_input)
+    (_, nb_peak) = _rss()
+
+    return nb_peak - nb_before
+
+
+# run a module-level function in a fresh process, so that memory freed by earlier cases cannot be reused
+def _in_process(f_run, *a_args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as y_pool:
+        return y_pool.submit(f_run, *a_args).result()
+
+
+# growth of the resident set while building one table
+def _build_rss(f_build, nl_rows: int) -> int:
+    return _rss_growth(f_build, _results(nl_rows))
+
+
+def _measure(f_build, k_results: QueryResultsTable, nl_repeat: int=3):
+    x_best = float('inf')
+    for _ in range(nl_repeat):
+        x_start = time.perf_counter()
+        f_build(k_results)
+        x_best = min(x_best, time.perf_counter() - x_start)
+
+    return (x_best, _in_process(_build_rss, f_build, len(k_results.rows)))
+
+
+def main():
+    print(f'{"rows":>6} {"string (s)":>11} {"RSS MiB":>8} {"direct (s)":>11} {"RSS MiB":>8} {"speedup":>8}')
+    for nl_rows in A_ROW_COUNTS:
+        k_results = _results(nl_rows)
+
+        (x_string, nb_string) = _measure(_via_string, k_results)
+        (x_direct, nb_direct) = _measure(_direct, k_results)
+
+        print(f'{nl_rows:>6} {x_string:>11.4f} {nb_string/2**20:>8.1f} {x_direct:>11.4f} {nb_direct/2**20:>8.1f} {x_string/x_direct:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+Benchmark: re-rendering pages from unchanged data.
+
+Renders a page of table directives whose requirement text is wrapped in HTML
+macros and holds non-ASCII characters, plus a diagram whose labels are truncated
+with an ellipsis. Then renders the result again from the same data, as the next
+run would, and checks that the page is found unchanged (so it is not uploaded).
+Run with `python -m bench.unchanged_pages`.
+'''
+import time
+
+from opl import QueryResultsTable
+
+from ve_diagram_generator.layout import Graph, layout
+from ve_diagram_generator.view import DirectiveRender, Table, Diagram, render_page
+from ve_diagram_generator.view_templates import _wrap_confluence_html_macro
+
+from .document_session import _page, _extras
+
+# number of table directives on the page; the diagram follows them
+N_TABLES = 40
+
+# rows per rendered table
+N_ROWS = 50
+
+
+def _renders():
+    k_results = QueryResultsTable(
+        rows=[{
+            'artifactId': f'_{i_row}',
+            'identifier': f'REQ-{i_row}',
+            'primaryText': f'<p>The naïve estimate shall stay within 5 °C – see requirement {i_row} ≥ “baseline”.</p>',
+        } for i_row in range(N_ROWS)],
+        labels={'identifier': 'ID', 'primaryText': 'Requirement Text'},
+        rewriters={'primaryText': _wrap_confluence_html_macro},
+    )
+
+    # labels long enough to be truncated
+    k_layout = layout(Graph(
+        nodes=[(f'_{i_node}', f'Requirement {i_node} on the thermal environment of the flight system') for i_node in range(20)],
+        edges=[('_0', f'_{i_node}') for i_node in range(1, 20)],
+    ))
+
+    return [DirectiveRender(
+        view=Table,
+        directive=_extras(i_directive),
+        macro_id=f'macro-{i_directive}',
+        render_args=(k_results,),
+    ) for i_directive in range(N_TABLES)]+[DirectiveRender(
+        view=Diagram,
+        directive=_extras(N_TABLES),
+        macro_id=f'macro-{N_TABLES}',
+        render_args=(k_layout,),
+    )]
+
+
+def main():
+    a_renders = _renders()
+
+    # first run renders the page
+    x_start = time.perf_counter()
+    sx_rendered = render_page(_page(N_TABLES+1), a_renders)
+    x_first = time.perf_counter()-x_start
+
+    if sx_rendered is None or '…' not in sx_rendered or 'naïve' not in sx_rendered:
+        raise Exception('Rendered page is missing the non-ASCII content')
+
+    # next run renders the uploaded page from the same data
+    x_start = time.perf_counter()
+    sx_again = render_page(sx_rendered, a_renders)
+    x_again = time.perf_counter()-x_start
+
+    if sx_again is not None:
+        raise Exception('Page rendered again from unchanged data is reported as changed')
+
+    print(f'page of {len(sx_rendered)/1024:.0f} KiB: {x_first:.3f}s to render, {x_again:.3f}s to render again and find it unchanged')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''
+Benchmark: parsing and serializing very large pages.
+
+Compares the previous whole-string path (entity replacement passes and wrapper
+concatenation before parsing; `etree.tostring` plus a regex to strip the wrapper
+after) with the incremental parser and the serializer writing each child of the
+wrapper straight to the output, both collected into a string and streamed to a
+file. Reports time and how much the resident set of the process grows, relative
+to the size of the page, measured in a fresh process per case so that libxml2's
+own allocations are included (reads `/proc`, so Linux only). Run with
+`python -m bench.xhtml_stream`.
+'''
+import re
+import os
+import time
+
+from lxml import etree
+
+from ve_diagram_generator.view import SI_ROOT, SX_NAMESPACES, H_ENTITY_REPLACEMENTS, _lxml_from_string, _lxml_to_string, _lxml_write
+
+from .table_render import _rss_growth, _in_process
+
+# page sizes to benchmark, in MiB
+A_PAGE_SIZES = [1, 4, 16]
+
+
+def _page(nb_page: int) -> str:
+    sx_block = '''<p>Requirement text with&nbsp;entities &amp; <strong>markup</strong>.</p>
+        <ac:structured-macro ac:name="span" ac:schema-version="1" ac:macro-id="bench">
+            <ac:parameter ac:name="id">ve-bench</ac:parameter>
+            <ac:rich-text-body><table><tbody><tr><td>REQ-1</td><td>Flight System</td></tr></tbody></table></ac:rich-text-body>
+        </ac:structured-macro>
+    '''
+    return sx_block*(nb_page//len(sx_block)+1)
+
+
+# previous parse path
+def _legacy_parse(s_content: str):
+    for s_entity, s_replace in H_ENTITY_REPLACEMENTS.items():
+        s_content = s_content.replace(s_entity, s_replace)
+
+    return etree.fromstring(f'<{SI_ROOT} {SX_NAMESPACES}>'+s_content+f'</{SI_ROOT}>', parser=etree.XMLParser(strip_cdata=False))
+
+
+# previous serialize path
+def _legacy_serialize(ye_root) -> str:
+    s_doc = etree.tostring(ye_root).decode()
+    return re.sub(r'^\s*<'+SI_ROOT+r'[^>]*>\s*|\s*<\/'+SI_ROOT+r'>\s*$', '', s_doc)
+
+
+# serialize to a file without collecting the output
+def _stream_serialize(ye_root):
+    with open(os.devnull, 'wb') as y_output:
+        _lxml_write(ye_root, y_output)
+
+
+# growth of the resident set while running one step on a page of the given size
+def _step_rss(f_run, b_parsed: bool, n_mib: int) -> int:
+    z_input = _page(n_mib*2**20)
+    if b_parsed:
+        z_input = _lxml_from_string(z_input)
+
+    return _rss_growth(f_run, z_input)
+
+
+def _measure(f_run, z_input, b_parsed: bool, n_mib: int, nl_repeat: int=3):
+    x_best = float('inf')
+    for _ in range(nl_repeat):
+        x_start = time.perf_counter()
+        f_run(z_input)
+        x_best = min(x_best, time.perf_counter() - x_start)
+
+    return (x_best, _in_process(_step_rss, f_run, b_parsed, n_mib))
+
+
+def main():
+    print(f'{"MiB":>4} {"step":>10} {"path":>8} {"time (s)":>9} {"RSS/page":>9}')
+    for n_mib in A_PAGE_SIZES:
+        sx_page = _page(n_mib*2**20)
+        nb_page = len(sx_page)
+        ye_root = _lxml_from_string(sx_page)
+
+        for (s_step, s_path, f_run, z_input) in [
+            ('parse', 'legacy', _legacy_parse, sx_page),
+            ('parse', 'stream', _lxml_from_string, sx_page),
+            ('serialize', 'legacy', _legacy_serialize, ye_root),
+            ('serialize', 'string', _lxml_to_string, ye_root),
+            ('serialize', 'stream', _stream_serialize, ye_root),
+        ]:
+            (x_run, nb_rss) = _measure(f_run, z_input, z_input is ye_root, n_mib)
+
+            print(f'{n_mib:>4} {s_step:>10} {s_path:>8} {x_run:>9.4f} {nb_rss/nb_page:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
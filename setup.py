@@ -15,7 +15,7 @@ def find_version(filename):
 
 version = find_version('ve_diagram_generator/__init__.py')
 
-packages = find_packages(exclude=('examples*', 'test*', 'scrap*', 'build*'))
+packages = find_packages(exclude=('examples*', 'test*', 'scrap*', 'build*', 'bench*'))
 
 setup(
     name='ve_diagram_generator',
@@ -1,6 +1,6 @@
 from .patterns import ve_patterns
 from .view_templates import method_registry
-from .view import View, DirectedView, MacroNotFoundException, Table, Tooltip, Diagram
+from .view import Document, View, DirectedView, MacroNotFoundException, Table, Tooltip, Diagram, DirectiveRender, render_page
 
 __version__ = '0.0.1'
 
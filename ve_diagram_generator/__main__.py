@@ -5,17 +5,100 @@ from pprint import pformat
 import collections
 import argparse
 import textwrap
+import traceback
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import opl
 import rdflib
 from lxml.html import document_fromstring
 
-from . import __version__, ve_patterns, method_registry, View, DirectedView, MacroNotFoundException, Table, Tooltip, Diagram
+from . import view_templates
+from . import __version__, ve_patterns, method_registry, View, DirectedView, MacroNotFoundException, Table, Tooltip, Diagram, DirectiveRender, render_page
 
-from .view import _promote_directive_page_title
+from .view import _promote_directive_page_title, _promote_directive_link
+from .scheduler import Backend, _is_retryable, _http_status
+from .cache import ResultCache, DiskCache, CachedIncQuery, normalize_args, _digest
+from .state import StateStore, PageState
+from .wiki import PageStore, UpdateQueue
+from .transport import HttpPools, PooledSparql, pool_incquery, pool_confluence
+from .offline import SpaceGraph
+from .snapshot import ArtifactSnapshot
+from .hierarchy import RequirementHierarchy
+from .layout import layout
 
 PD_ASSET = path.join(Path(__file__).parent.absolute(), 'asset')
 
+y_parser = argparse.ArgumentParser(
+    prog='ve_diagram_generator',
+    description='render all views for the given set of pages',
+)
+
+# required options
+y_parser.add_argument('-c', '--compartment-uri', help='IncQuery Compartment URI')
+y_parser.add_argument('-m', '--mopid', help='MMS Org / Project ID (#ref)')
+y_parser.add_argument('-p', '--page-id', action='append', help='Page ID(s); omit to discover directives across the whole space')
+y_parser.add_argument('-s', '--space', help='Confluence Wiki space ID', required=True)
+
+# optional options
+y_parser.add_argument('--incquery-server')
+y_parser.add_argument('--confluence-server')
+y_parser.add_argument('--sparql-endpoint')
+
+# concurrency options
+y_parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of pages to process concurrently')
+y_parser.add_argument('--max-incquery-requests', type=int, default=4, help='Maximum number of simultaneous requests to IncQuery')
+y_parser.add_argument('--max-confluence-requests', type=int, default=4, help='Maximum number of simultaneous requests to Confluence')
+y_parser.add_argument('--max-sparql-requests', type=int, default=2, help='Maximum number of simultaneous requests to the SPARQL endpoint')
+y_parser.add_argument('--incquery-rate', type=float, default=0, help='Maximum number of requests per second to IncQuery (0 for no limit)')
+y_parser.add_argument('--confluence-rate', type=float, default=0, help='Maximum number of requests per second to Confluence (0 for no limit)')
+y_parser.add_argument('--sparql-rate', type=float, default=0, help='Maximum number of requests per second to the SPARQL endpoint (0 for no limit)')
+y_parser.add_argument('--max-retries', type=int, default=5, help='Number of times a request that is throttled (HTTP 429) or fails with a server error (HTTP 5xx) is retried')
+y_parser.add_argument('--render-processes', type=int, default=0, help='Number of worker processes for parsing, rendering and serializing pages (0 to render in the page threads); use with --jobs above this number so that I/O keeps the processes busy')
+
+# connection options
+y_parser.add_argument('--http-connect-timeout', type=float, default=10, help='Seconds to wait for a connection to any backend to be established')
+y_parser.add_argument('--http-read-timeout', type=float, default=300, help='Seconds to wait for any backend to send data')
+y_parser.add_argument('--no-keep-alive', action='store_true', help='Close connections after each request instead of reusing them')
+
+# discovery options
+y_parser.add_argument('--discovery-chunk-size', type=int, default=0, help='Discover directives over chunks of this many pages at a time rather than with one query over the whole space (0 for one query)')
+y_parser.add_argument('--discovery-jobs', type=int, default=2, help='Number of discovery chunks to query simultaneously')
+y_parser.add_argument('--stream-discovery', action='store_true', help='Order directives by page and start rendering each page as soon as its directives have arrived, rather than after the whole discovery query completes')
+y_parser.add_argument('--offline-graph', help='Dump of the space graph (e.g., N-Triples or Turtle) to discover directives and view template definitions from instead of the SPARQL endpoint')
+
+# page transfer options
+y_parser.add_argument('--prefetch-batch-size', type=int, default=50, help='Number of pages whose content is fetched from Confluence per search request')
+y_parser.add_argument('--prefetch-mb', type=int, default=256, help='Approximate bound in MiB on prefetched page content held in memory')
+y_parser.add_argument('--write-interval', type=float, default=0, help='Minimum number of seconds between consecutive page updates')
+
+# evaluation options
+y_parser.add_argument('--diagram-max-nodes', type=int, default=400, help='Largest number of boxes drawn in a diagram; deeper subtrees of larger graphs are collapsed (0 for no limit)')
+y_parser.add_argument('--multi-value-strategy', choices=sorted(view_templates.AS_MULTI_VALUE_STRATEGIES), default=view_templates.S_MULTI_VALUE_STRATEGY, help='How to evaluate filters that accept several values, e.g., a list of maturities')
+
+# caching options
+y_parser.add_argument('--view-cache-size', type=int, default=256, help='Maximum number of evaluated views to keep in memory for reuse (0 to disable)')
+y_parser.add_argument('--view-cache-mb', type=int, default=256, help='Approximate memory bound in MiB for evaluated views kept for reuse')
+y_parser.add_argument('--cache-dir', default=path.join(environ.get('XDG_CACHE_HOME') or path.join(Path.home(), '.cache'), 've_diagram_generator'), help='Directory for the persistent IncQuery result cache')
+y_parser.add_argument('--cache-ttl', type=float, default=24, help='Hours after which persisted IncQuery results expire')
+y_parser.add_argument('--cache-max-mb', type=int, default=512, help='Size bound in MiB for persisted IncQuery results')
+y_parser.add_argument('--no-cache', action='store_true', help='Do not read or write the persistent IncQuery result cache')
+y_parser.add_argument('--snapshot', action='store_true', help='Load all requirement info, string arrays and children of the compartment with a few bulk queries and evaluate views from memory')
+
+# incremental options
+y_parser.add_argument('-i', '--incremental', action='store_true', help='Skip pages whose Confluence version, view templates and query inputs are unchanged since the last run')
+y_parser.add_argument('--state-file', help='SQLite file recording the pages written by previous runs (defaults to a file in the cache directory); only kept with --incremental, --changed-template or when given')
+y_parser.add_argument('-t', '--changed-template', action='append', help='Title or IRI of an edited view template; re-render only the pages known to reference it')
+
+# parse args
+g_args = y_parser.parse_args()
+
+# apply evaluation options
+view_templates.S_MULTI_VALUE_STRATEGY = g_args.multi_value_strategy
+
+# fanned-out queries of all views share one pool, no larger than the IncQuery request cap
+view_templates.N_FANOUT_WORKERS = g_args.max_incquery_requests
+
 P_INCQUERY_SERVER = environ.get('INCQUERY_SERVER') or g_args.incquery_server
 S_INCQUERY_USER = environ.get('INCQUERY_USER')
 S_INCQUERY_PASS = environ.get('INCQUERY_PASS')
@@ -33,13 +116,14 @@ if not P_INCQUERY_SERVER:
 if not P_CONFLUENCE_SERVER:
     raise Exception('Must provide a URL for Confluence server')
 
-if not P_SPARQL_ENDPOINT:
+if not P_SPARQL_ENDPOINT and not g_args.offline_graph:
     raise Exception('Must provide a URL for SPARQL endpoint')
 
 
 H_DIRECTIVE_COMMANDS = {
     'insertView': Table,
     'insertHover': Tooltip,
+    'insertDiagram': Diagram,
 }
 
 H_DIRECTIVE_PAGE_TITLE_PREFIXES = {
@@ -70,26 +154,7 @@ def _inject(f_injector, a_inputs):
 def _normalize_indent(sx_input, s_indent):
     return textwrap.indent(textwrap.dedent(sx_input), s_indent)
 
-y_parser = argparse.ArgumentParser(
-    prog='ve_diagram_generator',
-    description='render all views for the given set of pages',
-)
-
-# required options
-y_parser.add_argument('-c', '--compartment-uri', help='IncQuery Compartment URI')
-y_parser.add_argument('-m', '--mopid', help='MMS Org / Project ID (#ref)')
-y_parser.add_argument('-p', '--page-id', action='append', help='Page ID(s)', required=True)
-y_parser.add_argument('-s', '--space', help='Confluence Wiki space ID', required=True)
-
-# optional options
-y_parser.add_argument('--incquery-server')
-y_parser.add_argument('--confluence-server')
-y_parser.add_argument('--sparql-endpoint')
-
-# parse args
-g_args = y_parser.parse_args()
-
-a_pages = g_args.page_id
+a_pages = g_args.page_id or []
 si_space = g_args.space
 p_space = f'{P_CONFLUENCE_SERVER}/display/{si_space}'
 
@@ -97,10 +162,10 @@ p_space = f'{P_CONFLUENCE_SERVER}/display/{si_space}'
 gc_incquery = {}
 
 # compartment URI given
-if 'compartment_uri' in g_args:
+if g_args.compartment_uri:
     gc_incquery['compartment'] = g_args.compartment_uri
 # use mopid
-elif 'mopid' in g_args:
+elif g_args.mopid:
     # extract parts
     m_mopid = re.match(r'^([^/]+)/([^#]+)(?:#(.*))?$', g_args.mopid)
 
@@ -116,6 +181,33 @@ else:
 
 
 
+# bound the number and rate of requests sent to each backend, and retry transient failures
+y_backend_incquery = Backend('IncQuery', g_args.max_incquery_requests, rate=g_args.incquery_rate, burst=g_args.max_incquery_requests, max_retries=g_args.max_retries)
+y_backend_confluence = Backend('Confluence', g_args.max_confluence_requests, rate=g_args.confluence_rate, burst=g_args.max_confluence_requests, max_retries=g_args.max_retries)
+y_backend_sparql = Backend('SPARQL', g_args.max_sparql_requests, rate=g_args.sparql_rate, burst=g_args.max_sparql_requests, max_retries=g_args.max_retries)
+
+# CPU-bound page rendering is offloaded to worker processes; page threads keep doing the I/O
+y_render_pool = ProcessPoolExecutor(max_workers=g_args.render_processes) if g_args.render_processes > 0 else None
+
+# identical views across pages share one evaluation
+y_view_cache = ResultCache(
+    max_entries=g_args.view_cache_size,
+    max_bytes=g_args.view_cache_mb*1024*1024,
+)
+
+# diagrams of unchanged graphs share one layout
+y_layout_cache = ResultCache(
+    max_entries=g_args.view_cache_size,
+    max_bytes=g_args.view_cache_mb*1024*1024,
+)
+
+# pooled connections shared by all requests to each backend
+y_http = HttpPools(
+    connect_timeout=g_args.http_connect_timeout,
+    read_timeout=g_args.http_read_timeout,
+    keep_alive=not g_args.no_keep_alive,
+)
+
 # create IncQuery instance
 k_iqs = opl.IncQueryProject(
     **gc_incquery,
@@ -128,6 +220,30 @@ k_iqs = opl.IncQueryProject(
     },
 )
 
+# route its requests through pooled connections
+if not pool_incquery(y_http, k_iqs, g_args.max_incquery_requests):
+    print('IncQuery client does not expose a replaceable connection pool; using its own', file=sys.stderr)
+
+k_iqs = y_backend_incquery.bind(k_iqs)
+
+# persistent result cache
+if not g_args.no_cache:
+    k_iqs = CachedIncQuery(k_iqs, DiskCache(
+        directory=g_args.cache_dir,
+        ttl=g_args.cache_ttl*60*60,
+        max_bytes=g_args.cache_max_mb*1024*1024,
+    ))
+
+# answer views from an in-memory snapshot of the compartment's requirements
+k_snapshot = None
+if g_args.snapshot:
+    k_iqs = k_snapshot = ArtifactSnapshot(k_iqs, bindings={
+        'artifactShapeName': 'Requirement',
+    })
+
+# children columns (and deeper levels of them) are looked up in a hierarchy loaded with one query
+k_iqs = RequirementHierarchy(k_iqs)
+
 # create Confluence instance
 k_confluence = opl.Confluence(
     server=P_CONFLUENCE_SERVER,
@@ -135,36 +251,93 @@ k_confluence = opl.Confluence(
     password=S_CONFLUENCE_PASS,
 )
 
-# create SPARQL instance
-k_sparql = opl.Sparql(
-    endpoint=P_SPARQL_ENDPOINT,
+# route its requests through pooled connections
+if not pool_confluence(y_http, k_confluence, g_args.max_confluence_requests):
+    print('Confluence client does not expose a replaceable session; using its own', file=sys.stderr)
+
+# raw Confluence client, gated by the backend; page writes are not repeated after a server error
+y_confluence = y_backend_confluence.bind(k_confluence._y_confluence, non_idempotent=['put'])
+
+# page contents are fetched in bulk ahead of rendering
+k_pages = PageStore(y_confluence,
+    batch_size=g_args.prefetch_batch_size,
+    max_bytes=g_args.prefetch_mb*1024*1024,
+)
+
+# page updates go through a paced queue
+k_updates = UpdateQueue(y_confluence,
+    writers=g_args.max_confluence_requests,
+    interval=g_args.write_interval,
 )
 
+# local record of pages written by previous runs and of which pages use which templates; a plain run writes no file
+k_store = None
+if g_args.incremental or g_args.changed_template or g_args.state_file:
+    k_store = StateStore(g_args.state_file or path.join(g_args.cache_dir, 'state.sqlite'))
+
+# page states are only consulted in incremental mode
+k_state = k_store if g_args.incremental else None
+
+# restrict to pages that depend on the changed template(s)
+if g_args.changed_template:
+    a_dependents = sorted({si_page for s_template in g_args.changed_template for si_page in k_store.dependents(s_template)})
+
+    # nothing depends on it as far as previous runs know
+    if not a_dependents:
+        print(f'No pages are known to reference the template(s) {g_args.changed_template}; run without --changed-template to (re)build the index')
+        sys.exit(0)
+
+    a_pages = sorted(set(a_pages) | set(a_dependents)) if a_pages else a_dependents
+
+# offline; load the space graph dump and answer queries locally
+if g_args.offline_graph:
+    k_space = SpaceGraph(g_args.offline_graph)
+    k_sparql = k_space
+# create SPARQL instance, submitting queries over pooled connections
+else:
+    k_space = None
+    k_sparql = y_backend_sparql.bind(PooledSparql(
+        endpoint=P_SPARQL_ENDPOINT,
+        session=y_http.session('SPARQL', g_args.max_sparql_requests),
+    ))
+
 
-def _render_table(kv_table: Table, si_page_src: str):
-    g_template_ref = kv_table.template_ref
+def _load_template_defs(a_template_defs) -> dict:
+    '''
+    Resolve the view template definitions of the given template pages with a single query
 
-    p_ref = g_template_ref.iri
+    :param a_template_defs: IRIs of the `_View:` template pages
+    :return: dict mapping each template IRI to its args dict
+    '''
+    # every requested template gets an entry, even if its definition table is empty
+    h_template_defs = {p_ref: collections.defaultdict(list) for p_ref in a_template_defs}
 
-    if si_space != g_template_ref.space:
-        raise Exception(f'Cross reference in #{si_page_src} invocates template definition in another space ["{si_space}" != "{g_template_ref.space}"]: <{p_ref}>')
+    # nothing to resolve
+    if not h_template_defs:
+        return h_template_defs
 
     # load the SPARQL query and process vars/injections
     with open(path.join(PD_ASSET, 'view-table-def.rq'), 'r') as d:
-        sq_template_def = opl.Sparql.load(
+        sq_template_defs = opl.Sparql.load(
             template=d.read(),
             variables={
                 'SPACE_GRAPH': p_space,
-                'SOURCE_PAGE': p_ref,
+            },
+            injections={
+                'VIEW_TEMPLATE_DEFS': _normalize_indent(f'''
+                    values ?view_template_def {{
+                        {_inject(_sparql_iri, h_template_defs.keys())}
+                    }}
+                ''', '    '),
             },
         )
 
     # execute query
-    a_defs = k_sparql.fetch(sq_template_def)
+    a_defs = k_sparql.fetch(sq_template_defs)
 
     # build args from vars
-    h_args = collections.defaultdict(list)
     for g_row in a_defs:
+        h_args = h_template_defs[g_row['view_template_def']['value']]
         si_key = g_row['param_key']['value']
         s_value = g_row['param_value']['value']
 
@@ -175,6 +348,23 @@ def _render_table(kv_table: Table, si_page_src: str):
         else:
             h_args[si_key] = s_value
 
+    return h_template_defs
+
+
+def _template_args(g_directive, si_page_src: str, h_template_defs: dict, h_registry: dict):
+    p_ref = g_directive['view_template_def']['value']
+    si_ref_space = g_directive['directive_page_space']['value']
+
+    if si_space != si_ref_space:
+        raise Exception(f'Cross reference in #{si_page_src} invocates template definition in another space ["{si_space}" != "{si_ref_space}"]: <{p_ref}>')
+
+    # template definition was not resolved up front; resolve it now
+    if p_ref not in h_template_defs:
+        h_template_defs.update(_load_template_defs([p_ref]))
+
+    # copy args so that views sharing a template do not share state
+    h_args = collections.defaultdict(list, h_template_defs[p_ref])
+
     # ref viewpoint method id
     si_method = h_args['templateType']
 
@@ -183,14 +373,38 @@ def _render_table(kv_table: Table, si_page_src: str):
         raise Exception(f'The required "templateType" field is missing from the view template table defined at <{p_ref}>')
 
     # method does not exist in registry
-    if si_method not in method_registry:
+    if si_method not in h_registry:
         raise Exception(f'"{si_method}" was not found in the method registry')
 
-    # evaluate viewpoint method
-    k_result = method_registry[si_method](k_iqs, h_args)
+    return si_method, h_args
+
 
-    # insert table as xref view and serialize XHTML document
-    return kv_table.render(k_result)
+def _evaluate_table(g_directive, si_page_src: str, h_template_defs: dict):
+    si_method, h_args = _template_args(g_directive, si_page_src, h_template_defs, method_registry)
+
+    # evaluate viewpoint method, reusing the result of any identical view
+    return y_view_cache.get_or_compute(
+        (si_method, normalize_args(h_args)),
+        lambda: method_registry[si_method](k_iqs, h_args),
+    )
+
+
+def _evaluate_diagram(g_directive, si_page_src: str, h_template_defs: dict):
+    h_registry = view_templates.diagram_registry
+    si_method, h_args = _template_args(g_directive, si_page_src, h_template_defs, h_registry)
+
+    # evaluate the graph, reusing the result of any identical view
+    k_graph = y_view_cache.get_or_compute(
+        (si_method, normalize_args(h_args)),
+        lambda: h_registry[si_method](k_iqs, h_args),
+    )
+
+    # lay it out, reusing the layout of an identical graph
+    n_max_nodes = g_args.diagram_max_nodes or None
+    return y_layout_cache.get_or_compute(
+        (k_graph.digest(), n_max_nodes),
+        lambda: layout(k_graph, max_nodes=n_max_nodes),
+    )
 
 
 def _insert_tooltip(g_tooltip, s_content):
@@ -225,7 +439,10 @@ def _insert_tooltip(g_tooltip, s_content):
 
 
 
-def _render_directive(g_directive, sx_document: str, si_page_src: str):
+def _evaluate_directive(g_directive, si_page_src: str, h_template_defs: dict) -> DirectiveRender:
+    si_macro = None
+    f_promote = None
+
     # explicit command is provided in an annotated span
     if 'directive_command' in g_directive:
         # ref command id
@@ -244,8 +461,8 @@ def _render_directive(g_directive, sx_document: str, si_page_src: str):
         # lookup view class
         dc_view = H_DIRECTIVE_PAGE_TITLE_PREFIXES[si_prefix]
 
-        # promote inferred directive to command
-        (si_macro, sx_document) = _promote_directive_page_title(g_directive, sx_document)
+        # inferred directive is promoted to command in place when rendering
+        f_promote = _promote_directive_page_title
     # directive link href
     elif 'directive_link_href_prefix' in g_directive:
         # ref link href prefix
@@ -254,46 +471,56 @@ def _render_directive(g_directive, sx_document: str, si_page_src: str):
         # lookup view class
         dc_view = H_DIRECTIVE_LINK_HREF_PREFIXES[si_prefix]
 
-        # promote inferred directive to command
-        (si_macro, sx_document) = _promote_directive_link(g_directive, sx_document)
+        # inferred directive is promoted to command in place when rendering
+        f_promote = _promote_directive_link
     # none
     else:
         raise Exception(f'A directive was matched in the SPARQL query that is not routable to a view:\n{pformat(g_directive)}')
 
-    # instantiate view
-    k_view = dc_view(
-        document=sx_document,
-        directive_macro_id=si_macro,
-        extras=g_directive,
+    # diagram
+    if issubclass(dc_view, Diagram):
+        a_render_args = (_evaluate_diagram(g_directive, si_page_src, h_template_defs),)
+    # table
+    elif issubclass(dc_view, Table):
+        a_render_args = (_evaluate_table(g_directive, si_page_src, h_template_defs),)
+    elif issubclass(dc_view, Tooltip):
+        a_render_args = _render_tooltip(g_directive, si_page_src)
+    else:
+        raise Exception(f'No route defined for view class {dc_view}')
+
+    return DirectiveRender(
+        view=dc_view,
+        directive=g_directive,
+        macro_id=si_macro,
+        promote=f_promote,
+        render_args=a_render_args,
     )
 
-    # clear renders
-    k_view.clear()
 
-    # table
-    if isinstance(k_view, Table):
-        return _render_table(k_view, si_page_src)
-    elif isinstance(k_view, Tooltip):
-        return _render_tooltip(k_view, si_page_src)
-    else:
-        raise Exception(f'No route defined for view instance {k_view}')
 
+# number of page IDs enumerated per request
+N_PAGE_ID_LIMIT = 10000
 
 
-def _render_all():
+def _directives_query(a_source_pages: list) -> str:
+    '''
+    Build the directives query, optionally restricted to the given source pages
+
+    :param a_source_pages: IDs of the pages to discover directives on; empty for the whole space
+    '''
     # source page injection
     h_injection_source_page = {
         # when pages list is not empty, populate source values
         'SOURCE_PAGE': _normalize_indent(f'''
             values ?source_page_id {{
-                {_inject(_sparql_literal, a_pages)}
+                {_inject(_sparql_literal, a_source_pages)}
             }}
-        ''', '    ') if len(a_pages) else ''
+        ''', '    ') if len(a_source_pages) else ''
     }
 
     # load the SPARQL query and process vars/injections
     with open(path.join(PD_ASSET, 'directives.rq'), 'r') as d:
-        sq_directives = opl.Sparql.load(
+        return opl.Sparql.load(
             template=d.read(),
             variables={
                 'SPACE_GRAPH': p_space,
@@ -309,27 +536,340 @@ def _render_all():
             },
         )
 
-    print(sq_directives)
 
-    # group by page ID
-    h_pages = collections.defaultdict(list)
-    for g_directive in k_sparql.fetch(sq_directives):
-        h_pages[g_directive['source_page_id']['value']].append(g_directive)
+def _fetch_directives(a_source_pages: list) -> list:
+    '''
+    Discover the directives on the given source pages, from the space graph dump if one was
+    given or else from the SPARQL endpoint
+
+    :param a_source_pages: IDs of the pages to discover directives on; empty for the whole space
+    :return: list of directive rows
+    '''
+    # offline; evaluate the directives query over the indexed dump
+    if k_space is not None:
+        return k_space.directives(
+            commands=H_DIRECTIVE_COMMANDS.keys(),
+            page_title_prefixes=H_DIRECTIVE_PAGE_TITLE_PREFIXES.keys(),
+            link_href_prefixes=H_DIRECTIVE_LINK_HREF_PREFIXES.keys(),
+            spaces={
+                si_space: p_space,
+            },
+            source_pages=a_source_pages or None,
+        )
+
+    return k_sparql.fetch(_directives_query(a_source_pages))
+
+
+def _enumerate_pages() -> list:
+    '''
+    List the IDs of all pages in the space, a bounded number per request
+    '''
+    with open(path.join(PD_ASSET, 'page-ids.rq'), 'r') as d:
+        sx_template = d.read()
+
+    a_page_ids = []
+    while True:
+        sq_page_ids = opl.Sparql.load(
+            template=sx_template,
+            variables={
+                'SPACE_GRAPH': p_space,
+            },
+            injections={
+                'PAGINATION': f'limit {N_PAGE_ID_LIMIT} offset {len(a_page_ids)}',
+            },
+        )
+
+        a_rows = k_sparql.fetch(sq_page_ids)
+        a_page_ids.extend(g_row['source_page_id']['value'] for g_row in a_rows)
+
+        # last page of results
+        if len(a_rows) < N_PAGE_ID_LIMIT:
+            return a_page_ids
+
+
+def _shard_pages(a_failed: list):
+    '''
+    Discover directives over chunks of pages, several chunks at a time, and yield each
+    page's directives once the chunk containing it has completed. A chunk that fails
+    transiently (e.g., a query timeout) is split in halves and retried, down to single
+    pages; pages that still fail are reported and discovery continues with the others.
 
-    # each page
-    for si_page_src in h_pages:
-        # create page handle
-        k_page = k_confluence.page(si_page_src)
+    :param a_failed: list to which the IDs of pages whose directives could not be discovered are appended
+    :return: iterator of (page ID, directives) pairs
+    '''
+    a_source_pages = a_pages or _enumerate_pages()
+    n_chunk = g_args.discovery_chunk_size
+    a_chunks = [a_source_pages[i_chunk:i_chunk+n_chunk] for i_chunk in range(0, len(a_source_pages), n_chunk)]
 
-        # load page contents into memory
-        s_content = k_page.get_content()
+    print(f'Discovering directives on {len(a_source_pages)} page(s) in {len(a_chunks)} chunk(s) of up to {n_chunk}')
+
+    with ThreadPoolExecutor(max_workers=max(1, g_args.discovery_jobs)) as y_pool:
+        h_futures = {y_pool.submit(_fetch_directives, a_chunk): a_chunk for a_chunk in a_chunks}
+
+        while h_futures:
+            as_done, _ = wait(h_futures, return_when=FIRST_COMPLETED)
+            for y_future in as_done:
+                a_chunk = h_futures.pop(y_future)
+
+                try:
+                    a_directives = y_future.result()
+                except Exception as e_chunk:
+                    n_status = _http_status(e_chunk)
+
+                    # transient failure of several pages; retry each half on its own
+                    if len(a_chunk) > 1 and (n_status is None or _is_retryable(n_status)):
+                        print(f'Failed to discover directives on {len(a_chunk)} page(s); retrying in halves: {", ".join(a_chunk)}\n{traceback.format_exc()}', file=sys.stderr)
+                        i_mid = len(a_chunk)//2
+                        for a_half in (a_chunk[:i_mid], a_chunk[i_mid:]):
+                            h_futures[y_pool.submit(_fetch_directives, a_half)] = a_half
+                    # give up on these pages
+                    else:
+                        print(f'Failed to discover directives on {len(a_chunk)} page(s): {", ".join(a_chunk)}\n{traceback.format_exc()}', file=sys.stderr)
+                        a_failed.extend(a_chunk)
+                    continue
+
+                # each chunk holds every directive of its pages
+                h_chunk = collections.defaultdict(list)
+                for g_directive in a_directives:
+                    h_chunk[g_directive['source_page_id']['value']].append(g_directive)
+
+                yield from h_chunk.items()
+
+
+def _render_all():
+    # pages whose directives could not be discovered
+    a_undiscovered = []
+
+    # sharded; pages become available as their chunks complete
+    if g_args.discovery_chunk_size > 0:
+        di_groups = _shard_pages(a_undiscovered)
+    # offline; the dump is evaluated at once, in page order
+    elif k_space is not None:
+        di_groups = _group_pages(sorted(_fetch_directives(a_pages), key=lambda g_directive: g_directive['source_page_id']['value']))
+    # one query over the pages given, or the whole space
+    else:
+        sq_directives = _directives_query(a_pages)
+        print(sq_directives)
+
+        di_groups = _group_pages(k_sparql.stream(sq_directives+'\norder by ?source_page_id')) if g_args.stream_discovery else None
+
+    # streaming; pages are handed to the workers while discovery is still running
+    if g_args.stream_discovery:
+        h_template_defs = {}
+        di_pages = di_groups
+    # otherwise, wait for all directives and prepare everything up front
+    else:
+        h_pages = collections.defaultdict(list)
+
+        # merge chunks
+        if di_groups is not None:
+            for si_page_src, a_directives in di_groups:
+                h_pages[si_page_src].extend(a_directives)
+        # group by page ID
+        else:
+            for g_directive in _fetch_directives(a_pages):
+                h_pages[g_directive['source_page_id']['value']].append(g_directive)
+
+        # resolve every distinct view template definition referenced by the directives in one query
+        h_template_defs = _load_template_defs(sorted({
+            p_ref for a_directives in h_pages.values() for p_ref in _template_refs(a_directives)
+        }))
+
+        # incremental; look up every page's version in bulk so that unchanged pages are not fetched
+        if k_state is not None:
+            k_pages.fetch_versions(h_pages)
+            a_prefetch = [si_page_src for si_page_src in h_pages if k_state.get(si_page_src) != _page_state(si_page_src, h_pages[si_page_src], h_template_defs)]
+        else:
+            a_prefetch = list(h_pages)
+
+        # fetch page contents in batches ahead of the workers
+        k_pages.prefetch(a_prefetch)
+
+        di_pages = h_pages.items()
+
+    # streaming without incremental mode; prefetch page contents as pages arrive
+    b_prefetch_stream = g_args.stream_discovery and k_state is None
+
+    # render pages concurrently; each page is handled start to finish by a single worker
+    with ThreadPoolExecutor(max_workers=max(1, g_args.jobs)) as y_pool:
+        a_futures = []
+        for si_page_src, a_directives in di_pages:
+            # update reverse index of view template => dependent pages
+            if k_store is not None:
+                k_store.index_dependents(si_page_src, {
+                    (g_directive['view_template_def']['value'], g_directive['directive_page_title']['value'])
+                        for g_directive in a_directives
+                        if 'view_template_def' in g_directive
+                })
+
+            # resolve view template definitions not seen on previous pages, in one query
+            a_missing = sorted(_template_refs(a_directives)-h_template_defs.keys())
+            if a_missing:
+                h_template_defs.update(_load_template_defs(a_missing))
+
+            # queue page contents for prefetching; joins the batch still waiting, if any
+            if b_prefetch_stream:
+                k_pages.prefetch([si_page_src])
+
+            a_futures.append((si_page_src, y_pool.submit(_process_page, si_page_src, a_directives, h_template_defs)))
+
+        nl_pages = len(a_futures)
+
+        # pages left without any directive no longer depend on a view template; keep those that could not be discovered
+        if k_store is not None:
+            k_store.prune_dependents([si_page_src for si_page_src, _ in a_futures]+a_undiscovered, a_pages or None)
+
+        # collect outcomes in page order; a failed page does not affect the others
+        a_failures = []
+        h_outcomes = collections.Counter()
+        for si_page_src, y_future in a_futures:
+            try:
+                h_outcomes[y_future.result()] += 1
+            except Exception:
+                a_failures.append(si_page_src)
+                print(f'Failed to render page #{si_page_src}:\n{traceback.format_exc()}', file=sys.stderr)
+
+    # finish pending updates
+    k_updates.close()
+    k_pages.close()
+
+    print(f'Fetched {k_pages.prefetched} page(s) with {k_pages.requests} batched request(s) and {k_pages.direct} page(s) individually; {k_updates.writes} update(s) written')
+
+    # report connection reuse
+    for s_name, g_stats in y_http.stats().items():
+        print(f'{s_name}: {g_stats.requests} request(s) over {g_stats.connections} connection(s); {g_stats.reused} reused')
+
+    # report retried requests
+    for y_backend in (y_backend_incquery, y_backend_confluence, y_backend_sparql):
+        if y_backend.retries:
+            print(f'{y_backend.name}: retried {y_backend.retries} of {y_backend.requests} request(s); ended at {y_backend.concurrency} of {y_backend.max_concurrency} simultaneous request(s)')
+
+    # report queries answered from the snapshot
+    if k_snapshot is not None:
+        h_sizes = k_snapshot.sizes
+        print(f'Answered {k_snapshot.hits} IncQuery quer(ies) from a snapshot of {sum(h_sizes.values())} row(s) ({", ".join(f"{si_pattern}: {nl_rows}" for si_pattern, nl_rows in h_sizes.items())}); {k_snapshot.fallbacks} sent to the server')
+
+    # report avoided work
+    if k_state is not None:
+        print(f'{h_outcomes["skipped"]} of {nl_pages} page(s) skipped; unchanged since the last run')
+    print(f'{h_outcomes["unchanged"]} of {nl_pages} page(s) rendered unchanged; skipped {h_outcomes["unchanged"]} upload(s)')
+
+    # report failures
+    a_errors = []
+    if a_undiscovered:
+        a_errors.append(f'directives could not be discovered on {len(a_undiscovered)} page(s): {", ".join(a_undiscovered)}')
+    if a_failures:
+        a_errors.append(f'{len(a_failures)} of {nl_pages} page(s) failed to render: {", ".join(a_failures)}')
+    if a_errors:
+        raise Exception('; '.join(a_errors))
+
+
+# IRIs of the view templates referenced by a page's directives
+def _template_refs(a_directives: list) -> set:
+    return {g_directive['view_template_def']['value'] for g_directive in a_directives if 'view_template_def' in g_directive}
+
+
+def _group_pages(di_directives):
+    '''
+    Group directive rows ordered by page and yield each page's directives as soon as
+    the first row of the next page (or the end of the rows) arrives
+
+    :param di_directives: iterable of directive rows, ordered by source page ID
+    :return: iterator of (page ID, directives) pairs
+    '''
+    si_page_group = None
+    a_group = []
+
+    for g_directive in di_directives:
+        si_page_src = g_directive['source_page_id']['value']
+
+        # next page; the previous one is complete
+        if si_page_src != si_page_group and a_group:
+            yield (si_page_group, a_group)
+            a_group = []
+
+        si_page_group = si_page_src
+        a_group.append(g_directive)
+
+    # last page
+    if a_group:
+        yield (si_page_group, a_group)
+
+
+# fingerprint what a page would be rendered from
+def _page_state(si_page_src: str, a_directives: list, h_template_defs: dict) -> PageState:
+    return PageState(
+        version=k_pages.version(si_page_src),
+        templates=_digest({
+            p_ref: h_template_defs.get(p_ref)
+                for p_ref in sorted(_template_refs(a_directives))
+        }),
+        inputs=_digest([
+            __version__,
+            k_iqs._s_compartment,
+            a_directives,
+        ]),
+    )
+
+
+def _process_page(si_page_src: str, a_directives: list, h_template_defs: dict) -> str:
+    '''
+    Render a page unless incremental mode finds it unchanged since the last run
+
+    :return: 'skipped' if not rendered, 'unchanged' if rendered without changes, 'updated' if uploaded
+    '''
+    # not incremental
+    if k_state is None:
+        return 'updated' if _render_page(si_page_src, a_directives, h_template_defs) is not None else 'unchanged'
+
+    # fingerprint what the page would be rendered from
+    g_state = _page_state(si_page_src, a_directives, h_template_defs)
+
+    # nothing changed since the last run
+    if k_state.get(si_page_src) == g_state:
+        return 'skipped'
+
+    # render
+    z_response = _render_page(si_page_src, a_directives, h_template_defs)
+
+    # page was updated; record the version just written
+    if z_response is not None:
+        try:
+            n_version = z_response['version']['number']
+        except (TypeError, KeyError):
+            n_version = k_pages.version(si_page_src)
+
+        g_state = g_state._replace(version=n_version)
+
+    k_state.put(si_page_src, g_state)
+
+    return 'updated' if z_response is not None else 'unchanged'
+
+
+def _render_page(si_page_src: str, a_directives: list, h_template_defs: dict):
+    '''
+    Render all directives on a page and upload the result if it changed
+
+    :return: the response from updating the page, or None if the page was unchanged
+    '''
+    # take the prefetched page contents
+    g_page = k_pages.get(si_page_src)
+
+    # evaluate each directive's view, in document order
+    a_renders = [_evaluate_directive(g_directive, si_page_src, h_template_defs) for g_directive in a_directives]
+
+    # parse, apply directives and serialize, in a worker process if enabled
+    if y_render_pool is not None:
+        sx_render = y_render_pool.submit(render_page, g_page.content, a_renders).result()
+    else:
+        sx_render = render_page(g_page.content, a_renders)
 
-        # each directive
-        for g_directive in h_pages[si_page_src]:
-            s_content = _render_directive(g_directive, s_content, si_page_src)
+    # rendered content is identical to what is on the page; skip the upload
+    if sx_render is None:
+        return None
 
-        # update page content
-        k_page.update_content(s_content)
+    # queue the update against the version that was rendered, and wait for it
+    return k_updates.submit(g_page, sx_render).result() or {}
 
 
 _render_all()
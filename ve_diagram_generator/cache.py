@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+import collections
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+
+# approximate the memory footprint of a result in bytes
+def _sizeof(z_value: Any) -> int:
+    # query results table; measure its rows
+    if hasattr(z_value, 'rows'):
+        return _sizeof(z_value.rows)
+    # mapping
+    elif isinstance(z_value, dict):
+        return sys.getsizeof(z_value) + sum(_sizeof(z_key) + _sizeof(z_item) for z_key, z_item in z_value.items())
+    # sequence
+    elif isinstance(z_value, (list, tuple, set)):
+        return sys.getsizeof(z_value) + sum(_sizeof(z_item) for z_item in z_value)
+    # scalar
+    else:
+        return sys.getsizeof(z_value)
+
+
+def normalize_args(h_args: Dict[str, Any]) -> Tuple:
+    '''
+    Produce a hashable, order-independent key from a viewpoint method's args dict. Values
+    are kept exactly as the method sees them, so only args that evaluate identically share a key.
+
+    :param h_args: the args dict
+    '''
+    a_items = []
+    for si_key, z_value in h_args.items():
+        # multi-valued arg
+        if isinstance(z_value, list):
+            z_value = tuple(z_value)
+
+        a_items.append((si_key, z_value))
+
+    return tuple(sorted(a_items))
+
+
+class ResultCache:
+    '''
+    Thread-safe LRU cache for expensive evaluations. Concurrent requests for the
+    same key share one in-flight evaluation rather than each performing it.
+
+    :param max_entries: maximum number of results to keep; 0 disables caching
+        (concurrent requests are still de-duplicated)
+    :param max_bytes: approximate upper bound on the memory held by cached results
+    '''
+    def __init__(self, max_entries: int=256, max_bytes: int=256*1024*1024):
+        self._n_max_entries = max_entries
+        self._nb_max = max_bytes
+        self._nb_used = 0
+        self._h_entries = collections.OrderedDict()
+        self._h_pending: Dict[Hashable, Future] = {}
+        self._y_lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._h_entries)
+
+    @property
+    def bytes_used(self) -> int:
+        return self._nb_used
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        '''
+        Return the cached result for `key`, evaluating `compute` if it is not cached yet
+
+        :param key: hashable cache key
+        :param compute: zero-argument callable that produces the result
+        '''
+        b_owner = False
+
+        with self._y_lock:
+            # cached; mark as most recently used
+            if key in self._h_entries:
+                self.hits += 1
+                self._h_entries.move_to_end(key)
+                return self._h_entries[key][0]
+
+            # already being evaluated by another thread; wait for it
+            y_pending = self._h_pending.get(key)
+            if y_pending is not None:
+                self.hits += 1
+            # this thread evaluates it
+            else:
+                self.misses += 1
+                y_pending = self._h_pending[key] = Future()
+                b_owner = True
+
+        # wait for the owner to finish
+        if not b_owner:
+            return y_pending.result()
+
+        # evaluate
+        try:
+            z_result = compute()
+        except BaseException as e_compute:
+            with self._y_lock:
+                del self._h_pending[key]
+            y_pending.set_exception(e_compute)
+            raise
+
+        # store result
+        with self._y_lock:
+            del self._h_pending[key]
+            self._store(key, z_result)
+
+        y_pending.set_result(z_result)
+
+        return z_result
+
+    # insert a result and evict least recently used entries beyond the bounds; lock must be held
+    def _store(self, z_key: Hashable, z_result: Any):
+        if self._n_max_entries <= 0:
+            return
+
+        nb_result = _sizeof(z_result)
+
+        # result alone would exceed the memory bound; do not cache it
+        if nb_result > self._nb_max:
+            return
+
+        self._h_entries[z_key] = (z_result, nb_result)
+        self._nb_used += nb_result
+
+        # evict
+        while len(self._h_entries) > self._n_max_entries or self._nb_used > self._nb_max:
+            (_, (_, nb_evicted)) = self._h_entries.popitem(last=False)
+            self._nb_used -= nb_evicted
+
+
+class DiskCache:
+    '''
+    Persistent cache of query results stored in an SQLite database. Entries expire
+    after a time-to-live and the least recently used entries are evicted once the
+    total size of stored results exceeds a bound.
+
+    :param directory: directory to keep the cache database in
+    :param ttl: seconds after which an entry expires
+    :param max_bytes: upper bound on the total (compressed) size of stored results
+    '''
+    def __init__(self, directory: str, ttl: float=24*60*60, max_bytes: int=512*1024*1024):
+        os.makedirs(directory, exist_ok=True)
+
+        self._p_file = os.path.join(directory, 'results.sqlite')
+        self._x_ttl = ttl
+        self._nb_max = max_bytes
+        self._y_lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+
+        # open database; access is serialized by the lock
+        self._y_db = sqlite3.connect(self._p_file, check_same_thread=False, isolation_level=None)
+        self._y_db.executescript('''
+            pragma journal_mode=wal;
+            create table if not exists entries (
+                key text primary key,
+                created real not null,
+                accessed real not null,
+                size integer not null,
+                value blob not null
+            );
+            create index if not exists entries_accessed on entries(accessed);
+        ''')
+
+        # drop expired entries
+        with self._y_lock:
+            self._y_db.execute('delete from entries where created < ?', (time.time() - self._x_ttl,))
+
+    @property
+    def path(self) -> str:
+        return self._p_file
+
+    def get(self, key: str) -> Any:
+        '''
+        Return the stored value for `key`, or None if absent or expired
+
+        :param key: the cache key
+        '''
+        x_now = time.time()
+
+        with self._y_lock:
+            a_row = self._y_db.execute('select created, value from entries where key = ?', (key,)).fetchone()
+
+            # not found
+            if a_row is None:
+                self.misses += 1
+                return None
+
+            # expired
+            if a_row[0] < x_now - self._x_ttl:
+                self._y_db.execute('delete from entries where key = ?', (key,))
+                self.misses += 1
+                return None
+
+            # mark as recently used
+            self._y_db.execute('update entries set accessed = ? where key = ?', (x_now, key))
+            self.hits += 1
+
+        return json.loads(zlib.decompress(a_row[1]))
+
+    def put(self, key: str, value: Any):
+        '''
+        Store a JSON-serializable value under `key`, evicting least recently used entries as needed
+
+        :param key: the cache key
+        :param value: the value to store
+        '''
+        xb_value = zlib.compress(json.dumps(value).encode())
+        nb_value = len(xb_value)
+
+        # value alone exceeds the bound
+        if nb_value > self._nb_max:
+            return
+
+        x_now = time.time()
+
+        with self._y_lock:
+            self._y_db.execute('insert or replace into entries (key, created, accessed, size, value) values (?, ?, ?, ?, ?)', (key, x_now, x_now, nb_value, xb_value))
+
+            # evict least recently used entries beyond the size bound
+            nb_total = self._y_db.execute('select coalesce(sum(size), 0) from entries').fetchone()[0]
+            if nb_total > self._nb_max:
+                for (si_key, nb_entry) in self._y_db.execute('select key, size from entries order by accessed asc').fetchall():
+                    self._y_db.execute('delete from entries where key = ?', (si_key,))
+                    nb_total -= nb_entry
+                    if nb_total <= self._nb_max:
+                        break
+
+    def close(self):
+        with self._y_lock:
+            self._y_db.close()
+
+
+# stable digest of a JSON-serializable value
+def _digest(z_value: Any) -> str:
+    return hashlib.sha256(json.dumps(z_value, sort_keys=True).encode()).hexdigest()
+
+
+class CachedIncQuery:
+    '''
+    Wraps an `opl.IncQueryProject` so that query results are read from and written
+    to a DiskCache. Entries are keyed by the model compartment, the pattern name,
+    a hash of the pattern definitions in effect and the bindings.
+
+    :param incquery: the IncQuery client to wrap
+    :param cache: the DiskCache to use
+    '''
+    def __init__(self, incquery, cache: DiskCache):
+        self._k_incquery = incquery
+        self._k_cache = cache
+
+    def __getattr__(self, si_attr: str):
+        return getattr(self._k_incquery, si_attr)
+
+    def execute(self, name: str, patterns: Dict[str, str]={}, bindings: Dict[str, Any]={}, w_url_provider=None) -> List[Dict[str, Any]]:
+        k_incquery = self._k_incquery
+
+        # results with converted elements cannot be reproduced from the cache
+        if w_url_provider is not None:
+            return k_incquery.execute(name, patterns=patterns, bindings=bindings, w_url_provider=w_url_provider)
+
+        si_key = _digest([
+            k_incquery._s_compartment,
+            name,
+            _digest({**k_incquery._h_patterns, **patterns}),
+            bindings,
+        ])
+
+        # cache hit
+        a_rows = self._k_cache.get(si_key)
+        if a_rows is not None:
+            return a_rows
+
+        # execute and store
+        a_rows = k_incquery.execute(name, patterns=patterns, bindings=bindings)
+        self._k_cache.put(si_key, a_rows)
+
+        return a_rows
+
+    def extend_row(self, row: Dict[str, Any], query_field) -> List[Any]:
+        k_field = query_field
+
+        # apply field join to its bindings
+        h_bindings = {**k_field.bindings, **k_field.join(row)}
+
+        # execute query through the cache
+        a_rows = self.execute(name=k_field.query, bindings=h_bindings)
+
+        # map thru select function
+        return list(map(k_field.select, a_rows))
@@ -0,0 +1,320 @@
+import bisect
+import threading
+import collections
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+# virtual pattern answered by the hierarchy; every (transitive) child of an artifact
+#   (artifactId: java String, childId: java String, childName: String, depth: int)
+#   bind `maxDepth` to limit how many levels below the artifact are included
+SI_DESCENDANTS = 'artifactDescendants'
+
+
+# compressed sparse rows: for each node, the range of `targets` (and of `edges`) holding its neighbors
+def _adjacency(nl_nodes: int, a_sources: array, a_targets: array) -> Tuple[array, array, array]:
+    a_counts = [0]*(nl_nodes+1)
+    for i_source in a_sources:
+        a_counts[i_source+1] += 1
+
+    # offsets into the neighbor arrays
+    for i_node in range(nl_nodes):
+        a_counts[i_node+1] += a_counts[i_node]
+    a_offsets = array('i', a_counts)
+
+    # fill neighbors in input order
+    a_next = list(a_counts[:-1])
+    a_neighbors = array('i', bytes(4*len(a_sources)))
+    a_edges = array('i', bytes(4*len(a_sources)))
+    for i_edge, (i_source, i_target) in enumerate(zip(a_sources, a_targets)):
+        i_slot = a_next[i_source]
+        a_neighbors[i_slot] = i_target
+        a_edges[i_slot] = i_edge
+        a_next[i_source] += 1
+
+    return a_offsets, a_neighbors, a_edges
+
+
+class RequirementHierarchy:
+    '''
+    Wraps an `opl.IncQueryProject` (or a wrapper of one) and answers `artifactChildren`,
+    and the virtual `artifactDescendants` pattern, from a "Child Of" hierarchy loaded with
+    a single query of `artifactChildren` on first use. Artifacts are numbered and the
+    parent and child adjacency is held in integer arrays; the transitive closure below an
+    artifact is computed when first needed and cached. Any other query is forwarded to
+    the wrapped client.
+
+    :param incquery: the IncQuery client to wrap
+    :param max_cached: maximum number of artifacts whose closure is kept
+    '''
+    def __init__(self, incquery, max_cached: int=4096):
+        self._k_incquery = incquery
+        self._n_max_cached = max_cached
+        self._b_loaded = False
+        self._y_lock = threading.Lock()
+
+        # artifact ID <=> node number
+        self._h_nodes: Dict[str, int] = {}
+        self._a_ids: List[str] = []
+        self._a_names: List[Optional[str]] = []
+
+        # result rows of `artifactChildren`, by edge number
+        self._a_rows: List[Dict[str, Any]] = []
+
+        # cached closures; node => (descendants in breadth-first order, their depths)
+        self._h_closures = collections.OrderedDict()
+
+    def __getattr__(self, si_attr: str):
+        return getattr(self._k_incquery, si_attr)
+
+    def is_local(self, name: str) -> bool:
+        '''
+        Whether queries against the given pattern are answered from memory; views look up
+        such fields row by row rather than joining the whole pattern
+
+        :param name: the pattern name
+        '''
+        if name in ('artifactChildren', SI_DESCENDANTS):
+            return True
+
+        f_is_local = getattr(self._k_incquery, 'is_local', None)
+        return f_is_local is not None and f_is_local(name)
+
+    # node number of an artifact, adding it if new; lock must be held
+    def _node(self, si_artifact: str) -> int:
+        i_node = self._h_nodes.get(si_artifact)
+        if i_node is None:
+            i_node = self._h_nodes[si_artifact] = len(self._a_ids)
+            self._a_ids.append(si_artifact)
+            self._a_names.append(None)
+        return i_node
+
+    def _load(self):
+        with self._y_lock:
+            if self._b_loaded:
+                return
+
+            a_rows = self._k_incquery.execute('artifactChildren')
+
+            a_parents = array('i')
+            a_children = array('i')
+            for g_row in a_rows:
+                i_child = self._node(g_row['childId'])
+                self._a_names[i_child] = g_row.get('childName')
+                a_parents.append(self._node(g_row['artifactId']))
+                a_children.append(i_child)
+
+            nl_nodes = len(self._a_ids)
+            self._a_rows = a_rows
+            (self._a_child_offsets, self._a_child_nodes, self._a_child_edges) = _adjacency(nl_nodes, a_parents, a_children)
+            (self._a_parent_offsets, self._a_parent_nodes, _) = _adjacency(nl_nodes, a_children, a_parents)
+
+            self._b_loaded = True
+
+    def load(self):
+        '''
+        Load the hierarchy now rather than on the first query
+        '''
+        self._load()
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._a_ids)
+
+    def _walk(self, i_root: int, a_offsets: array, a_neighbors: array, n_max_depth: Optional[int]) -> Tuple[array, array]:
+        '''
+        Breadth-first walk from a node, each reachable node once at its shortest depth
+        '''
+        a_nodes = array('i')
+        a_depths = array('i')
+        as_seen = {i_root}
+
+        a_level = [i_root]
+        n_depth = 0
+        while a_level and (n_max_depth is None or n_depth < n_max_depth):
+            n_depth += 1
+
+            a_next = []
+            for i_node in a_level:
+                for i_slot in range(a_offsets[i_node], a_offsets[i_node+1]):
+                    i_neighbor = a_neighbors[i_slot]
+                    if i_neighbor not in as_seen:
+                        as_seen.add(i_neighbor)
+                        a_nodes.append(i_neighbor)
+                        a_depths.append(n_depth)
+                        a_next.append(i_neighbor)
+
+            a_level = a_next
+
+        return a_nodes, a_depths
+
+    def _closure(self, i_node: int) -> Tuple[array, array]:
+        with self._y_lock:
+            g_closure = self._h_closures.get(i_node)
+            if g_closure is not None:
+                self._h_closures.move_to_end(i_node)
+                return g_closure
+
+        g_closure = self._walk(i_node, self._a_child_offsets, self._a_child_nodes, None)
+
+        with self._y_lock:
+            if self._n_max_cached > 0:
+                self._h_closures[i_node] = g_closure
+                while len(self._h_closures) > self._n_max_cached:
+                    self._h_closures.popitem(last=False)
+
+        return g_closure
+
+    def _descendant_nodes(self, i_node: int, n_max_depth: Optional[int]) -> Tuple[array, array]:
+        # a closure already computed covers any depth
+        with self._y_lock:
+            g_closure = self._h_closures.get(i_node)
+
+        # unlimited; compute and cache the closure
+        if g_closure is None and n_max_depth is None:
+            g_closure = self._closure(i_node)
+
+        # limited and not cached; walk only as deep as needed
+        if g_closure is None:
+            return self._walk(i_node, self._a_child_offsets, self._a_child_nodes, n_max_depth)
+
+        (a_nodes, a_depths) = g_closure
+        if n_max_depth is None:
+            return g_closure
+
+        # breadth-first order; nodes within the depth form a prefix
+        i_end = bisect.bisect_right(a_depths, n_max_depth)
+        return a_nodes[:i_end], a_depths[:i_end]
+
+    def children(self, artifact_id: str) -> List[str]:
+        '''
+        IDs of the direct children of an artifact
+
+        :param artifact_id: the parent's artifact ID
+        '''
+        self._load()
+        i_node = self._h_nodes.get(artifact_id)
+        if i_node is None:
+            return []
+        return [self._a_ids[self._a_child_nodes[i_slot]] for i_slot in range(self._a_child_offsets[i_node], self._a_child_offsets[i_node+1])]
+
+    def parents(self, artifact_id: str) -> List[str]:
+        '''
+        IDs of the artifacts an artifact is a child of
+
+        :param artifact_id: the child's artifact ID
+        '''
+        self._load()
+        i_node = self._h_nodes.get(artifact_id)
+        if i_node is None:
+            return []
+        return [self._a_ids[self._a_parent_nodes[i_slot]] for i_slot in range(self._a_parent_offsets[i_node], self._a_parent_offsets[i_node+1])]
+
+    def descendants(self, artifact_id: str, max_depth: int=None) -> List[Tuple[str, int]]:
+        '''
+        Artifacts below an artifact, nearest first; an artifact reachable along several paths
+        appears once, at its shortest depth
+
+        :param artifact_id: the ancestor's artifact ID
+        :param max_depth: number of levels to include; None for all
+        :return: list of (artifact ID, depth) pairs, where direct children have depth 1
+        '''
+        self._load()
+        i_node = self._h_nodes.get(artifact_id)
+        if i_node is None:
+            return []
+
+        (a_nodes, a_depths) = self._descendant_nodes(i_node, max_depth)
+        return [(self._a_ids[i_descendant], n_depth) for i_descendant, n_depth in zip(a_nodes, a_depths)]
+
+    def ancestors(self, artifact_id: str, max_depth: int=None) -> List[Tuple[str, int]]:
+        '''
+        Artifacts above an artifact, nearest first
+
+        :param artifact_id: the descendant's artifact ID
+        :param max_depth: number of levels to include; None for all
+        :return: list of (artifact ID, depth) pairs, where direct parents have depth 1
+        '''
+        self._load()
+        i_node = self._h_nodes.get(artifact_id)
+        if i_node is None:
+            return []
+
+        (a_nodes, a_depths) = self._walk(i_node, self._a_parent_offsets, self._a_parent_nodes, max_depth)
+        return [(self._a_ids[i_ancestor], n_depth) for i_ancestor, n_depth in zip(a_nodes, a_depths)]
+
+    def name(self, artifact_id: str) -> Optional[str]:
+        '''
+        Name of an artifact, if it is the child of any other
+
+        :param artifact_id: the artifact ID
+        '''
+        self._load()
+        i_node = self._h_nodes.get(artifact_id)
+        return self._a_names[i_node] if i_node is not None else None
+
+    def _child_rows(self, h_bindings: Dict[str, Any]) -> List[Dict[str, Any]]:
+        si_parent = h_bindings.get('artifactId')
+
+        # one parent's edges
+        if si_parent is not None:
+            i_node = self._h_nodes.get(si_parent)
+            if i_node is None:
+                return []
+            a_rows = [self._a_rows[self._a_child_edges[i_slot]] for i_slot in range(self._a_child_offsets[i_node], self._a_child_offsets[i_node+1])]
+        # every edge
+        else:
+            a_rows = self._a_rows
+
+        return [dict(g_row) for g_row in a_rows if all(g_row.get(si_key) == z_value for si_key, z_value in h_bindings.items())]
+
+    def _descendant_rows(self, h_bindings: Dict[str, Any]) -> List[Dict[str, Any]]:
+        h_filters = dict(h_bindings)
+        z_max_depth = h_filters.pop('maxDepth', None)
+        n_max_depth = int(z_max_depth) if z_max_depth is not None else None
+        si_ancestor = h_filters.get('artifactId')
+
+        # one ancestor, or every artifact with children
+        a_ancestors = [self._h_nodes[si_ancestor]] if si_ancestor in self._h_nodes else []
+        if si_ancestor is None:
+            a_ancestors = [i_node for i_node in range(len(self._a_ids)) if self._a_child_offsets[i_node+1] > self._a_child_offsets[i_node]]
+
+        a_rows = []
+        for i_ancestor in a_ancestors:
+            (a_nodes, a_depths) = self._descendant_nodes(i_ancestor, n_max_depth)
+            for i_descendant, n_depth in zip(a_nodes, a_depths):
+                g_row = {
+                    'artifactId': self._a_ids[i_ancestor],
+                    'childId': self._a_ids[i_descendant],
+                    'childName': self._a_names[i_descendant],
+                    'depth': n_depth,
+                }
+
+                if all(g_row.get(si_key) == z_value for si_key, z_value in h_filters.items()):
+                    a_rows.append(g_row)
+
+        return a_rows
+
+    def execute(self, name: str, patterns: Dict[str, str]={}, bindings: Dict[str, Any]={}, w_url_provider=None) -> List[Dict[str, Any]]:
+        # direct children, not redefined by the caller
+        if 'artifactChildren' == name and name not in patterns and w_url_provider is None:
+            self._load()
+            return self._child_rows(bindings)
+        # transitive children
+        elif SI_DESCENDANTS == name:
+            self._load()
+            return self._descendant_rows(bindings)
+
+        # anything else goes to the wrapped client
+        return self._k_incquery.execute(name, patterns=patterns, bindings=bindings, w_url_provider=w_url_provider)
+
+    def extend_row(self, row: Dict[str, Any], query_field) -> List[Any]:
+        k_field = query_field
+
+        # apply field join to its bindings
+        h_bindings = {**k_field.bindings, **k_field.join(row)}
+
+        # execute query against the hierarchy
+        a_rows = self.execute(name=k_field.query, bindings=h_bindings)
+
+        # map thru select function
+        return list(map(k_field.select, a_rows))
@@ -0,0 +1,444 @@
+import json
+import hashlib
+import collections
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape
+
+# node box size and spacing, in pixels
+N_NODE_WIDTH = 160
+N_NODE_HEIGHT = 32
+N_NODE_GAP = 16
+N_LAYER_GAP = 48
+N_MARGIN = 8
+
+# longest label drawn inside a box; the full label is shown as its tooltip
+N_LABEL_CHARS = 24
+
+# number of down-and-up barycenter sweeps for crossing reduction
+N_SWEEPS = 4
+
+# stylesheet shared by every element of the diagram
+SX_SVG_STYLE = 'rect{fill:#f4f5f7;stroke:#42526e;rx:3px}rect.c{stroke-dasharray:4 2}text{text-anchor:middle;dominant-baseline:central}path{fill:none;stroke:#97a0af}'
+
+
+class Graph(NamedTuple):
+    '''
+    A directed graph to lay out, e.g., a requirement hierarchy with edges from parent to child
+    '''
+    nodes: List[Tuple[str, str]]
+    edges: List[Tuple[str, str]]
+
+    def digest(self) -> str:
+        '''
+        Stable digest of the graph's content, for caching its layout
+        '''
+        return hashlib.sha256(json.dumps([self.nodes, self.edges]).encode()).hexdigest()
+
+
+class PlacedNode(NamedTuple):
+    '''
+    A node's box in the layout; `hidden` counts the descendants collapsed into it
+    '''
+    id: str
+    label: str
+    x: int
+    y: int
+    hidden: int=0
+
+
+class Layout(NamedTuple):
+    '''
+    Positions of every drawn node and the route of every drawn edge
+    '''
+    width: int
+    height: int
+    nodes: List[PlacedNode]
+    edges: List[List[Tuple[int, int]]]
+    crossings: int=0
+
+
+def _collapse(nl_nodes: int, a_succ: List[List[int]], a_sources: List[int], n_max: int) -> Tuple[List[bool], List[int]]:
+    '''
+    Keep the first `n_max` nodes in breadth-first order from the sources and attribute
+    every other node to the nearest kept node above it
+
+    :return: (whether each node is kept, number of nodes hidden below each node)
+    '''
+    # breadth-first order over every component
+    a_order = []
+    ab_seen = [False]*nl_nodes
+    for i_start in a_sources+list(range(nl_nodes)):
+        if ab_seen[i_start]:
+            continue
+        ab_seen[i_start] = True
+        dq_queue = collections.deque([i_start])
+        while dq_queue:
+            i_node = dq_queue.popleft()
+            a_order.append(i_node)
+            for i_next in a_succ[i_node]:
+                if not ab_seen[i_next]:
+                    ab_seen[i_next] = True
+                    dq_queue.append(i_next)
+
+    ab_kept = [False]*nl_nodes
+    for i_node in a_order[:n_max]:
+        ab_kept[i_node] = True
+
+    # each hidden node counts toward the first kept node that reaches it
+    a_hidden = [0]*nl_nodes
+    a_owner = [-1]*nl_nodes
+    dq_queue = collections.deque()
+    for i_node in a_order[:n_max]:
+        a_owner[i_node] = i_node
+        dq_queue.append(i_node)
+
+    while dq_queue:
+        i_node = dq_queue.popleft()
+        for i_next in a_succ[i_node]:
+            if a_owner[i_next] < 0:
+                a_owner[i_next] = a_owner[i_node]
+                a_hidden[a_owner[i_node]] += 1
+                dq_queue.append(i_next)
+
+    return ab_kept, a_hidden
+
+
+def _acyclic(nl_nodes: int, a_edges: List[Tuple[int, int]], a_sources: List[int]) -> List[Tuple[int, int, bool]]:
+    '''
+    Reverse the back edges found by a depth-first search so that the graph has no cycles
+
+    :return: list of (source, target, reversed)
+    '''
+    a_succ = [[] for _ in range(nl_nodes)]
+    for i_edge, (i_src, i_dst) in enumerate(a_edges):
+        a_succ[i_src].append((i_dst, i_edge))
+
+    # 0: unvisited, 1: on the stack, 2: done
+    a_state = [0]*nl_nodes
+    as_back = set()
+    for i_start in a_sources+list(range(nl_nodes)):
+        if a_state[i_start]:
+            continue
+
+        a_state[i_start] = 1
+        a_stack = [(i_start, iter(a_succ[i_start]))]
+        while a_stack:
+            (i_node, i_edges) = a_stack[-1]
+            for (i_next, i_edge) in i_edges:
+                if 1 == a_state[i_next]:
+                    as_back.add(i_edge)
+                elif 0 == a_state[i_next]:
+                    a_state[i_next] = 1
+                    a_stack.append((i_next, iter(a_succ[i_next])))
+                    break
+            else:
+                a_state[i_node] = 2
+                a_stack.pop()
+
+    return [(i_dst, i_src, True) if i_edge in as_back else (i_src, i_dst, False) for i_edge, (i_src, i_dst) in enumerate(a_edges)]
+
+
+def _layers(nl_nodes: int, a_edges: List[Tuple[int, int, bool]]) -> List[int]:
+    '''
+    Longest-path layering; each node sits one layer below the lowest of its predecessors
+    '''
+    a_succ = [[] for _ in range(nl_nodes)]
+    a_indegree = [0]*nl_nodes
+    for (i_src, i_dst, _) in a_edges:
+        a_succ[i_src].append(i_dst)
+        a_indegree[i_dst] += 1
+
+    a_layer = [0]*nl_nodes
+    dq_queue = collections.deque(i_node for i_node in range(nl_nodes) if not a_indegree[i_node])
+    while dq_queue:
+        i_node = dq_queue.popleft()
+        for i_next in a_succ[i_node]:
+            a_layer[i_next] = max(a_layer[i_next], a_layer[i_node]+1)
+            a_indegree[i_next] -= 1
+            if not a_indegree[i_next]:
+                dq_queue.append(i_next)
+
+    return a_layer
+
+
+def _crossings(a_upper: List[int], a_lower: List[int], a_down: List[List[int]], a_pos: List[int]) -> int:
+    '''
+    Number of crossings between the edges of two adjacent layers, by counting inversions
+    with a Fenwick tree in O(e log n)
+    '''
+    nl_lower = len(a_lower)
+    a_tree = [0]*(nl_lower+1)
+
+    nl_crossings = 0
+    nl_inserted = 0
+    for i_node in a_upper:
+        # edges in order of their upper end, then lower end
+        for i_pos in sorted(a_pos[i_next] for i_next in a_down[i_node]):
+            # count inserted edges ending to the right of this one
+            i_index = i_pos+1
+            nl_before = 0
+            while i_index > 0:
+                nl_before += a_tree[i_index]
+                i_index -= i_index & -i_index
+            nl_crossings += nl_inserted-nl_before
+
+            i_index = i_pos+1
+            while i_index <= nl_lower:
+                a_tree[i_index] += 1
+                i_index += i_index & -i_index
+            nl_inserted += 1
+
+    return nl_crossings
+
+
+def _total_crossings(a_layers: List[List[int]], a_down: List[List[int]], a_pos: List[int]) -> int:
+    return sum(_crossings(a_layers[i_layer], a_layers[i_layer+1], a_down, a_pos) for i_layer in range(len(a_layers)-1))
+
+
+def _sweep(a_layers: List[List[int]], a_adjacent: List[List[int]], a_pos: List[int], a_range):
+    '''
+    Reorder each layer by the barycenter of its neighbors in the layer before it in the sweep
+    '''
+    for i_layer in a_range:
+        a_layer = a_layers[i_layer]
+
+        # nodes without neighbors keep their place
+        a_keys = []
+        for i_node in a_layer:
+            a_neighbors = a_adjacent[i_node]
+            a_keys.append(sum(a_pos[i_next] for i_next in a_neighbors)/len(a_neighbors) if a_neighbors else a_pos[i_node])
+
+        a_layer[:] = [i_node for _, _, i_node in sorted(zip(a_keys, range(len(a_layer)), a_layer))]
+        for i_pos, i_node in enumerate(a_layer):
+            a_pos[i_node] = i_pos
+
+
+def _place(a_layer: List[int], a_desired: List[float], a_width: List[int]) -> List[float]:
+    '''
+    Positions as close as possible to the desired ones that keep the layer's order and spacing;
+    the average of the tightest placements pushed from the left and from the right
+    '''
+    nl_layer = len(a_layer)
+
+    a_left = [0.0]*nl_layer
+    for i_pos in range(nl_layer):
+        a_left[i_pos] = a_desired[i_pos]
+        if i_pos:
+            x_min = a_left[i_pos-1]+(a_width[a_layer[i_pos-1]]+a_width[a_layer[i_pos]])/2+N_NODE_GAP
+            a_left[i_pos] = max(a_left[i_pos], x_min)
+
+    a_right = [0.0]*nl_layer
+    for i_pos in reversed(range(nl_layer)):
+        a_right[i_pos] = a_desired[i_pos]
+        if i_pos < nl_layer-1:
+            x_max = a_right[i_pos+1]-(a_width[a_layer[i_pos+1]]+a_width[a_layer[i_pos]])/2-N_NODE_GAP
+            a_right[i_pos] = min(a_right[i_pos], x_max)
+
+    return [(x_left+x_right)/2 for x_left, x_right in zip(a_left, a_right)]
+
+
+def layout(graph: Graph, max_nodes: Optional[int]=None) -> Layout:
+    '''
+    Lay out a directed graph in layers from top to bottom (Sugiyama style): cycles are
+    broken, nodes are assigned to layers by longest path, long edges are routed through
+    dummy nodes, crossings are reduced with barycenter sweeps and nodes are placed close
+    to the middle of their neighbors
+
+    :param graph: the graph
+    :param max_nodes: number of nodes beyond which subtrees are collapsed into the nodes
+        above them; None to draw every node
+    '''
+    # number the nodes
+    h_nodes: Dict[str, int] = {}
+    a_labels: List[str] = []
+    a_ids: List[str] = []
+    for (si_node, s_label) in graph.nodes:
+        if si_node not in h_nodes:
+            h_nodes[si_node] = len(a_ids)
+            a_ids.append(si_node)
+            a_labels.append(s_label)
+
+    # distinct edges between known nodes, without self loops
+    a_edges = list(dict.fromkeys((h_nodes[si_src], h_nodes[si_dst]) for si_src, si_dst in graph.edges
+        if si_src in h_nodes and si_dst in h_nodes and si_src != si_dst))
+
+    nl_nodes = len(a_ids)
+    a_succ = [[] for _ in range(nl_nodes)]
+    as_targets = set()
+    for (i_src, i_dst) in a_edges:
+        a_succ[i_src].append(i_dst)
+        as_targets.add(i_dst)
+    a_sources = [i_node for i_node in range(nl_nodes) if i_node not in as_targets]
+
+    # too many nodes to draw; collapse subtrees
+    a_hidden = [0]*nl_nodes
+    if max_nodes is not None and nl_nodes > max_nodes:
+        (ab_kept, a_hidden) = _collapse(nl_nodes, a_succ, a_sources, max_nodes)
+
+        # renumber the kept nodes
+        a_kept = [i_node for i_node in range(nl_nodes) if ab_kept[i_node]]
+        h_renumber = {i_node: i_new for i_new, i_node in enumerate(a_kept)}
+        a_ids = [a_ids[i_node] for i_node in a_kept]
+        a_labels = [a_labels[i_node] for i_node in a_kept]
+        a_hidden = [a_hidden[i_node] for i_node in a_kept]
+        a_edges = [(h_renumber[i_src], h_renumber[i_dst]) for i_src, i_dst in a_edges if ab_kept[i_src] and ab_kept[i_dst]]
+        a_sources = [h_renumber[i_node] for i_node in a_sources if ab_kept[i_node]]
+        nl_nodes = len(a_ids)
+
+    # break cycles and assign layers
+    a_dag = _acyclic(nl_nodes, a_edges, a_sources)
+    a_layer = _layers(nl_nodes, a_dag)
+
+    # route edges spanning several layers through dummy nodes
+    a_width = [N_NODE_WIDTH]*nl_nodes
+    a_down = [[] for _ in range(nl_nodes)]
+    a_up = [[] for _ in range(nl_nodes)]
+    a_chains = []
+    for (i_src, i_dst, b_reversed) in a_dag:
+        a_chain = [i_src]
+        for i_dummy_layer in range(a_layer[i_src]+1, a_layer[i_dst]):
+            i_dummy = len(a_width)
+            a_width.append(0)
+            a_layer.append(i_dummy_layer)
+            a_down.append([])
+            a_up.append([])
+            a_chain.append(i_dummy)
+        a_chain.append(i_dst)
+
+        for i_upper, i_lower in zip(a_chain, a_chain[1:]):
+            a_down[i_upper].append(i_lower)
+            a_up[i_lower].append(i_upper)
+
+        a_chains.append(a_chain[::-1] if b_reversed else a_chain)
+
+    nl_all = len(a_width)
+
+    # initial order within each layer from a depth-first walk, which leaves trees without crossings
+    a_layers = [[] for _ in range(max(a_layer)+1 if a_layer else 0)]
+    ab_placed = [False]*nl_all
+    for i_start in a_sources+list(range(nl_all)):
+        if ab_placed[i_start]:
+            continue
+        ab_placed[i_start] = True
+        a_stack = [i_start]
+        while a_stack:
+            i_node = a_stack.pop()
+            a_layers[a_layer[i_node]].append(i_node)
+            for i_next in reversed(a_down[i_node]):
+                if not ab_placed[i_next]:
+                    ab_placed[i_next] = True
+                    a_stack.append(i_next)
+
+    a_pos = [0]*nl_all
+    for a_nodes in a_layers:
+        for i_pos, i_node in enumerate(a_nodes):
+            a_pos[i_node] = i_pos
+
+    # reduce crossings; keep the best order seen
+    nl_best = _total_crossings(a_layers, a_down, a_pos)
+    a_best = [list(a_nodes) for a_nodes in a_layers]
+    for _ in range(N_SWEEPS):
+        if not nl_best:
+            break
+
+        _sweep(a_layers, a_up, a_pos, range(1, len(a_layers)))
+        _sweep(a_layers, a_down, a_pos, range(len(a_layers)-2, -1, -1))
+
+        nl_crossings = _total_crossings(a_layers, a_down, a_pos)
+        if nl_crossings < nl_best:
+            nl_best = nl_crossings
+            a_best = [list(a_nodes) for a_nodes in a_layers]
+
+    a_layers = a_best
+
+    # initial x coordinates; packed from the left
+    a_x = [0.0]*nl_all
+    for a_nodes in a_layers:
+        x_node = 0.0
+        for i_pos, i_node in enumerate(a_nodes):
+            if i_pos:
+                x_node += (a_width[a_nodes[i_pos-1]]+a_width[i_node])/2+N_NODE_GAP
+            a_x[i_node] = x_node
+
+    # center parents over their children, then children under their parents
+    for (a_range, a_adjacent) in [(range(len(a_layers)-2, -1, -1), a_down), (range(1, len(a_layers)), a_up)]:
+        for i_layer in a_range:
+            a_nodes = a_layers[i_layer]
+            a_desired = [sum(a_x[i_next] for i_next in a_adjacent[i_node])/len(a_adjacent[i_node]) if a_adjacent[i_node] else a_x[i_node] for i_node in a_nodes]
+            for i_node, x_node in zip(a_nodes, _place(a_nodes, a_desired, a_width)):
+                a_x[i_node] = x_node
+
+    # translate into view
+    x_min = min((a_x[i_node]-a_width[i_node]/2 for i_node in range(nl_all)), default=0)
+    x_max = max((a_x[i_node]+a_width[i_node]/2 for i_node in range(nl_all)), default=0)
+    a_x = [round(x_node-x_min)+N_MARGIN for x_node in a_x]
+    a_y = [N_MARGIN+i_layer*(N_NODE_HEIGHT+N_LAYER_GAP) for i_layer in a_layer]
+
+    # edges leave the bottom of their source and enter the top of their target
+    a_routes = []
+    for a_chain in a_chains:
+        a_route = []
+        for i_step, i_node in enumerate(a_chain):
+            if i_node >= nl_nodes:
+                a_route.append((a_x[i_node], a_y[i_node]+N_NODE_HEIGHT//2))
+            elif 0 == i_step:
+                a_route.append((a_x[i_node], a_y[i_node]+(N_NODE_HEIGHT if a_y[i_node] < a_y[a_chain[-1]] else 0)))
+            else:
+                a_route.append((a_x[i_node], a_y[i_node]+(0 if a_y[i_node] > a_y[a_chain[0]] else N_NODE_HEIGHT)))
+        a_routes.append(a_route)
+
+    return Layout(
+        width=round(x_max-x_min)+2*N_MARGIN,
+        height=N_MARGIN*2+len(a_layers)*(N_NODE_HEIGHT+N_LAYER_GAP)-N_LAYER_GAP if a_layers else 2*N_MARGIN,
+        nodes=[PlacedNode(
+            id=a_ids[i_node],
+            label=a_labels[i_node],
+            x=a_x[i_node]-N_NODE_WIDTH//2,
+            y=a_y[i_node],
+            hidden=a_hidden[i_node],
+        ) for i_node in range(nl_nodes)],
+        edges=a_routes,
+        crossings=nl_best,
+    )
+
+
+def to_svg(layout: Layout) -> str:
+    '''
+    Serialize a layout as a compact SVG document; all edges form a single path and the
+    styling is shared by one stylesheet
+
+    :param layout: the layout
+    '''
+    k_layout = layout
+
+    a_parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{k_layout.width}" height="{k_layout.height}" viewBox="0 0 {k_layout.width} {k_layout.height}" font-family="sans-serif" font-size="11">',
+        f'<style>{SX_SVG_STYLE}</style>',
+    ]
+
+    # every edge in one path
+    if k_layout.edges:
+        sx_path = ''.join('M'+'L'.join(f'{x} {y}' for x, y in a_route) for a_route in k_layout.edges)
+        a_parts.append(f'<path d="{sx_path}"/>')
+
+    for g_node in k_layout.nodes:
+        s_label = g_node.label or g_node.id
+        s_title = s_label+(f' (+{g_node.hidden} collapsed)' if g_node.hidden else '')
+
+        # truncate long labels
+        s_text = s_label if len(s_label) <= N_LABEL_CHARS else s_label[:N_LABEL_CHARS-1]+'…'
+        if g_node.hidden:
+            s_text += f' +{g_node.hidden}'
+
+        # collapsed nodes are drawn dashed
+        sx_class = ' class="c"' if g_node.hidden else ''
+
+        a_parts.append(
+            f'<g><title>{escape(s_title)}</title>'
+            f'<rect{sx_class} x="{g_node.x}" y="{g_node.y}" width="{N_NODE_WIDTH}" height="{N_NODE_HEIGHT}"/>'
+            f'<text x="{g_node.x+N_NODE_WIDTH//2}" y="{g_node.y+N_NODE_HEIGHT//2}">{escape(s_text)}</text></g>'
+        )
+
+    a_parts.append('</svg>')
+
+    return ''.join(a_parts)
@@ -0,0 +1,313 @@
+import re
+import json
+import collections
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import rdflib
+from rdflib import RDF, OWL, XSD, URIRef, BNode, Literal
+from opl.constants import prefixes
+from opl.sparql import S_PREFIXES_SPARQL
+
+# type aliases
+Binding = Dict[str, Dict[str, str]]
+
+# namespaces used by the directives query
+NS_CFL = rdflib.Namespace(prefixes[''])
+NS_AC = rdflib.Namespace(prefixes['ac'])
+
+# predicates whose objects are lists of child containers
+A_CHILD_PREDICATES = [NS_CFL.body, NS_CFL['items']]
+
+# dataset clause of queries written for the endpoint; the local graph is the default graph
+R_FROM_CLAUSE = re.compile(r'(?i)\bfrom\s+(named\s+)?<[^>]*>')
+
+
+# a plain string literal with the given value, as matched by a SPARQL string constant
+def _is_string(z_term, s_value: str) -> bool:
+    return isinstance(z_term, Literal) and str(z_term) == s_value and z_term.language is None and z_term.datatype in (None, XSD.string)
+
+
+# convert an RDF term to its SPARQL JSON results form
+def _binding(z_term) -> Dict[str, str]:
+    if isinstance(z_term, URIRef):
+        return {'type': 'uri', 'value': str(z_term)}
+    elif isinstance(z_term, BNode):
+        return {'type': 'bnode', 'value': str(z_term)}
+
+    g_term = {'type': 'literal', 'value': str(z_term)}
+    if z_term.language:
+        g_term['xml:lang'] = z_term.language
+    elif z_term.datatype is not None:
+        g_term['datatype'] = str(z_term.datatype)
+
+    return g_term
+
+
+class SpaceGraph:
+    '''
+    A dump of a space graph (e.g., N-Triples or Turtle) loaded into a local store, with
+    indexes that let the directives query be answered in Python rather than by the
+    SPARQL endpoint. Other queries are evaluated by rdflib's SPARQL engine, so the
+    instance can stand in for an `opl.Sparql` client.
+
+    :param file: path to the dump
+    :param format: rdflib parser format; guessed from the file extension by default
+    '''
+    def __init__(self, file: str, format: str=None):
+        self._y_graph = rdflib.Graph()
+        self._y_graph.parse(file, format=format or rdflib.util.guess_format(file) or 'turtle')
+
+        self._build_indexes()
+
+    @property
+    def graph(self) -> rdflib.Graph:
+        return self._y_graph
+
+    # all members of an RDF list, in order
+    def _list_items(self, z_head) -> List:
+        y_graph = self._y_graph
+        a_items = []
+        as_seen = set()
+        while z_head is not None and z_head != RDF.nil and z_head not in as_seen:
+            as_seen.add(z_head)
+            a_items.extend(y_graph.objects(z_head, RDF.first))
+            z_head = y_graph.value(z_head, RDF.rest)
+        return a_items
+
+    def _build_indexes(self):
+        y_graph = self._y_graph
+
+        # types of each node
+        self._h_types = collections.defaultdict(set)
+        for z_node, _, z_type in y_graph.triples((None, RDF.type, None)):
+            self._h_types[z_node].add(z_type)
+
+        # child containers of each container, in document order
+        self._h_children = collections.defaultdict(list)
+        for z_predicate in A_CHILD_PREDICATES:
+            for z_node, _, z_list in y_graph.triples((None, z_predicate, None)):
+                self._h_children[z_node].extend(self._list_items(z_list))
+
+        # documents by page ID, and by title for joining directive links with view templates
+        self._a_documents: List[Tuple] = []
+        self._h_templates = collections.defaultdict(list)
+        for z_doc, z_type in [(z_node, NS_CFL.Document) for z_node, a_types in self._h_types.items() if NS_CFL.Document in a_types]:
+            a_page_ids = list(y_graph.objects(z_doc, NS_CFL.pageId))
+
+            # root containers of the document's content
+            a_roots = [z_root for z_content in y_graph.objects(z_doc, NS_CFL.content) for z_root in self._list_items(z_content)]
+            for z_page_id in a_page_ids:
+                self._a_documents.append((z_doc, z_page_id, a_roots))
+
+            for z_title in y_graph.objects(z_doc, NS_CFL.title):
+                for z_space in y_graph.objects(z_doc, NS_CFL.spaceKey):
+                    for z_page_id in a_page_ids:
+                        self._h_templates[z_title].append((z_doc, z_space, z_page_id))
+
+        # descendant-or-self containers of each root container, each flagged by whether a macro is on its path
+        self._h_descendants: Dict = {}
+        for _, _, a_roots in self._a_documents:
+            for z_root in a_roots:
+                if z_root not in self._h_descendants:
+                    self._h_descendants[z_root] = self._descendants(z_root)
+
+    def _descendants(self, z_root) -> List[Tuple]:
+        '''
+        Walk the containers under a root, breadth first, and return each reachable node once
+        together with whether any path to it from the root passes through (or ends at) a macro
+        '''
+        h_types = self._h_types
+        h_children = self._h_children
+
+        # visit each (node, under macro) state at most once
+        h_under_macro = collections.OrderedDict()
+        dq_queue = collections.deque([(z_root, False)])
+        as_visited = set()
+        while dq_queue:
+            (z_node, b_under_macro) = dq_queue.popleft()
+            b_under_macro = b_under_macro or NS_CFL.Macro in h_types.get(z_node, ())
+
+            if (z_node, b_under_macro) in as_visited:
+                continue
+            as_visited.add((z_node, b_under_macro))
+
+            h_under_macro[z_node] = h_under_macro.get(z_node, False) or b_under_macro
+
+            for z_child in h_children.get(z_node, ()):
+                dq_queue.append((z_child, b_under_macro))
+
+        return list(h_under_macro.items())
+
+    def _join_template(self, z_link) -> Iterator[Dict]:
+        '''
+        Evaluate the DIRECTIVE_JOIN mixin for a directive link
+        '''
+        y_graph = self._y_graph
+        a_types = self._h_types.get(z_link, ())
+
+        a_partials = []
+
+        # proper page reference style
+        if NS_CFL.PageReference in a_types:
+            for z_title in y_graph.objects(z_link, NS_CFL.ref):
+                for z_text in list(y_graph.objects(z_link, NS_CFL.text)) or [None]:
+                    for z_space in list(y_graph.objects(z_link, NS_CFL.spaceKey)) or [None]:
+                        h_partial = {'directive_page_title': z_title}
+                        if z_text is not None:
+                            h_partial['directive_link_text'] = z_text
+                        if z_space is not None:
+                            h_partial['directive_page_space'] = z_space
+                        a_partials.append(h_partial)
+
+        # sloppy external link style
+        if NS_CFL.ExternalLink in a_types:
+            for z_proxy in y_graph.objects(z_link, NS_CFL.hrefLinked):
+                for z_same in dict.fromkeys([z_proxy, *y_graph.objects(z_proxy, OWL.sameAs)]):
+                    for z_title in y_graph.objects(z_same, NS_CFL.title):
+                        a_partials.append({'proxy': z_proxy, 'directive_page_title': z_title})
+
+        # join with directive ref's page id
+        for h_partial in a_partials:
+            for (z_doc, z_space, z_page_id) in self._h_templates.get(h_partial['directive_page_title'], ()):
+                if h_partial.get('directive_page_space', z_space) != z_space:
+                    continue
+
+                yield {
+                    **h_partial,
+                    'view_template_def': z_doc,
+                    'directive_page_space': z_space,
+                    'directive_page_id': z_page_id,
+                }
+
+    def _annotated(self, z_directive, as_commands) -> Iterator[Dict]:
+        '''
+        Evaluate the annotated view directive branch
+        '''
+        y_graph = self._y_graph
+
+        if NS_CFL.Macro not in self._h_types.get(z_directive, ()):
+            return
+        if not any(_is_string(z_name, 'span') for z_name in y_graph.objects(z_directive, NS_AC.name)):
+            return
+
+        for z_macro_id in y_graph.objects(z_directive, NS_AC['macro-id']):
+            for z_param in y_graph.objects(z_directive, NS_CFL.parameter):
+                if not any(_is_string(z_name, 'class') for z_name in y_graph.objects(z_param, NS_AC.name)):
+                    continue
+
+                for z_command in y_graph.objects(z_param, NS_CFL.value):
+                    if not any(_is_string(z_command, s_command) for s_command in as_commands):
+                        continue
+
+                    # body is a single paragraph whose body is the single directive link
+                    for z_body in y_graph.objects(z_directive, NS_CFL.body):
+                        if y_graph.value(z_body, RDF.rest) != RDF.nil:
+                            continue
+
+                        for z_paragraph in y_graph.objects(z_body, RDF.first):
+                            if NS_CFL.Paragraph not in self._h_types.get(z_paragraph, ()):
+                                continue
+
+                            for z_paragraph_body in y_graph.objects(z_paragraph, NS_CFL.body):
+                                if y_graph.value(z_paragraph_body, RDF.rest) != RDF.nil:
+                                    continue
+
+                                for z_link in y_graph.objects(z_paragraph_body, RDF.first):
+                                    for h_join in self._join_template(z_link):
+                                        yield {
+                                            'directive_macro_id': z_macro_id,
+                                            'directive_command': z_command,
+                                            'directive_link': z_link,
+                                            **h_join,
+                                        }
+
+    def _plain_link(self, z_directive, b_under_macro: bool, a_title_prefixes) -> Iterator[Dict]:
+        '''
+        Evaluate the plain view directive link branch
+        '''
+        # exclude links within macros
+        if b_under_macro:
+            return
+
+        for z_link in dict.fromkeys([z_directive, *self._y_graph.objects(z_directive, OWL.sameAs)]):
+            for h_join in self._join_template(z_link):
+                for s_prefix in a_title_prefixes:
+                    if str(h_join['directive_page_title']).startswith(s_prefix):
+                        yield {
+                            'directive_link': z_link,
+                            **h_join,
+                            'directive_page_title_prefix': Literal(s_prefix),
+                        }
+
+    def _external_link(self, z_directive, a_link_prefixes) -> Iterator[Dict]:
+        '''
+        Evaluate the external links to special domain(s) branch
+        '''
+        if NS_CFL.ExternalLink not in self._h_types.get(z_directive, ()):
+            return
+
+        for z_link in self._y_graph.objects(z_directive, NS_CFL.hrefLinked):
+            for s_prefix in a_link_prefixes:
+                if str(z_link).startswith(s_prefix):
+                    yield {
+                        'directive_link': z_link,
+                        'directive_link_prefix': Literal(s_prefix),
+                    }
+
+    def directives(self, commands: Iterable[str], page_title_prefixes: Iterable[str]=(), link_href_prefixes: Iterable[str]=(),
+            spaces: Dict[str, str]={}, source_pages: Optional[Iterable[str]]=None) -> List[Binding]:
+        '''
+        Produce the same bindings as `directives.rq` with the given injections
+
+        :param commands: values of DIRECTIVE_COMMANDS
+        :param page_title_prefixes: values of DIRECTIVE_PAGE_TITLE_PREFIXES; empty omits the branch
+        :param link_href_prefixes: values of DIRECTIVE_LINK_HREF_PREFIXES; empty omits the branch
+        :param spaces: SPACES map of space ID to space IRI
+        :param source_pages: values of SOURCE_PAGE; None for all pages
+        :return: list of rows in SPARQL JSON results form
+        '''
+        as_commands = list(commands)
+        a_title_prefixes = list(page_title_prefixes)
+        a_link_prefixes = list(link_href_prefixes)
+        a_spaces = [{'space_id': Literal(si_space), 'space_iri': URIRef(p_space)} for si_space, p_space in spaces.items()]
+        as_source_pages = {Literal(si_page) for si_page in source_pages} if source_pages is not None else None
+
+        a_rows = []
+        for (z_doc, z_page_id, a_roots) in self._a_documents:
+            # restricted to source pages
+            if as_source_pages is not None and z_page_id not in as_source_pages:
+                continue
+
+            for z_root in a_roots:
+                for (z_directive, b_under_macro) in self._h_descendants[z_root]:
+                    a_matches = list(self._annotated(z_directive, as_commands))
+
+                    if a_title_prefixes:
+                        a_matches.extend(self._plain_link(z_directive, b_under_macro, a_title_prefixes))
+
+                    if a_link_prefixes:
+                        a_matches.extend(self._external_link(z_directive, a_link_prefixes))
+
+                    for h_match in a_matches:
+                        h_row = {
+                            'source_iri': z_doc,
+                            'source_page_id': z_page_id,
+                            'root_container': z_root,
+                            'directive': z_directive,
+                            **h_match,
+                        }
+
+                        for h_space in a_spaces or [{}]:
+                            a_rows.append({si_var: _binding(z_term) for si_var, z_term in {**h_row, **h_space}.items()})
+
+        return a_rows
+
+    def fetch(self, query: str) -> List[Binding]:
+        '''
+        Evaluate a SPARQL SELECT query against the local graph and return the result rows as a list of dicts
+
+        :param query: the SPARQL SELECT query string. Prefixes are prepended automatically and any
+            dataset clause is ignored
+        '''
+        y_result = self._y_graph.query(S_PREFIXES_SPARQL+'\n'+R_FROM_CLAUSE.sub('', query))
+        return json.loads(y_result.serialize(format='json'))['results']['bindings']
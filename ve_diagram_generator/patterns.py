@@ -27,9 +27,10 @@ ve_patterns = {
     'artifactChildren': '''
         (
             artifactId: java String,
-            child, childName: String
+            child, childId: java String, childName: String
         ) {
             Element.ID(artifact, artifactId);
+            Element.ID(child, childId);
 
             Class.ownedAttribute(child, childProperty);
             Property.name(childProperty, "Child Of");
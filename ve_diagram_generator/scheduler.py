@@ -0,0 +1,271 @@
+import time
+import random
+import threading
+from typing import Any, Iterable, Optional
+
+
+# HTTP status codes after which a request is retried
+def _is_retryable(n_status: Optional[int]) -> bool:
+    return n_status is not None and (429 == n_status or 500 <= n_status < 600)
+
+
+# HTTP status carried by an exception (or any exception it was raised from), if any
+def _http_status(e_error: BaseException) -> Optional[int]:
+    as_seen = set()
+    while e_error is not None and id(e_error) not in as_seen:
+        as_seen.add(id(e_error))
+
+        # e.g., iqs_client's ApiException (.status), urllib's HTTPError (.code)
+        for si_attr in ('status', 'status_code', 'code'):
+            z_status = getattr(e_error, si_attr, None)
+            if isinstance(z_status, int):
+                return z_status
+
+        # e.g., requests' HTTPError
+        z_status = getattr(getattr(e_error, 'response', None), 'status_code', None)
+        if isinstance(z_status, int):
+            return z_status
+
+        e_error = e_error.__cause__ or e_error.__context__
+
+    return None
+
+
+# seconds the server asked to wait before retrying, if it said so
+def _retry_after(e_error: BaseException) -> Optional[float]:
+    as_seen = set()
+    while e_error is not None and id(e_error) not in as_seen:
+        as_seen.add(id(e_error))
+
+        for z_source in (getattr(e_error, 'response', None), e_error):
+            h_headers = getattr(z_source, 'headers', None)
+            if h_headers is None:
+                continue
+
+            try:
+                return max(0.0, float(h_headers.get('Retry-After')))
+            except (TypeError, ValueError, AttributeError):
+                pass
+
+        e_error = e_error.__cause__ or e_error.__context__
+
+    return None
+
+
+class TokenBucket:
+    '''
+    Limits the sustained rate of requests while allowing short bursts
+
+    :param rate: tokens added per second
+    :param burst: maximum number of tokens that can accumulate
+    '''
+    def __init__(self, rate: float, burst: float=1):
+        if rate <= 0:
+            raise ValueError('Token bucket rate must be positive')
+
+        self._x_rate = rate
+        self._x_burst = max(1.0, burst)
+        self._x_tokens = self._x_burst
+        self._x_updated = time.monotonic()
+        self._y_lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Take one token, waiting until one is available
+        '''
+        with self._y_lock:
+            x_now = time.monotonic()
+
+            # refill
+            self._x_tokens = min(self._x_burst, self._x_tokens+(x_now-self._x_updated)*self._x_rate)
+            self._x_updated = x_now
+
+            # take a token, possibly going into debt that later callers wait out
+            self._x_tokens -= 1
+            x_wait = -self._x_tokens/self._x_rate if self._x_tokens < 0 else 0
+
+        if x_wait > 0:
+            time.sleep(x_wait)
+
+
+class Backend:
+    '''
+    A remote service shared by all workers of a run. Bounds how many requests may
+    be in flight to the service at once, regardless of which client object or
+    thread issues them, and optionally how many may start per second.
+
+    Requests that fail with HTTP 429 or 5xx are retried with exponential backoff and
+    full jitter (honoring Retry-After); requests that are not idempotent are retried
+    only when throttled, since a server error may come after the request took effect. The number of simultaneous requests adapts
+    between 1 and `max_concurrency`: it grows by one per window of requests that
+    complete without slowing down, and is halved when a request is throttled or the
+    smoothed latency rises well above the lowest recently observed.
+
+    :param name: label of the backend, used in diagnostics
+    :param max_concurrency: maximum number of simultaneous requests
+    :param rate: maximum number of requests started per second; None for no limit
+    :param burst: number of requests that may start at once before `rate` applies
+    :param max_retries: number of times a throttled or failed request is retried
+    :param backoff: base delay in seconds before the first retry
+    :param max_backoff: upper bound on the delay before any retry
+    :param latency_tolerance: factor over the baseline latency beyond which the backend
+        is considered to be slowing down
+    '''
+    def __init__(self, name: str, max_concurrency: int=1, rate: float=None, burst: float=1,
+            max_retries: int=5, backoff: float=0.5, max_backoff: float=30, latency_tolerance: float=2.0):
+        if max_concurrency < 1:
+            raise ValueError(f'Backend "{name}" must allow at least one concurrent request')
+
+        self._s_name = name
+        self._n_max = max_concurrency
+        self._y_bucket = TokenBucket(rate, burst) if rate else None
+        self._n_retries = max(0, max_retries)
+        self._x_backoff = backoff
+        self._x_max_backoff = max_backoff
+        self._x_tolerance = latency_tolerance
+
+        # adaptive concurrency limit
+        self._x_limit = float(max_concurrency)
+        self._n_active = 0
+        self._x_latency = None
+        self._x_baseline = None
+        self._x_last_decrease = 0.0
+        self._y_cond = threading.Condition()
+
+        # counters
+        self.requests = 0
+        self.retries = 0
+
+    @property
+    def name(self) -> str:
+        return self._s_name
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._n_max
+
+    @property
+    def concurrency(self) -> int:
+        '''
+        Number of simultaneous requests currently allowed
+        '''
+        return int(self._x_limit)
+
+    def _acquire(self):
+        with self._y_cond:
+            while self._n_active >= int(self._x_limit):
+                self._y_cond.wait()
+            self._n_active += 1
+            self.requests += 1
+
+    def _release(self, x_latency: float, b_congested: bool):
+        with self._y_cond:
+            self._n_active -= 1
+            x_now = time.monotonic()
+
+            # smooth latency so that a single slow request does not count as a slowdown
+            if not b_congested:
+                self._x_latency = x_latency if self._x_latency is None else 0.8*self._x_latency+0.2*x_latency
+
+                # track the lowest recent smoothed latency; drifts upward so that it follows lasting changes
+                if self._x_baseline is None or self._x_latency < self._x_baseline:
+                    self._x_baseline = self._x_latency
+                else:
+                    self._x_baseline *= 1.01
+
+            # throttled or slowing down; halve, at most once per baseline latency
+            if b_congested or self._x_latency > self._x_tolerance*self._x_baseline:
+                if x_now-self._x_last_decrease > (self._x_baseline or 0):
+                    self._x_limit = max(1.0, self._x_limit/2)
+                    self._x_last_decrease = x_now
+            # healthy; grow by one per window of completed requests
+            else:
+                self._x_limit = min(float(self._n_max), self._x_limit+1/self._x_limit)
+
+            self._y_cond.notify_all()
+
+    def _delay(self, i_attempt: int, e_error: BaseException) -> float:
+        # full jitter over an exponentially growing window
+        x_delay = random.uniform(0, min(self._x_max_backoff, self._x_backoff*2**i_attempt))
+
+        # server asked for a specific delay
+        x_retry_after = _retry_after(e_error)
+        if x_retry_after is not None:
+            x_delay = max(x_delay, min(self._x_max_backoff, x_retry_after))
+
+        return x_delay
+
+    def call(self, f_request, *args, idempotent: bool=True, **kwargs):
+        '''
+        Perform a request once the rate limit and a slot allow, retrying it if it is
+        throttled or fails with a server error
+
+        :param f_request: the callable that performs the request
+        :param idempotent: whether the request may be repeated after a server error;
+            otherwise it is only retried when throttled
+        '''
+        i_attempt = 0
+        while True:
+            if self._y_bucket is not None:
+                self._y_bucket.acquire()
+
+            self._acquire()
+            x_start = time.monotonic()
+
+            try:
+                z_result = f_request(*args, **kwargs)
+            except Exception as e_request:
+                n_status = _http_status(e_request)
+                b_retry = _is_retryable(n_status)
+                self._release(time.monotonic()-x_start, b_retry)
+
+                # request may have been applied before the server failed
+                if not idempotent and 429 != n_status:
+                    b_retry = False
+
+                # not transient, or out of attempts
+                if not b_retry or i_attempt >= self._n_retries:
+                    raise
+
+                with self._y_cond:
+                    self.retries += 1
+                time.sleep(self._delay(i_attempt, e_request))
+                i_attempt += 1
+            else:
+                self._release(time.monotonic()-x_start, False)
+                return z_result
+
+    def bind(self, client: Any, non_idempotent: Iterable[str]=()) -> '_BoundClient':
+        '''
+        Wrap a client object so that every method call on it occupies one of this backend's slots
+
+        :param client: the client object, e.g., an `opl.IncQueryProject` or a Confluence page handle
+        :param non_idempotent: names of methods whose calls must not be repeated after a server error, e.g., `put`
+        '''
+        return _BoundClient(self, client, frozenset(non_idempotent))
+
+
+class _BoundClient:
+    '''
+    Proxy created by `Backend.bind`; forwards attribute access to the wrapped client
+    and gates method calls through the backend
+    '''
+    def __init__(self, k_backend: Backend, k_client: Any, as_non_idempotent: frozenset=frozenset()):
+        self._k_backend = k_backend
+        self._k_client = k_client
+        self._as_non_idempotent = as_non_idempotent
+
+    def __getattr__(self, si_attr: str):
+        z_attr = getattr(self._k_client, si_attr)
+
+        # private members and plain attributes pass through untouched
+        if si_attr.startswith('_') or not callable(z_attr):
+            return z_attr
+
+        k_backend = self._k_backend
+        b_idempotent = si_attr not in self._as_non_idempotent
+
+        def f_gated(*args, **kwargs):
+            return k_backend.call(z_attr, *args, idempotent=b_idempotent, **kwargs)
+
+        return f_gated
@@ -0,0 +1,197 @@
+import re
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from .view_templates import A_ARTIFACT_INFO_PARAMS, _H_UNION_PATTERNS
+
+# columns each snapshotted pattern is indexed on; a query uses the index over the most
+# columns it binds and filters the candidates on the rest
+H_INDEXES = {
+    'artifactInfo': [
+        ('artifactId',),
+        ('identifier',),
+        ('level',),
+        ('attributeKey', 'attributeValue'),
+        ('attributeKey',),
+    ],
+    'artifactAttributeStringArray': [
+        ('artifactId', 'attributeKey'),
+        ('artifactId',),
+        ('attributeKey',),
+    ],
+    # by parent
+    'artifactChildren': [
+        ('artifactId',),
+    ],
+}
+
+# bindings of the accepted values in a pattern compiled by `combine_unions`, e.g., `maturityValue2`
+R_UNION_BINDING = re.compile(r'^(\w+)Value(\d+)$')
+
+
+class _Relation:
+    '''
+    All result rows of one pattern, with an index per group of columns
+    '''
+    def __init__(self, a_rows: List[Dict[str, Any]], a_indexes: List[Tuple[str, ...]]):
+        self.rows = a_rows
+        self._h_indexes = {}
+
+        for a_cols in a_indexes:
+            h_index = self._h_indexes[a_cols] = collections.defaultdict(list)
+            for g_row in a_rows:
+                h_index[tuple(g_row.get(si_col) for si_col in a_cols)].append(g_row)
+
+    def select(self, h_bindings: Dict[str, Any]) -> List[Dict[str, Any]]:
+        '''
+        Rows matching all of the given bindings
+
+        :param h_bindings: dict of column => required value
+        '''
+        # narrowest candidate set among the indexes fully covered by the bindings
+        a_candidates = self.rows
+        a_covered = ()
+        for a_cols, h_index in self._h_indexes.items():
+            if all(si_col in h_bindings for si_col in a_cols):
+                a_rows = h_index.get(tuple(h_bindings[si_col] for si_col in a_cols), [])
+                if len(a_rows) < len(a_candidates):
+                    a_candidates = a_rows
+                    a_covered = a_cols
+
+        # filter on the remaining bindings
+        a_remaining = [(si_col, z_value) for si_col, z_value in h_bindings.items() if si_col not in a_covered]
+
+        return [dict(g_row) for g_row in a_candidates if all(g_row.get(si_col) == z_value for si_col, z_value in a_remaining)]
+
+
+class ArtifactSnapshot:
+    '''
+    Wraps an `opl.IncQueryProject` (or a wrapper of one) and answers the queries made
+    by the views in `method_registry` from an in-memory copy of the compartment's
+    requirement data. The first query loads every row of `artifactInfo`,
+    `artifactAttributeStringArray` and `artifactChildren` with one query each; queries
+    against those patterns, or against disjunctive patterns built by `combine_unions`,
+    are then answered from indexes. Any other query is forwarded to the wrapped client.
+
+    :param incquery: the IncQuery client to wrap
+    :param bindings: bindings restricting the bulk query of `artifactInfo`, e.g.,
+        `{'artifactShapeName': 'Requirement'}`; queries that do not bind the same values
+        fall back to the wrapped client
+    '''
+    def __init__(self, incquery, bindings: Dict[str, Any]={}):
+        self._k_incquery = incquery
+        self._h_scope = dict(bindings)
+        self._h_relations: Dict[str, _Relation] = None
+        self._y_lock = threading.Lock()
+        self._y_load_lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.fallbacks = 0
+
+    def __getattr__(self, si_attr: str):
+        return getattr(self._k_incquery, si_attr)
+
+    def _load(self) -> Dict[str, _Relation]:
+        # loaded; no need to wait on the lock
+        h_relations = self._h_relations
+        if h_relations is not None:
+            return h_relations
+
+        with self._y_load_lock:
+            if self._h_relations is None:
+                k_incquery = self._k_incquery
+
+                # one bulk query per pattern, concurrently
+                with ThreadPoolExecutor(max_workers=len(H_INDEXES)) as y_pool:
+                    h_futures = {si_pattern: y_pool.submit(k_incquery.execute, si_pattern,
+                        bindings=self._h_scope if 'artifactInfo' == si_pattern else {},
+                    ) for si_pattern in H_INDEXES}
+
+                    h_relations = {si_pattern: _Relation(y_future.result(), H_INDEXES[si_pattern]) for si_pattern, y_future in h_futures.items()}
+
+                # publish once complete
+                self._h_relations = h_relations
+
+            return self._h_relations
+
+    def is_local(self, name: str) -> bool:
+        '''
+        Whether queries against the given pattern are answered from the snapshot; views look up
+        such fields row by row rather than joining the whole pattern
+
+        :param name: the pattern name
+        '''
+        return name in H_INDEXES
+
+    def load(self):
+        '''
+        Load the snapshot now rather than on the first query
+        '''
+        self._load()
+
+    @property
+    def sizes(self) -> Dict[str, int]:
+        '''
+        Number of rows held per pattern; empty until loaded
+        '''
+        return {si_pattern: len(k_relation.rows) for si_pattern, k_relation in (self._h_relations or {}).items()}
+
+    # only queries restricted to the bulk query's scope can be answered from the snapshot
+    def _in_scope(self, h_bindings: Dict[str, Any]) -> bool:
+        return all(si_key in h_bindings and h_bindings[si_key] == z_value for si_key, z_value in self._h_scope.items())
+
+    def _union(self, h_bindings: Dict[str, Any]) -> List[Dict[str, Any]]:
+        '''
+        Evaluate a disjunctive pattern over `artifactInfo` compiled by `combine_unions`
+        '''
+        h_fixed = {}
+        h_accepted = collections.defaultdict(set)
+        for si_key, z_value in h_bindings.items():
+            m_union = R_UNION_BINDING.match(si_key)
+
+            # an accepted value of a multi-valued column
+            if m_union and m_union[1] in A_ARTIFACT_INFO_PARAMS:
+                h_accepted[m_union[1]].add(z_value)
+            # plain binding
+            else:
+                h_fixed[si_key] = z_value
+
+        a_rows = self._load()['artifactInfo'].select(h_fixed)
+
+        # value bindings are parameters of the pattern, so they appear in each row
+        h_params = {si_key: z_value for si_key, z_value in h_bindings.items() if si_key not in h_fixed}
+
+        return [{**g_row, **h_params} for g_row in a_rows if all(g_row.get(si_col) in as_values for si_col, as_values in h_accepted.items())]
+
+    def execute(self, name: str, patterns: Dict[str, str]={}, bindings: Dict[str, Any]={}, w_url_provider=None) -> List[Dict[str, Any]]:
+        # snapshotted pattern, not redefined by the caller
+        if name in H_INDEXES and name not in patterns and w_url_provider is None and ('artifactInfo' != name or self._in_scope(bindings)):
+            a_rows = self._load()[name].select(bindings)
+        # disjunctive pattern over artifactInfo
+        elif name in _H_UNION_PATTERNS and patterns.get(name) == _H_UNION_PATTERNS[name] and w_url_provider is None and self._in_scope(bindings):
+            a_rows = self._union(bindings)
+        # anything else goes to the server
+        else:
+            with self._y_lock:
+                self.fallbacks += 1
+            return self._k_incquery.execute(name, patterns=patterns, bindings=bindings, w_url_provider=w_url_provider)
+
+        with self._y_lock:
+            self.hits += 1
+
+        return a_rows
+
+    def extend_row(self, row: Dict[str, Any], query_field) -> List[Any]:
+        k_field = query_field
+
+        # apply field join to its bindings
+        h_bindings = {**k_field.bindings, **k_field.join(row)}
+
+        # execute query against the snapshot
+        a_rows = self.execute(name=k_field.query, bindings=h_bindings)
+
+        # map thru select function
+        return list(map(k_field.select, a_rows))
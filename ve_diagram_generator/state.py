@@ -0,0 +1,129 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+
+class PageState(NamedTuple):
+    '''
+    What a page was last rendered from
+    '''
+    version: int
+    templates: str
+    inputs: str
+
+
+class StateStore:
+    '''
+    Local record of the pages written by previous runs, stored in an SQLite database.
+    For each page it keeps the Confluence version that was last written (or found
+    unchanged), a fingerprint of the view template definitions used and a fingerprint
+    of the query inputs. It also keeps a reverse index from each view template to the
+    pages whose directives reference it.
+
+    :param file: path to the database file
+    '''
+    def __init__(self, file: str):
+        s_dir = os.path.dirname(file)
+        if s_dir:
+            os.makedirs(s_dir, exist_ok=True)
+
+        self._p_file = file
+        self._y_lock = threading.Lock()
+
+        # open database; access is serialized by the lock
+        self._y_db = sqlite3.connect(file, check_same_thread=False, isolation_level=None)
+        self._y_db.executescript('''
+            pragma journal_mode=wal;
+            create table if not exists pages (
+                page_id text primary key,
+                version integer not null,
+                templates text not null,
+                inputs text not null,
+                updated real not null
+            );
+            create table if not exists template_dependents (
+                template_iri text not null,
+                template_title text not null,
+                page_id text not null,
+                primary key (template_iri, page_id)
+            );
+            create index if not exists template_dependents_title on template_dependents(template_title);
+            create index if not exists template_dependents_page on template_dependents(page_id);
+        ''')
+
+    @property
+    def path(self) -> str:
+        return self._p_file
+
+    def get(self, page_id: str) -> Optional[PageState]:
+        '''
+        Return the recorded state of a page, or None if it has not been recorded
+
+        :param page_id: the Confluence page ID
+        '''
+        with self._y_lock:
+            a_row = self._y_db.execute('select version, templates, inputs from pages where page_id = ?', (page_id,)).fetchone()
+
+        return PageState(*a_row) if a_row is not None else None
+
+    def put(self, page_id: str, state: PageState):
+        '''
+        Record the state of a page
+
+        :param page_id: the Confluence page ID
+        :param state: the state to record
+        '''
+        with self._y_lock:
+            self._y_db.execute('insert or replace into pages (page_id, version, templates, inputs, updated) values (?, ?, ?, ?, ?)', (page_id, state.version, state.templates, state.inputs, time.time()))
+
+    def index_dependents(self, page_id: str, templates: Iterable[Tuple[str, str]]):
+        '''
+        Replace the set of view templates referenced by a page
+
+        :param page_id: the Confluence page ID
+        :param templates: (IRI, title) of each view template the page's directives reference
+        '''
+        with self._y_lock:
+            self._y_db.execute('begin')
+            self._y_db.execute('delete from template_dependents where page_id = ?', (page_id,))
+            self._y_db.executemany('insert or replace into template_dependents (template_iri, template_title, page_id) values (?, ?, ?)', [
+                (p_template, s_title, page_id) for (p_template, s_title) in templates
+            ])
+            self._y_db.execute('commit')
+
+    def prune_dependents(self, page_ids: Iterable[str], scope: Optional[Iterable[str]]=None):
+        '''
+        Forget the view templates recorded for pages that no longer have any directives
+
+        :param page_ids: IDs of the pages on which directives were discovered
+        :param scope: IDs of the pages discovery covered; None for the whole space
+        '''
+        as_found = set(page_ids)
+
+        with self._y_lock:
+            # every page in the index
+            if scope is None:
+                scope = [si_page for (si_page,) in self._y_db.execute('select distinct page_id from template_dependents').fetchall()]
+
+            a_removed = [(si_page,) for si_page in set(scope) if si_page not in as_found]
+
+            self._y_db.execute('begin')
+            self._y_db.executemany('delete from template_dependents where page_id = ?', a_removed)
+            self._y_db.execute('commit')
+
+    def dependents(self, template: str) -> List[str]:
+        '''
+        Return the IDs of pages whose directives reference the given view template
+
+        :param template: IRI or page title of the view template
+        '''
+        with self._y_lock:
+            a_rows = self._y_db.execute('select distinct page_id from template_dependents where template_iri = ? or template_title = ? order by page_id', (template, template)).fetchall()
+
+        return [si_page for (si_page,) in a_rows]
+
+    def close(self):
+        with self._y_lock:
+            self._y_db.close()
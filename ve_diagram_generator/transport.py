@@ -0,0 +1,375 @@
+import re
+import threading
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import opl
+import requests
+import urllib3
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from requests.adapters import HTTPAdapter
+from opl.sparql import S_PREFIXES_SPARQL, SB_PREFIXES_TURTLE
+
+
+class PoolStats(NamedTuple):
+    '''
+    Connection reuse observed by one client's pools
+    '''
+    requests: int
+    connections: int
+
+    @property
+    def reused(self) -> int:
+        return max(0, self.requests-self.connections)
+
+
+class _Counters:
+    '''
+    Thread-safe counts of requests sent and connections established
+    '''
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self._y_lock = threading.Lock()
+
+    def request(self):
+        with self._y_lock:
+            self.requests += 1
+
+    def connect(self):
+        with self._y_lock:
+            self.connections += 1
+
+
+# connection pool classes for a pool manager that count into the given counters
+def _counting_pool_classes(k_counters: _Counters) -> Dict[str, type]:
+    class _CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            k_counters.connect()
+            return super().connect()
+
+    class _CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            k_counters.connect()
+            return super().connect()
+
+    class _CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+        ConnectionCls = _CountingHTTPConnection
+
+        def urlopen(self, *args, **kwargs):
+            k_counters.request()
+            return super().urlopen(*args, **kwargs)
+
+    class _CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+        ConnectionCls = _CountingHTTPSConnection
+
+        def urlopen(self, *args, **kwargs):
+            k_counters.request()
+            return super().urlopen(*args, **kwargs)
+
+    return {
+        'http': _CountingHTTPConnectionPool,
+        'https': _CountingHTTPSConnectionPool,
+    }
+
+
+class _PooledAdapter(HTTPAdapter):
+    '''
+    Transport adapter for requests sessions that applies a default timeout and
+    optionally closes connections after each response
+    '''
+    def __init__(self, timeout: Tuple[float, float], keep_alive: bool, **kwargs):
+        self._w_timeout = timeout
+        self._b_keep_alive = keep_alive
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if not self._b_keep_alive:
+            request.headers['Connection'] = 'close'
+
+        return super().send(request, timeout=timeout if timeout is not None else self._w_timeout, **kwargs)
+
+
+class _PooledManager(urllib3.PoolManager):
+    '''
+    urllib3 pool manager that applies a default timeout to requests made without one
+    (generated API clients pass an explicit None) and optionally closes connections
+    after each response
+    '''
+    def __init__(self, timeout: urllib3.Timeout, keep_alive: bool, **kwargs):
+        self._y_timeout = timeout
+        self._b_keep_alive = keep_alive
+        super().__init__(timeout=timeout, **kwargs)
+
+    def urlopen(self, method, url, redirect=True, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self._y_timeout
+
+        if not self._b_keep_alive:
+            kwargs['headers'] = {**(kwargs.get('headers') or self.headers), 'Connection': 'close'}
+
+        return super().urlopen(method, url, redirect=redirect, **kwargs)
+
+
+class HttpPools:
+    '''
+    Creates the pooled HTTP connections used by the IncQuery, Confluence and SPARQL
+    clients of a run, so that connections (and their TLS sessions) are kept alive and
+    reused across views and pages, and keeps count of how often they are.
+
+    :param connect_timeout: seconds to wait for a connection to be established
+    :param read_timeout: seconds to wait for the server to send data
+    :param keep_alive: whether to keep connections open for reuse
+    '''
+    def __init__(self, connect_timeout: float=10, read_timeout: float=300, keep_alive: bool=True):
+        self._x_connect = connect_timeout
+        self._x_read = read_timeout
+        self._b_keep_alive = keep_alive
+        self._h_counters: Dict[str, _Counters] = {}
+        self._y_lock = threading.Lock()
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        '''
+        (connect, read) timeout, as accepted by requests
+        '''
+        return (self._x_connect, self._x_read)
+
+    # make a pool manager count into the counters of the named client
+    def _register(self, s_name: str, y_manager: urllib3.PoolManager):
+        with self._y_lock:
+            k_counters = self._h_counters.setdefault(s_name, _Counters())
+
+        y_manager.pool_classes_by_scheme = _counting_pool_classes(k_counters)
+
+    def adapter(self, name: str, pool_size: int) -> HTTPAdapter:
+        '''
+        Create a transport adapter for requests sessions
+
+        :param name: label of the client, used in statistics
+        :param pool_size: number of connections to keep per host
+        '''
+        y_adapter = _PooledAdapter(self.timeout, self._b_keep_alive,
+            pool_connections=4,
+            pool_maxsize=pool_size,
+        )
+        self._register(name, y_adapter.poolmanager)
+        return y_adapter
+
+    def mount(self, name: str, session: requests.Session, pool_size: int) -> requests.Session:
+        '''
+        Replace the transport of an existing session (keeping its auth and headers) with a pooled one
+
+        :param name: label of the client, used in statistics
+        :param session: the session to modify
+        :param pool_size: number of connections to keep per host
+        '''
+        y_adapter = self.adapter(name, pool_size)
+        session.mount('https://', y_adapter)
+        session.mount('http://', y_adapter)
+        return session
+
+    def session(self, name: str, pool_size: int) -> requests.Session:
+        '''
+        Create a new session with a pooled transport
+
+        :param name: label of the client, used in statistics
+        :param pool_size: number of connections to keep per host
+        '''
+        return self.mount(name, requests.Session(), pool_size)
+
+    def pool_manager(self, name: str, pool_size: int, **kwargs) -> urllib3.PoolManager:
+        '''
+        Create a urllib3 pool manager, e.g., for a generated API client's REST client
+
+        :param name: label of the client, used in statistics
+        :param pool_size: number of connections to keep per host
+        :param kwargs: further keyword arguments for the connection pools, e.g., TLS settings
+        '''
+        y_manager = _PooledManager(urllib3.Timeout(connect=self._x_connect, read=self._x_read), self._b_keep_alive, **{
+            **kwargs,
+            'num_pools': 4,
+            'maxsize': pool_size,
+        })
+        self._register(name, y_manager)
+        return y_manager
+
+    def stats(self) -> Dict[str, PoolStats]:
+        '''
+        Requests sent and connections established so far, per client
+        '''
+        with self._y_lock:
+            return {s_name: PoolStats(k_counters.requests, k_counters.connections) for s_name, k_counters in self._h_counters.items()}
+
+
+def pool_incquery(pools: HttpPools, incquery: opl.IncQueryProject, pool_size: int) -> bool:
+    '''
+    Route an IncQuery client's requests through pooled connections
+
+    :param pools: the HttpPools to create the connections from
+    :param incquery: the (unbound) IncQuery client
+    :param pool_size: number of connections to keep
+    :return: False if the client's transport could not be replaced (e.g., it goes through a proxy)
+    '''
+    y_rest = getattr(getattr(incquery, '_y_incquery', None), 'rest_client', None)
+    y_manager = getattr(y_rest, 'pool_manager', None)
+
+    # unknown client layout, or proxied
+    if not isinstance(y_manager, urllib3.PoolManager) or isinstance(y_manager, urllib3.ProxyManager):
+        return False
+
+    # keep the TLS settings the client was configured with
+    h_pool_kw = {si_key: z_value for si_key, z_value in y_manager.connection_pool_kw.items() if si_key not in ('maxsize', 'block', 'timeout')}
+
+    y_rest.pool_manager = pools.pool_manager('IncQuery', pool_size, **h_pool_kw)
+    y_manager.clear()
+
+    return True
+
+
+def pool_confluence(pools: HttpPools, confluence: opl.Confluence, pool_size: int) -> bool:
+    '''
+    Route a Confluence client's requests through pooled connections
+
+    :param pools: the HttpPools to create the connections from
+    :param confluence: the Confluence client
+    :param pool_size: number of connections to keep
+    :return: False if the client's transport could not be replaced
+    '''
+    y_client = confluence._y_confluence
+    y_session = getattr(y_client, '_session', None)
+
+    # unknown client layout
+    if not isinstance(y_session, requests.Session):
+        return False
+
+    pools.mount('Confluence', y_session, pool_size)
+    y_client.timeout = pools.timeout
+
+    return True
+
+
+# escape sequences within quoted literals of SPARQL TSV results
+R_TSV_ESCAPE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+
+H_TSV_ESCAPES = {
+    't': '\t',
+    'n': '\n',
+    'r': '\r',
+    'b': '\b',
+    'f': '\f',
+}
+
+P_XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+# pattern for literals of SPARQL TSV results
+R_TSV_LITERAL = re.compile(r'^"(.*)"(?:@([\w-]+)|\^\^<([^>]*)>)?$', re.S)
+
+
+def _tsv_unescape(m_escape) -> str:
+    s_escape = m_escape.group(1)
+    if s_escape[0] in 'uU' and len(s_escape) > 1:
+        return chr(int(s_escape[1:], 16))
+    return H_TSV_ESCAPES.get(s_escape, s_escape)
+
+
+# parse an RDF term from SPARQL TSV results into the form used by SPARQL JSON results
+def _tsv_term(s_term: str) -> Optional[Dict[str, str]]:
+    # unbound
+    if not s_term:
+        return None
+
+    # IRI
+    if s_term.startswith('<') and s_term.endswith('>'):
+        return {'type': 'uri', 'value': s_term[1:-1]}
+
+    # blank node
+    if s_term.startswith('_:'):
+        return {'type': 'bnode', 'value': s_term[2:]}
+
+    # quoted literal
+    m_literal = R_TSV_LITERAL.match(s_term)
+    if m_literal:
+        g_term = {'type': 'literal', 'value': R_TSV_ESCAPE.sub(_tsv_unescape, m_literal.group(1))}
+        if m_literal.group(2):
+            g_term['xml:lang'] = m_literal.group(2)
+        elif m_literal.group(3):
+            g_term['datatype'] = m_literal.group(3)
+        return g_term
+
+    # bare boolean or numeric literal
+    if s_term in ('true', 'false'):
+        return {'type': 'literal', 'value': s_term, 'datatype': P_XSD+'boolean'}
+
+    return {'type': 'literal', 'value': s_term, 'datatype': P_XSD+('double' if 'e' in s_term.lower() else 'decimal' if '.' in s_term else 'integer')}
+
+
+class PooledSparql(opl.Sparql):
+    '''
+    SPARQL client that submits queries over a pooled requests session rather than
+    opening a new connection for every query
+
+    :param endpoint: full URL to the SPARQL endpoint
+    :param session: the session to submit queries with
+    :param timeout: (connect, read) timeout in seconds; defaults to the session's transport
+    '''
+    def __init__(self, endpoint: str, session: requests.Session, timeout: Optional[Tuple[float, float]]=None):
+        super().__init__(endpoint)
+        self._y_session = session
+        self._w_timeout = timeout
+
+    def _post(self, sq_query: str, s_accept: str, b_stream: bool=False) -> requests.Response:
+        sq_full = S_PREFIXES_SPARQL+'\n'+sq_query
+
+        try:
+            y_response = self._y_session.post(self._p_endpoint,
+                data={
+                    'query': sq_full,
+                    'infer': 'false',
+                    'sameAs': 'false',
+                },
+                headers={
+                    'Accept': s_accept,
+                },
+                timeout=self._w_timeout,
+                stream=b_stream,
+            )
+            y_response.raise_for_status()
+        except Exception as e_query:
+            raise Exception(f'while querying """\n{sq_full}"""') from e_query
+
+        return y_response
+
+    def construct(self, query: str) -> bytes:
+        return SB_PREFIXES_TURTLE+self._post(query, 'text/turtle').content
+
+    def fetch(self, query: str) -> List[Dict[str, Any]]:
+        return self._post(query, 'application/sparql-results+json').json()['results']['bindings']
+
+    def stream(self, query: str) -> Iterator[Dict[str, Dict[str, str]]]:
+        '''
+        Submit a SPARQL SELECT query and return an iterator that parses result rows as
+        they arrive, in the same form as the rows returned by `fetch`. The request is sent
+        (and any HTTP error raised) before this returns.
+
+        :param query: the SPARQL SELECT query string to submit. Prefixes are prepended automatically
+        '''
+        return self._rows(self._post(query, 'text/tab-separated-values', True))
+
+    def _rows(self, y_response: requests.Response) -> Iterator[Dict[str, Dict[str, str]]]:
+        with y_response:
+            di_lines = y_response.iter_lines(decode_unicode=False)
+
+            # header line lists the variables
+            a_vars = [s_var.lstrip('?$') for s_var in next(di_lines, b'').decode('utf-8').split('\t')]
+
+            for xb_line in di_lines:
+                if not xb_line:
+                    continue
+
+                g_row = {}
+                for si_var, s_term in zip(a_vars, xb_line.decode('utf-8').split('\t')):
+                    g_term = _tsv_term(s_term)
+                    if g_term is not None:
+                        g_row[si_var] = g_term
+
+                yield g_row
@@ -1,11 +1,17 @@
+import io
 import abc
-import re
+import json
+import collections
 import uuid
-from typing import Dict, List, NamedTuple
+import hashlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+from xml.sax.saxutils import escape
 
 from lxml import etree
 from opl import QueryResultsTable
 
+from .layout import Layout, to_svg
+
 
 # type aliases
 Hash = Dict[str, str]
@@ -31,36 +37,166 @@ H_NAMESPACES = {si_ns: f'{P_URN_NS}{si_ns}' for si_ns in AS_PREFIXES}
 # prepare XHTML namespace declaration string
 SX_NAMESPACES = ' '.join([f'xmlns:{si_ns}="{P_URN_NS}{si_ns}"' for si_ns in AS_PREFIXES])
 
-# need to preserve CDATA when parsing XHTML
-Y_LXML_PARSER = etree.XMLParser(strip_cdata=False)
-
 # entity replacements hash
 H_ENTITY_REPLACEMENTS = {
     '&nbsp;': '&#160;'
 }
 
+# document prologue declaring the replacement entities so that the parser resolves them itself
+SX_PROLOGUE = f'<!DOCTYPE {SI_ROOT} ['+''.join([f'<!ENTITY {s_entity[1:-1]} "{s_replace}">' for s_entity, s_replace in H_ENTITY_REPLACEMENTS.items()])+']>'
+
+# size of the chunks (in characters) fed to the incremental parser; small chunks stay in CPU caches
+N_PARSE_CHUNK = 4*1024
+
+# namespace declarations that lxml copies from the root onto a child serialized on its own
+A_XB_NS_DECLARATIONS = [f' xmlns:{si_ns}="{P_URN_NS}{si_ns}"'.encode() for si_ns in AS_PREFIXES]
+
+# escapes of text content in addition to '&', '<' and '>'
+H_TEXT_ESCAPES = {
+    '\r': '&#13;',
+}
+
 
 # produce a unique namespace for arbitrary XHTML tags having expected prefixes
 def _lxml_ns(si_ns: str, s_local: str='') -> str:
     return '{'+P_URN_NS+si_ns+'}'+s_local
 
 
+# qualified names of elements and attributes used for indexing
+T_AC_MACRO = _lxml_ns('ac', 'structured-macro')
+T_AC_PARAMETER = _lxml_ns('ac', 'parameter')
+T_AC_PLAIN_TEXT_LINK_BODY = _lxml_ns('ac', 'plain-text-link-body')
+T_AC_RICH_TEXT_BODY = _lxml_ns('ac', 'rich-text-body')
+T_RI_PAGE = _lxml_ns('ri', 'page')
+A_AC_NAME = _lxml_ns('ac', 'name')
+A_AC_MACRO_ID = _lxml_ns('ac', 'macro-id')
+A_RI_CONTENT_TITLE = _lxml_ns('ri', 'content-title')
+A_RI_SPACE_KEY = _lxml_ns('ri', 'space-key')
+
+# precompiled xpath expressions
+X_PARAM_ID = etree.XPath('./ac:parameter[@ac:name="id"]', namespaces=H_NAMESPACES)
+X_PARAM_ID_TEXT = etree.XPath('./ac:parameter[@ac:name="id"]/text()', namespaces=H_NAMESPACES)
+X_PARAM_STYLE = etree.XPath('./ac:parameter[@ac:name="style"]', namespaces=H_NAMESPACES)
+X_PARAM_TEXT = etree.XPath('./ac:parameter[@ac:name="text"]', namespaces=H_NAMESPACES)
+X_RICH_TEXT_BODY = etree.XPath('./ac:rich-text-body', namespaces=H_NAMESPACES)
+X_RICH_TEXT_BODY_TEXT = etree.XPath('./ac:rich-text-body//text()', namespaces=H_NAMESPACES)
+X_PLAIN_TEXT_BODY_TEXT = etree.XPath('./ac:plain-text-body//text()', namespaces=H_NAMESPACES)
+X_LINK_PAGE = etree.XPath('.//ac:link/ri:page', namespaces=H_NAMESPACES)
+X_LINK_PAGE_SPACE_KEY = etree.XPath('.//ac:link/ri:page/@ri:space-key', namespaces=H_NAMESPACES)
+X_LINK_PAGE_CONTENT_TITLE = etree.XPath('.//ac:link/ri:page/@ri:content-title', namespaces=H_NAMESPACES)
+
+
+# parse a sequence of XHTML string chunks into a wrapped lxml document
+def _lxml_from_chunks(i_chunks):
+    # incremental parsers are stateful, so each document gets its own; need to preserve CDATA
+    y_parser = etree.XMLParser(strip_cdata=False)
+
+    # wrap the content with a root node
+    y_parser.feed(f'{SX_PROLOGUE}<{SI_ROOT} {SX_NAMESPACES}>')
+    for s_chunk in i_chunks:
+        y_parser.feed(s_chunk)
+    y_parser.feed(f'</{SI_ROOT}>')
+
+    return y_parser.close()
+
+
 # parse a simple XHTML string into a wrapped lxml document
 def _lxml_from_string(s_content: str):
-    for s_entity, s_replace in H_ENTITY_REPLACEMENTS.items():
-        s_content = s_content.replace(s_entity, s_replace)
+    return _lxml_from_chunks(s_content[i_chunk:i_chunk+N_PARSE_CHUNK] for i_chunk in range(0, len(s_content), N_PARSE_CHUNK))
 
-    # wrap the content with a root node
-    return etree.fromstring(f'<{SI_ROOT} {SX_NAMESPACES}>'+s_content+f'</{SI_ROOT}>', parser=Y_LXML_PARSER)
 
+class _ChildWriter:
+    '''
+    Binary file-like sink for the serialization of one child of the wrapping root element;
+    drops the namespace declarations that lxml copies from the root onto the child's opening tag
+    '''
+    def __init__(self, y_output):
+        self._y_output = y_output
+        self._xb_head = b''
+
+    def write(self, xb_chunk: bytes):
+        # opening tag already forwarded
+        if self._xb_head is None:
+            self._y_output.write(xb_chunk)
+            return
+
+        # still within the opening tag; '>' is always escaped in attribute values
+        self._xb_head += xb_chunk
+        i_end = self._xb_head.find(b'>')
+        if i_end < 0:
+            return
+
+        xb_tag = self._xb_head[:i_end]
+        for xb_declaration in A_XB_NS_DECLARATIONS:
+            xb_tag = xb_tag.replace(xb_declaration, b'', 1)
+
+        self._y_output.write(xb_tag)
+        self._y_output.write(self._xb_head[i_end:])
+        self._xb_head = None
+
+    def close(self):
+        if self._xb_head:
+            self._y_output.write(self._xb_head)
+
+
+# write text between elements, escaped as lxml would
+def _write_text(s_text: str, y_output):
+    if s_text:
+        y_output.write(escape(s_text, H_TEXT_ESCAPES).encode('utf-8'))
+
+
+# write the content of a wrapped lxml document to a binary file-like object as UTF-8 encoded simple XHTML
+def _lxml_write(ye_root, y_output):
+    # not a wrapped document (e.g., a single element); write as is
+    if SI_ROOT != ye_root.tag:
+        etree.ElementTree(ye_root).write(y_output, encoding='utf-8')
+        return
+
+    # leading text, without the whitespace preceding the content
+    nl_children = len(ye_root)
+    _write_text((ye_root.text or '').lstrip() if nl_children else (ye_root.text or '').strip(), y_output)
+
+    # each child goes straight to the output; non-ASCII characters are written as such since,
+    # inside CDATA, character references would not be resolved when parsed again
+    for i_child, ye_child in enumerate(ye_root):
+        # element
+        if isinstance(ye_child.tag, str):
+            y_writer = _ChildWriter(y_output)
+            with etree.xmlfile(y_writer, encoding='utf-8') as y_xml:
+                y_xml.write(ye_child, with_tail=False)
+            y_writer.close()
+        # comment or processing instruction
+        else:
+            y_output.write(etree.tostring(ye_child, encoding='utf-8', with_tail=False))
+
+        # text following the child, without the whitespace following the content
+        s_tail = ye_child.tail or ''
+        _write_text(s_tail.rstrip() if i_child == nl_children-1 else s_tail, y_output)
 
-# convert a wrapped lxml document into a simple XHTML string
+
+# convert a wrapped lxml document into a simple XHTML string; holds the encoded output
+# alongside the string, so use `_lxml_write` where the output can be consumed incrementally
 def _lxml_to_string(ye_root) -> str:
-    # serialize entire document
-    s_doc = etree.tostring(ye_root).decode()
+    y_buffer = io.BytesIO()
+    _lxml_write(ye_root, y_buffer)
+
+    with y_buffer.getbuffer() as xb_view:
+        return str(xb_view, 'utf-8')
+
+# derive a stable UUID-formatted id from content so that re-rendering unchanged data yields identical XHTML
+def _content_id(*a_parts: str) -> str:
+    return str(uuid.UUID(bytes=hashlib.sha256('\x1f'.join(a_parts).encode()).digest()[:16]))
+
+
+# digest of rows as returned by a query
+def _rows_digest(a_rows) -> str:
+    return hashlib.sha256(json.dumps(a_rows, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# digest of the canonical form of an lxml tree; insensitive to serialization details such as attribute order
+def _canonical_digest(ye_root) -> str:
+    return hashlib.sha256(etree.tostring(ye_root, method='c14n')).hexdigest()
 
-    # remove dummy root element
-    return re.sub(r'^\s*<'+SI_ROOT+r'[^>]*>\s*|\s*<\/'+SI_ROOT+r'>\s*$', '', s_doc)
 
 def _expand_ns(sx_input):
     for si_ns in AS_PREFIXES:
@@ -119,7 +255,7 @@ def _span(id=None, class_name=None, hidden=False, body=None):
     a_children = []
 
     if b_hidden is True:
-        a_children.append(_macro_param('style', text='display:none'))
+        a_children.append(_macro_param('style', 'display:none'))
 
     if s_class is not None:
         a_children.append(_macro_param('class', s_class))
@@ -127,14 +263,10 @@ def _span(id=None, class_name=None, hidden=False, body=None):
     if s_id is not None:
         a_children.append(_macro_param('id', s_id))
 
-    # create new macro uuid
-    si_macro = str(uuid.uuid4())
-
-    # construct element and return tuple
-    return (si_macro, _element('ac:structured-macro', {
+    # construct element
+    ye_span = _element('ac:structured-macro', {
         'ac:name': 'span',
         'ac:schema-version': '1',
-        'ac:macro-id': si_macro
     }, children=a_children+[
         _element('ac:parameter', {
             'ac:name': 'atlassian-macro-output-type',
@@ -144,71 +276,316 @@ def _span(id=None, class_name=None, hidden=False, body=None):
             #     _element('p', children=a_body),
             # ]
         ),
-    ]))
+    ])
 
+    # derive macro id from content
+    si_macro = _content_id(etree.tostring(ye_span).decode())
+    ye_span.set(_lxml_ns('ac', 'macro-id'), si_macro)
 
-# promote an inferred page title directive to an annotated span
-def _promote_directive_page_title(g_directive, sx_document: str):
-    si_page = g_directive['directive_page_id']['value']
+    # return tuple
+    return (si_macro, ye_span)
 
-    # parse document
-    ye_root = _lxml_from_string(sx_document)
 
-    # extract page title from directive bindings
-    si_title = g_directive['directive_page_title']['value'].replace('"', '')
+# whether an element sits within a span that already belongs to a view (i.e., has a view id)
+def _within_view_span(ye_elmt) -> bool:
+    for ye_macro in ye_elmt.iterancestors(T_AC_MACRO):
+        if 'span' == ye_macro.get(A_AC_NAME):
+            for s_id in X_PARAM_ID_TEXT(ye_macro):
+                if s_id.startswith(SI_VIEW_PREFIX+'-'):
+                    return True
+    return False
 
-    # narrow results so we replace correct link
-    sx_filter = ''
-    if 'directive_link_text' in g_directive:
-        s_text = g_directive['directive_link_text']['value']
-        # cannot match with quote in xpath query
-        if '"' not in s_text:
-            sx_filter += f'[following-sibling::ac:plain-text-link-body[text()="{s_text}"]]'
-
-    # prepare xpath query
+
+# whether a page reference is followed by a link body having the given text
+def _has_link_text(ye_ref, s_text: str) -> bool:
+    for ye_sibling in ye_ref.itersiblings(T_AC_PLAIN_TEXT_LINK_BODY):
+        if ye_sibling.text == s_text:
+            return True
+    return False
+
+
+# promote an inferred page title directive to an annotated span; returns the span element
+def _promote_directive_page_title(g_directive, document: 'Document'):
+    si_page = g_directive['directive_page_id']['value']
+
+    # extract page title and space from directive bindings
+    si_title = g_directive['directive_page_title']['value']
     si_space = g_directive['space_id']['value']
-    sx_space = f'[not(@ri:space-key) or @ri:space-key="{si_space}"]'
-    sx_content_title = f'[@ri:content-title="{si_title}"]'
-    sx_id_param = f'ac:parameter[@ac:name="id"][starts-with(text(),"{SI_VIEW_PREFIX}-")]'
-    sx_naked = f'[not(ancestor::ac:structured-macro[@ac:name="span"][child::{sx_id_param}])]'
-    sx_xpath = f'.//ri:page{sx_space}{sx_content_title}{sx_naked}{sx_filter}'
 
-    # evaluate xpath to find directive
-    a_refs = ye_root.xpath(sx_xpath, namespaces=H_NAMESPACES)
+    # narrow results so we replace correct link
+    s_text = g_directive['directive_link_text']['value'] if 'directive_link_text' in g_directive else None
 
-    # no matching elements found
-    if 0 == len(a_refs):
-        raise Exception(f'could not find page reference using XPath `{sx_xpath}`')
+    # find directive among references to the page title
+    ye_ref = None
+    for ye_candidate in document.page_refs(si_title):
+        # page reference is to another space
+        if ye_candidate.get(A_RI_SPACE_KEY) not in (None, si_space):
+            continue
+
+        # link text does not match
+        if s_text is not None and not _has_link_text(ye_candidate, s_text):
+            continue
+
+        # already promoted
+        if _within_view_span(ye_candidate):
+            continue
+
+        # take first match
+        ye_ref = ye_candidate
+        break
 
-    # take first match
-    ye_ref = a_refs[0]
+    # no matching elements found
+    if ye_ref is None:
+        raise Exception(f'could not find a page reference to "{si_title}" in space "{si_space}"'+(f' with link text "{s_text}"' if s_text is not None else '')+' outside of an existing view')
 
     # nav to parent
     ye_directive = ye_ref.getparent()
-    
-    # build structured macro element
+
+    # remember where the directive sits; its tail text stays in place
+    ye_parent = ye_directive.getparent()
+    i_position = ye_parent.index(ye_directive)
+    s_tail = ye_directive.tail
+    ye_directive.tail = None
+
+    # detach the directive
+    document.unindex(ye_directive)
+    ye_parent.remove(ye_directive)
+
+    # build structured macro element around the directive element itself
     (si_macro, ye_command) = _span(
         class_name='insertTable',
         body=[
-            _element('p', children=list(
-                _lxml_from_string(_lxml_to_string(ye_directive)),
-            )),
+            _element('p', children=[ye_directive]),
         ],
     )
 
-    # replace the directive with the structured macro
-    ye_directive.getparent().replace(ye_directive, ye_command)
+    # identical directives yield identical content; keep macro ids unique within the document
+    i_duplicate = 0
+    si_content = si_macro
+    while document.macro(si_macro) is not None:
+        i_duplicate += 1
+        si_macro = _content_id(si_content, str(i_duplicate))
+    ye_command.set(A_AC_MACRO_ID, si_macro)
+
+    # put the structured macro where the directive was
+    ye_command.tail = s_tail
+    ye_parent.insert(i_position, ye_command)
+    document.index(ye_command)
+
+    # return the promoted directive
+    return ye_command
+
+
+# promote an inferred directive link to an annotated span; returns the span element
+def _promote_directive_link(g_directive, document: 'Document'):
+    return None
+
+
+# remove an element (by identity) from the list stored under a key
+def _remove_identity(h_index, si_key, ye_elmt):
+    a_elmts = h_index.get(si_key)
+    if a_elmts:
+        a_elmts[:] = [ye_other for ye_other in a_elmts if ye_other is not ye_elmt]
+
+
+# append rewritten cell content, which may be an element, a list of elements or an XHTML string
+def _append_cell_content(ye_cell, z_content):
+    # XHTML string
+    if isinstance(z_content, str):
+        ye_wrapper = _lxml_from_string(z_content)
+        ye_cell.text = ye_wrapper.text
+        a_content = list(ye_wrapper)
+    # element
+    elif etree.iselement(z_content):
+        a_content = [z_content]
+    # list of elements
+    else:
+        a_content = list(z_content)
+
+    for ye_content in a_content:
+        ye_cell.append(ye_content)
+
+
+# build the table of query results directly as elements
+def _table_element(k_results: QueryResultsTable, span_id: str, macro_id: str):
+    h_labels = k_results.labels
+    h_rewriters = k_results.rewriters or {}
+    a_rows = k_results.rows
+
+    # annotated span
+    ye_span = _ac_element('structured-macro', {
+        'name': 'span',
+        'schema-version': '1',
+        'macro-id': macro_id,
+    })
+    ye_span.append(_macro_param('id', span_id))
+    ye_span.append(_macro_param('atlassian-macro-output-type', 'INLINE'))
+    ye_body = etree.SubElement(ye_span, T_AC_RICH_TEXT_BODY)
+
+    # cursor target before
+    etree.SubElement(etree.SubElement(ye_body, 'p', {'class': 'auto-cursor-target'}), 'br')
+
+    # empty results and no labels
+    if not a_rows and h_labels is None:
+        etree.SubElement(ye_body, 'p').text = 'No query results and no column headers were provided. Nothing to display.'
+    else:
+        # default labels to column ids
+        if h_labels is None:
+            h_labels = {si_col: si_col for si_col in a_rows[0]}
+
+        ye_tbody = etree.SubElement(etree.SubElement(ye_body, 'table'), 'tbody')
+
+        # header row
+        ye_tr = etree.SubElement(ye_tbody, 'tr')
+        for s_label in h_labels.values():
+            etree.SubElement(ye_tr, 'th').text = s_label
+
+        # data rows
+        for g_row in a_rows:
+            ye_tr = etree.SubElement(ye_tbody, 'tr')
+            for si_col in h_labels:
+                z_value = g_row.get(si_col)
+                ye_td = etree.SubElement(ye_tr, 'td')
+
+                # column has rewriter
+                if si_col in h_rewriters:
+                    _append_cell_content(ye_td, h_rewriters[si_col](z_value, g_row))
+                # value is a list
+                elif isinstance(z_value, list):
+                    ye_ul = etree.SubElement(ye_td, 'ul')
+                    for s_value in z_value:
+                        etree.SubElement(ye_ul, 'li').text = s_value
+                # simple string
+                elif z_value is not None:
+                    ye_td.text = z_value
+
+    # cursor target after
+    etree.SubElement(etree.SubElement(ye_body, 'p', {'class': 'auto-cursor-target'}), 'br')
+
+    return ye_span
+
+
+class Document:
+    '''
+    A Confluence XHTML document that is parsed once and shared by every view
+    rendered onto the same page. Views modify the shared tree in place and the
+    document is serialized once, after all directives have been applied.
+    '''
+    def __init__(self, content: str):
+        '''
+        Parse a Confluence XHTML document
+
+        :param content: the Confluence XHTML document string
+        '''
+        sx_content = content
+        try:
+            self._ye_root = _lxml_from_string(sx_content)
+        except etree.XMLSyntaxError:
+            print(f'XML Syntax Error in document: """\n{sx_content}\n"""')
+            raise
+
+        # fingerprint of the document as parsed
+        self._s_digest = _canonical_digest(self._ye_root)
+
+        # macro index
+        self._h_macros = collections.defaultdict(list)
+        self._h_ids = collections.defaultdict(list)
+        self._h_page_refs = collections.defaultdict(list)
+        self.index(self._ye_root)
+
+    @property
+    def root(self):
+        return self._ye_root
+
+    def index(self, subtree):
+        '''
+        Add the macros, id parameters and page references within a subtree to the
+        document's index. Must be called after inserting elements into the document.
+
+        :param subtree: the element to index, along with its descendants
+        '''
+        for ye_elmt in subtree.iter(T_AC_MACRO, T_AC_PARAMETER, T_RI_PAGE):
+            # macro
+            if T_AC_MACRO == ye_elmt.tag:
+                si_macro = ye_elmt.get(A_AC_MACRO_ID)
+                if si_macro is not None:
+                    self._h_macros[si_macro].append(ye_elmt)
+            # id parameter of a macro
+            elif T_AC_PARAMETER == ye_elmt.tag:
+                if 'id' == ye_elmt.get(A_AC_NAME) and ye_elmt.text:
+                    self._h_ids[ye_elmt.text.strip()].append(ye_elmt.getparent())
+            # page reference
+            else:
+                s_title = ye_elmt.get(A_RI_CONTENT_TITLE)
+                if s_title is not None:
+                    self._h_page_refs[s_title].append(ye_elmt)
+
+    def unindex(self, subtree):
+        '''
+        Remove the macros, id parameters and page references within a subtree from
+        the document's index. Must be called before removing elements from the document
+        or changing the text of their id parameters; lookups trust the index and do not
+        check whether an element is still part of the document.
 
-    # reserialize document
-    sx_output = _lxml_to_string(ye_root)
+        :param subtree: the element to unindex, along with its descendants
+        '''
+        for ye_elmt in subtree.iter(T_AC_MACRO, T_AC_PARAMETER, T_RI_PAGE):
+            # macro
+            if T_AC_MACRO == ye_elmt.tag:
+                _remove_identity(self._h_macros, ye_elmt.get(A_AC_MACRO_ID), ye_elmt)
+            # id parameter of a macro
+            elif T_AC_PARAMETER == ye_elmt.tag:
+                if 'id' == ye_elmt.get(A_AC_NAME) and ye_elmt.text:
+                    _remove_identity(self._h_ids, ye_elmt.text.strip(), ye_elmt.getparent())
+            # page reference
+            else:
+                _remove_identity(self._h_page_refs, ye_elmt.get(A_RI_CONTENT_TITLE), ye_elmt)
+
+    def macro(self, macro_id: str):
+        '''
+        Find the structured macro having the given macro id, or None
 
-    # return macro id and output as tuple
-    return (si_macro, sx_output)
+        :param macro_id: the `ac:macro-id` attribute value
+        '''
+        a_macros = self._h_macros.get(macro_id)
+        return a_macros[0] if a_macros else None
 
+    def macros_with_id(self, id: str) -> list:
+        '''
+        Find the structured macros having an `id` parameter with the given value, in indexing order
 
-# promote an inferred directive link to an annotated span
-def _promote_directive_link(g_directive, sx_document: str):
-    return ('N/A', sx_document)
+        :param id: the `id` parameter value
+        '''
+        return list(self._h_ids.get(id, []))
+
+    def page_refs(self, title: str) -> list:
+        '''
+        Find the `ri:page` references having the given content title, in indexing order
+
+        :param title: the `ri:content-title` attribute value
+        '''
+        return list(self._h_page_refs.get(title, []))
+
+    @property
+    def changed(self) -> bool:
+        '''
+        Whether the document differs in canonical form from the content it was parsed from
+        '''
+        return _canonical_digest(self._ye_root) != self._s_digest
+
+    def to_string(self) -> str:
+        '''
+        Serialize the document back into a Confluence XHTML string
+        '''
+        return _lxml_to_string(self._ye_root)
+
+    def write(self, output):
+        '''
+        Serialize the document as UTF-8 encoded Confluence XHTML into a binary file-like object, incrementally
+
+        :param output: object with a `write(bytes)` method
+        '''
+        _lxml_write(self._ye_root, output)
 
 
 class View(metaclass=abc.ABCMeta):
@@ -218,22 +595,21 @@ class View(metaclass=abc.ABCMeta):
     A view 'render' is the rendered element that is a result of evaluating the
         user input against a predefined dataset.
     '''
-    def __init__(self, document: str, view_id: str=None):
+    def __init__(self, document: Union[str, Document], view_id: str=None):
         '''
         Create a View object for manipulating elements within a Confluence XHTML document
 
-        :param document: the Confluence XHTML document
+        :param document: the Confluence XHTML document, either as a string or as a
+            parsed Document shared with other views on the same page
         :param view_id: the unique ID of the view if referencing an existing view
             or None/ommitted to create a new view
         '''
-        sx_document = document
-        try:
-            self._ye_root = _lxml_from_string(sx_document)
-        except etree.XMLSyntaxError:
-            print(f'XML Syntax Error in document: """\n{sx_document}\n"""')
-            raise
-        except:
-            raise
+        # parse string into a document of its own
+        if isinstance(document, str):
+            document = Document(document)
+
+        self._k_document = document
+        self._ye_root = document.root
 
         self._si_view = view_id or uuid.uuid4().hex
 
@@ -251,20 +627,24 @@ class View(metaclass=abc.ABCMeta):
         Clear any existing renders belonging to this view
         '''
         # find any existing rendered view renders if they exists
-        a_renders = self._ye_root.xpath('.//ac:parameter[@ac:name="id"][text()="{span_id}"]/..'.format(
-            span_id=self._local_id('render')+'-'+self._si_view
-        ), namespaces=H_NAMESPACES)
+        a_renders = self._k_document.macros_with_id(self._local_id('render')+'-'+self._si_view)
 
         # remove all of them
         for ye_render in a_renders:
+            self._k_document.unindex(ye_render)
             ye_render.getparent().remove(ye_render)
 
-    def _insert(self, _ye_render) -> str:
+    @property
+    def document(self) -> Document:
+        return self._k_document
+
+    def _insert(self, _ye_render) -> Document:
         # insert view render element at the top of the page
         self._ye_root.insert(0, _ye_render)
+        self._k_document.index(_ye_render)
 
-        # return modified content
-        return _lxml_to_string(self._ye_root)
+        # return modified document
+        return self._k_document
 
 
 class MacroNotFoundException(Exception):
@@ -275,11 +655,12 @@ class MacroNotFoundException(Exception):
 
 
 class DirectedView(View, metaclass=abc.ABCMeta):
-    def __init__(self, document: str, directive_macro_id: str, extras: Dict[str, Hash]={}):
+    def __init__(self, document: Union[str, Document], directive_macro_id: str, extras: Dict[str, Hash]={}):
         '''
         Create a View object for manipulating elements within a Confluence XHTML document
 
-        :param document: the Confluence XHTML document
+        :param document: the Confluence XHTML document, either as a string or as a
+            parsed Document shared with other views on the same page
         :param directive_macro_id: the globally unique macro id of the view's directive
         '''
         si_macro = directive_macro_id
@@ -287,23 +668,26 @@ class DirectedView(View, metaclass=abc.ABCMeta):
         # construct super
         super().__init__(document)
 
+        # save macro id
+        self._si_macro = si_macro
+
         # find view directive
-        self._ye_directive = self._ye_root.find(f'.//ac:structured-macro[@ac:macro-id="{si_macro}"]', H_NAMESPACES)
+        self._ye_directive = self._k_document.macro(si_macro)
 
         # macro does not exist
         if self._ye_directive is None:
             raise MacroNotFoundException(f'{self.__class__.__name__} macro with the id "{si_macro}" was not found in the given document; likely the Confluence wiki page and the RDF graph are out of sync')
 
         # deduce directive id if one exists
-        a_xpaths = self._ye_directive.xpath('./ac:parameter[@ac:name="id"]/text()', namespaces=H_NAMESPACES)
+        a_xpaths = X_PARAM_ID_TEXT(self._ye_directive)
         if a_xpaths is not None and len(a_xpaths) and '' != a_xpaths[0].strip():
             self._si_directive = a_xpaths[0].strip()
 
             # extract view id and overwrite super's field
             self._si_view = self._si_directive.replace(self._local_id('directive')+'-', '', 1)
-        # otherwise generate uuid
+        # otherwise derive one from the directive's macro id
         else:
-            self._si_view = uuid.uuid4().hex
+            self._si_view = uuid.UUID(_content_id(si_macro)).hex
             self._si_directive = self._local_id('directive')+'-'+self._si_view
 
         self._parse_directive(extras)
@@ -315,42 +699,47 @@ class DirectedView(View, metaclass=abc.ABCMeta):
         return None
 
 
-    def _directive_text():
+    def _directive_text(self):
         ye_directive = self._ye_directive
 
         # rich text body; join all text within
-        if len(ye_directive.findall('./ac:rich-text-body', H_NAMESPACES)):
-            return ' '.join(ye_directive.xpath('./ac:rich-text-body//text()', namespaces=H_NAMESPACES))
+        if len(X_RICH_TEXT_BODY(ye_directive)):
+            return ' '.join(X_RICH_TEXT_BODY_TEXT(ye_directive))
         # plain text body; join all text within
         else:
-            return ' '.join(ye_directive.xpath('./ac:plain-text-body//text()', namespaces=H_NAMESPACES))
+            return ' '.join(X_PLAIN_TEXT_BODY_TEXT(ye_directive))
 
 
-    def _insert(self, render, hide_directive=False) -> str:
+    def _insert(self, render, hide_directive=False) -> Document:
         ye_render = render
         b_hide_directive = hide_directive
 
         # find directive id param
-        ye_param_id = self._ye_directive.find('./ac:parameter[@ac:name="id"]', H_NAMESPACES)
+        a_param_ids = X_PARAM_ID(self._ye_directive)
 
         # no such param yet
-        if ye_param_id is None:
+        if not a_param_ids:
             # create param
             ye_param_id = _ac_element('parameter', {'name': 'id'})
 
             # insert as 1st child
             self._ye_directive.insert(0, ye_param_id)
+        # param exists; its text is about to change
+        else:
+            ye_param_id = a_param_ids[0]
+            self._k_document.unindex(ye_param_id)
 
         # set param id text
         ye_param_id.text = self._si_directive
+        self._k_document.index(ye_param_id)
 
         # hide the directive
         if b_hide_directive:
             # find style parameter
-            ye_param_style = self._ye_directive.find('./ac:parameter[@ac:name="style"]', H_NAMESPACES)
+            a_param_styles = X_PARAM_STYLE(self._ye_directive)
 
             # no style currently set
-            if ye_param_style is None:
+            if not a_param_styles:
                 # create style parameter element
                 ye_param_style = _ac_element('parameter', {'name': 'style'})
 
@@ -362,9 +751,10 @@ class DirectedView(View, metaclass=abc.ABCMeta):
 
         # insert view render element immediately following directive element
         self._ye_directive.addnext(ye_render)
+        self._k_document.index(ye_render)
 
-        # return modified content
-        return _lxml_to_string(self._ye_root)
+        # return modified document
+        return self._k_document
 
 
 
@@ -379,22 +769,20 @@ class PageReference(NamedTuple):
     iri: str=None
 
 
-class Table(DirectedView):
-    # local prefix def
-    def _prefix(self, a_append: List[str]=[]) -> str:
-        return super()._prefix(a_append+['table'])
-
+class TemplatedView(DirectedView, metaclass=abc.ABCMeta):
+    '''
+    A directed view whose directive links to the `_View:` template page defining it
+    '''
     def _parse_directive(self, h_extras: Dict[str, Hash]={}):
         ye_directive = self._ye_directive
 
         # page ref
-        ye_page = ye_directive.find('.//ac:link/ri:page', H_NAMESPACES)
-        if ye_page is not None:
-            si_ref_space = ''.join(ye_directive.xpath('.//ac:link/ri:page/@ri:space-key', namespaces=H_NAMESPACES))
-            si_ref_title = ''.join(ye_directive.xpath('.//ac:link/ri:page/@ri:content-title', namespaces=H_NAMESPACES))
+        if len(X_LINK_PAGE(ye_directive)):
+            si_ref_space = ''.join(X_LINK_PAGE_SPACE_KEY(ye_directive))
+            si_ref_title = ''.join(X_LINK_PAGE_CONTENT_TITLE(ye_directive))
         # nothing
         else:
-            raise Exception(f'Table view directive is not understood: """{_lxml_to_string(ye_directive)}"""')
+            raise Exception(f'{self.__class__.__name__} view directive is not understood: """{_lxml_to_string(ye_directive)}"""')
 
         self._g_template_ref = PageReference(
             space=h_extras['directive_page_space']['value'],
@@ -409,16 +797,21 @@ class Table(DirectedView):
         return self._g_template_ref
 
 
-    def render(self, k_query_results: QueryResultsTable) -> str:
-        # build Confluence table as XHTML string
-        s_xhtml = k_query_results.to_confluence_xhtml(
-            span_id=self._local_id('render')+'-'+self._si_view,
-        )
+class Table(TemplatedView):
+    # local prefix def
+    def _prefix(self, a_append: List[str]=[]) -> str:
+        return super()._prefix(a_append+['table'])
+
+    def render(self, k_query_results: QueryResultsTable) -> Document:
+        si_span = self._local_id('render')+'-'+self._si_view
 
-        # create render element
-        ye_render = _lxml_from_string(s_xhtml)[0]
+        # build Confluence table directly as an element; macro id is derived from the data
+        ye_render = _table_element(k_query_results,
+            span_id=si_span,
+            macro_id=_content_id(si_span, _rows_digest(k_query_results.rows)),
+        )
 
-        # return fully serialized document after insertion
+        # return modified document after insertion
         return self._insert(
             render=ye_render,
             hide_directive=True,
@@ -428,13 +821,27 @@ class Table(DirectedView):
 class Tooltip(DirectedView):
     # local prefix def
     def _prefix(self, a_append: List[str]=[]) -> str:
-        return super().prefix(a_append+['tooltip'])
+        return super()._prefix(a_append+['tooltip'])
+
+    def _parse_directive(self, h_extras: Dict[str, Hash]={}):
+        # no-op
+        return None
+
+    def render(self, s_tooltip_text: str, s_tooltip_link: str) -> Document:
+        ye_root = self._ye_root
+
+        # tooltip id is derived from the insertHover macro id
+        si_xref_tooltip_id = 'ced-hover-' + self._si_macro
 
-    def render(self, s_tooltip_text: str, s_tooltip_link: str) -> str:
         # Replace contents of insertHover span with link
         if s_tooltip_link:
-            ye_insertHover_body = ye_xref.find(f'./ac:rich-text-body', H_NAMESPACES)
-            if ye_insertHover_body is not None:
+            a_bodies = X_RICH_TEXT_BODY(self._ye_directive)
+            if a_bodies:
+                ye_insertHover_body = a_bodies[0]
+
+                # body is about to be rewritten
+                self._k_document.unindex(ye_insertHover_body)
+
                 # Strip all tags from body leaving only text
                 etree.strip_tags(ye_insertHover_body, '*')
                 # Insert link into body
@@ -444,56 +851,118 @@ class Tooltip(DirectedView):
                 ye_link.text = ye_insertHover_body.text
                 ye_insertHover_body.text = ''
 
+                self._k_document.index(ye_insertHover_body)
+
         # Locate existing tooltip with same "id" parameter as insertHover span, or create one
-        a_tooltip_macros = ye_root.xpath(f'.//ac:structured-macro[@ac:name="tooltip"]/ac:parameter[@ac:name="id" and text() = "{si_xref_tooltip_id}"]/..', namespaces=H_NAMESPACES)
+        a_tooltip_macros = [ye_macro for ye_macro in self._k_document.macros_with_id(si_xref_tooltip_id) if 'tooltip' == ye_macro.get(A_AC_NAME)]
         if len(a_tooltip_macros) == 0:
             ye_tooltip_macro = _ac_element('structured-macro', {
                 'name': 'tooltip',
                 'schema-version': '1',
-                'macro_id': uuid.uuid4().hex
+                'macro-id': _content_id(si_xref_tooltip_id)
             })
             ye_tooltip_param_id = _ac_element('parameter', {'name':'id'})
-            ye_tooltip_param_id.text = 'ced-hover-' + xref_macro_id
+            ye_tooltip_param_id.text = si_xref_tooltip_id
             ye_tooltip_macro.append(ye_tooltip_param_id)
             ye_root.append(ye_tooltip_macro)
+            self._k_document.index(ye_tooltip_macro)
         else:
             ye_tooltip_macro = a_tooltip_macros[0]
         
         # Set tooltip text
-        ye_tooltip_text = ye_tooltip_macro.find('./ac:parameter[@ac:name="text"]', H_NAMESPACES)
-        if ye_tooltip_text is None:
+        a_tooltip_texts = X_PARAM_TEXT(ye_tooltip_macro)
+        if a_tooltip_texts:
+            ye_tooltip_text = a_tooltip_texts[0]
+        else:
             ye_tooltip_text = _ac_element('parameter', {'name': 'text'})
             ye_tooltip_macro.append(ye_tooltip_text)
         ye_tooltip_text.text = s_tooltip_text
 
-        # Return modified content
-        return _lxml_to_string(ye_root)
+        # Return modified document
+        return self._k_document
 
 
-class Diagram(View):
+class Diagram(TemplatedView):
     # local prefix def
     def _prefix(self, a_append: List[str]=[]) -> str:
         return super()._prefix(a_append+['diagram'])
 
-    def render(self) -> str:
-        # create render element
-        (si_macro, ye_render) = _span(
-            id=self._local_id('render')+'-'+self._si_view,
-            body=[
-                # etree.fromstring(f'<svg ...>'+s_content+'</svg>', parser=Y_LXML_PARSER)
-                _element('svg',
-                    attrs={
-                        # ...
-                    },
-                    children=[
-                        # ...
-                    ],
-                ),
-            ],
-        )
-
-        # return fully serialized document after insertion
+    def render(self, k_layout: Layout) -> Document:
+        si_span = self._local_id('render')+'-'+self._si_view
+        sx_svg = to_svg(k_layout)
+
+        # SVG is embedded with an html macro; macro ids are derived from the drawing so that an unchanged diagram renders identically
+        ye_body = _element('ac:plain-text-body')
+        ye_body.text = etree.CDATA(sx_svg)
+
+        ye_render = _ac_element('structured-macro', {
+            'name': 'span',
+            'schema-version': '1',
+            'macro-id': _content_id(si_span, sx_svg),
+        })
+        ye_render.append(_macro_param('id', si_span))
+        ye_render.append(_macro_param('atlassian-macro-output-type', 'BLOCK'))
+        etree.SubElement(ye_render, T_AC_RICH_TEXT_BODY).append(_element('ac:structured-macro', {
+            'ac:name': 'html',
+            'ac:schema-version': '1',
+            'ac:macro-id': _content_id(si_span, 'html', sx_svg),
+        }, children=[ye_body]))
+
+        # return modified document after insertion
         return self._insert(
             render=ye_render,
+            hide_directive=True,
+        )
+
+
+
+class DirectiveRender(NamedTuple):
+    '''
+    Everything needed to apply one directive to a page, evaluated ahead of time so that
+    rendering needs no access to any backend. Only plain data, classes and module-level
+    functions are held, so instances can be sent to another process.
+    '''
+    view: type
+    directive: Hash
+    macro_id: str=None
+    promote: Callable=None
+    render_args: tuple=()
+
+
+def render_page(content: str, renders: List[DirectiveRender]) -> Optional[str]:
+    '''
+    Parse a page, apply every directive in order and serialize the result. Performs no I/O,
+    so it may run in a worker process.
+
+    :param content: the Confluence XHTML document string
+    :param renders: the directives on the page, in document order
+    :return: the rendered XHTML string, or None if rendering left the page unchanged
+    '''
+    # parse once; views modify the shared document in place
+    k_document = Document(content)
+
+    for g_render in renders:
+        si_macro = g_render.macro_id
+
+        # inferred directive; promote to command in place
+        if g_render.promote is not None:
+            ye_command = g_render.promote(g_render.directive, k_document)
+            si_macro = ye_command.get(A_AC_MACRO_ID) if ye_command is not None else 'N/A'
+
+        # instantiate view
+        k_view = g_render.view(
+            document=k_document,
+            directive_macro_id=si_macro,
+            extras=g_render.directive,
         )
 
+        # clear renders and insert the new one
+        k_view.clear()
+        k_view.render(*g_render.render_args)
+
+    # rendered content is identical to what was given
+    if not k_document.changed:
+        return None
+
+    # serialize once
+    return k_document.to_string()
@@ -1,9 +1,18 @@
-import html
-import uuid
+import re
+import itertools
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from typing import NamedTuple, List, Dict
 
+from lxml import etree
 from opl import QueryResultsTable, QueryField
 
+from .view import _content_id, _element
+from .patterns import ve_patterns
+from .hierarchy import SI_DESCENDANTS, RequirementHierarchy
+from .layout import Graph
+
 H_ARTIFACT_COMMON_DISPLAY_COLUMNS = {
     'identifier': 'ID',
     'artifactName': 'Requirement Name',
@@ -13,7 +22,7 @@ H_ARTIFACT_COMMON_DISPLAY_COLUMNS = {
     'maturity': 'Maturity',
 }
 
-SX_FIND_ARTIFACT_INFO = 'find artifactInfo('+','.join([
+A_ARTIFACT_INFO_PARAMS = [
     'artifactName',
     'artifactId',
     'artifactURL',
@@ -24,18 +33,49 @@ SX_FIND_ARTIFACT_INFO = 'find artifactInfo('+','.join([
     'maturity',
     'attributeKey',
     'attributeValue',
-])+');'
+]
+
+SX_FIND_ARTIFACT_INFO = 'find artifactInfo('+','.join(A_ARTIFACT_INFO_PARAMS)+');'
+
+# strategies for evaluating filters that accept any of several values
+#   'union': one query against a disjunctive pattern compiled per signature
+#   'fanout': one concurrent query per combination of values, merged client-side
+AS_MULTI_VALUE_STRATEGIES = {'union', 'fanout'}
+
+# default strategy
+S_MULTI_VALUE_STRATEGY = 'fanout'
+
+# maximum number of fanned-out queries in flight at once, across all views
+N_FANOUT_WORKERS = 4
+
+# number of base rows whose join keys are bound in one batched field query
+N_BATCH_KEYS = 64
+
+# parameter names in the header of a pattern definition
+R_PATTERN_HEADER = re.compile(r'^\s*\(([^)]*)\)')
 
 
 # wrap an HTML string with a confluence HTML macro
-def _wrap_confluence_html_macro(sx_content: str, g_row: Dict[str, str]) -> str:
-    return f'''
-        <ac:structured-macro ac:name="html" ac:schema-version="1" ac:macro-id="{uuid.uuid4()}">
-            <ac:plain-text-body>
-                <![CDATA[{sx_content.replace(']]>', ']]]]><!CDATA[>')}]]>
-            </ac:plain-text-body>
-        </ac:structured-macro>
-    '''
+def _wrap_confluence_html_macro(sx_content: str, g_row: Dict[str, str]):
+    # macro id is derived from the row and its content so that unchanged data renders identically
+    si_macro = _content_id(str(g_row.get('artifactId', '')), sx_content)
+
+    # plain text body; CDATA cannot contain its own terminator, plain text is escaped instead
+    ye_body = _element('ac:plain-text-body')
+    ye_body.text = etree.CDATA(sx_content) if ']]>' not in sx_content else sx_content
+
+    return _element('ac:structured-macro', {
+        'ac:name': 'html',
+        'ac:schema-version': '1',
+        'ac:macro-id': si_macro,
+    }, children=[ye_body])
+
+
+# link an artifact's name to its source
+def _link_artifact_name(z_value: str, g_row: Dict[str, str]):
+    return _element('a', {
+        'href': g_row['artifactURL'],
+    }, text=z_value)
 
 
 class _Args:
@@ -57,29 +97,178 @@ class _Args:
             raise Exception('Argument `'+si_key+'` is not a list')
         return z_input
 
+# pool shared by every fanned-out query, created on first use
+_y_fanout_pool = None
+_Y_FANOUT_POOL_LOCK = threading.Lock()
+
+def _fanout_pool() -> ThreadPoolExecutor:
+    global _y_fanout_pool
+    with _Y_FANOUT_POOL_LOCK:
+        if _y_fanout_pool is None:
+            _y_fanout_pool = ThreadPoolExecutor(max_workers=max(1, N_FANOUT_WORKERS), thread_name_prefix='fanout')
+        return _y_fanout_pool
+
+# whether the client answers the given query from local indexes rather than the server
+def _is_local(k_incquery, si_query: str) -> bool:
+    f_is_local = getattr(k_incquery, 'is_local', None)
+    return f_is_local is not None and f_is_local(si_query)
+
+
 class View:
-    def __init__(self, base, fields):
+    def __init__(self, base, fields, group_by=None, aggregate=()):
+        '''
+        :param base: name of the base query
+        :param fields: dict of QueryFields to extend each row with
+        :param group_by: optional column identifying a row; base rows sharing a value
+            are collapsed into one before any field is extended
+        :param aggregate: columns that may differ among collapsed rows; each becomes a
+            list of values, aligned across columns and without duplicate combinations
+        '''
         self._si_base_query = base
         self._h_fields = fields
-
-    def evaluate(self, incquery, bindings, patterns={}):
+        self._si_group_by = group_by
+        self._a_aggregate = list(aggregate)
+
+    def evaluate(self, incquery, bindings, patterns={}, batched=None):
+        '''
+        Execute the base query and extend each result row with the view's fields
+
+        :param incquery: the IncQuery client
+        :param bindings: bindings for the base query; a list of bindings dicts executes
+            the base query once per dict, concurrently, and merges the results
+        :param patterns: patterns to include during query execution
+        :param batched: fetch each field with one query per `N_BATCH_KEYS` rows, binding their
+            join keys, and join client-side; otherwise issue one query per row per field. By default, a field is batched
+            unless the client answers its query from local indexes (`is_local`)
+        '''
         k_incquery = incquery
         h_fields = self._h_fields
 
+        # virtual patterns are only answered by a client wrapped in a RequirementHierarchy; IncQuery does not know them
+        for si_field, g_field in h_fields.items():
+            if SI_DESCENDANTS == g_field.query and not _is_local(k_incquery, SI_DESCENDANTS):
+                raise Exception(f'Field `{si_field}` queries `{SI_DESCENDANTS}`, which requires the IncQuery client to be wrapped in a RequirementHierarchy')
+
         # start with base query
-        a_rows = k_incquery.execute(self._si_base_query, bindings=bindings, patterns=patterns)
+        a_rows = self._fetch(k_incquery, bindings, patterns)
 
-        # each row
-        for g_row in a_rows:
-            # each field
-            for si_field in h_fields:
-                g_field = h_fields[si_field]
+        # collapse duplicate rows
+        if self._si_group_by is not None:
+            a_rows = self._group(a_rows)
+
+        # nothing to extend
+        if not a_rows:
+            return a_rows
+
+        # each field
+        for si_field in h_fields:
+            g_field = h_fields[si_field]
 
-                # extend row dict
-                g_row[si_field] = k_incquery.extend_row(g_row, g_field)
+            # per-row lookups are cheap when they do not leave the process
+            b_batched = batched if batched is not None else not _is_local(k_incquery, g_field.query)
+
+            # one query for all rows
+            if b_batched:
+                self._extend_batched(k_incquery, a_rows, si_field, g_field, patterns)
+            # one query per row
+            else:
+                for g_row in a_rows:
+                    g_row[si_field] = k_incquery.extend_row(g_row, g_field)
 
         return a_rows
 
+    # execute the base query for one or several sets of bindings
+    def _fetch(self, k_incquery, z_bindings, h_patterns):
+        # single set of bindings
+        if isinstance(z_bindings, dict):
+            return k_incquery.execute(self._si_base_query, bindings=z_bindings, patterns=h_patterns)
+
+        # nothing to execute
+        if not z_bindings:
+            return []
+
+        # fan out over the shared pool; its tasks never wait on the pool themselves
+        a_results = list(_fanout_pool().map(lambda h_bindings: k_incquery.execute(self._si_base_query, bindings=h_bindings, patterns=h_patterns), z_bindings))
+
+        # merge; duplicates are collapsed by grouping
+        return [g_row for a_rows in a_results for g_row in a_rows]
+
+    # collapse rows to one per group key, aggregating the multi-valued columns
+    def _group(self, a_rows):
+        si_group_by = self._si_group_by
+        a_aggregate = self._a_aggregate
+
+        h_groups = {}
+        h_seen = collections.defaultdict(set)
+        for g_row in a_rows:
+            z_key = g_row[si_group_by]
+
+            # combination of multi-valued columns in this row
+            a_values = tuple(g_row.get(si_col) for si_col in a_aggregate)
+
+            # first row of group
+            if z_key not in h_groups:
+                h_groups[z_key] = {
+                    **g_row,
+                    **{si_col: [] for si_col in a_aggregate},
+                }
+
+            # duplicate combination
+            if a_values in h_seen[z_key]:
+                continue
+
+            h_seen[z_key].add(a_values)
+
+            # append values
+            g_group = h_groups[z_key]
+            for si_col, z_value in zip(a_aggregate, a_values):
+                g_group[si_col].append(z_value)
+
+        return list(h_groups.values())
+
+    # extend all rows with a few executions of the field's query, joined on the field's join keys
+    def _extend_batched(self, k_incquery, a_rows, si_field, g_field, h_patterns):
+        # deduce which parameters the field joins on
+        a_join_keys = list(g_field.join(a_rows[0]).keys())
+
+        # bind the remaining parameters as given
+        h_bindings = {si_key: w_value for si_key, w_value in g_field.bindings.items() if si_key not in a_join_keys}
+
+        # distinct join keys among the rows
+        a_keys = list(dict.fromkeys(tuple(g_field.join(g_row)[si_key] for si_key in a_join_keys) for g_row in a_rows))
+
+        # definition of the field's pattern, to bind the join keys of up to N_BATCH_KEYS rows per query
+        sx_field = {**ve_patterns, **h_patterns}.get(g_field.query)
+
+        # pattern is not known; leave the join parameters unbound so one query over the whole pattern matches every row
+        if sx_field is None:
+            a_field_rows = k_incquery.execute(g_field.query, bindings=h_bindings, patterns=h_patterns)
+        # one query per chunk of join keys
+        else:
+            a_field_rows = []
+            for i_chunk in range(0, len(a_keys), N_BATCH_KEYS):
+                a_chunk = a_keys[i_chunk:i_chunk+N_BATCH_KEYS]
+
+                # pad the last chunk so that every chunk shares one compiled pattern
+                a_chunk += a_chunk[-1:]*(min(N_BATCH_KEYS, len(a_keys))-len(a_chunk))
+
+                g_keys = combine_keys(g_field.query, sx_field, a_join_keys, a_chunk)
+                a_field_rows.extend(k_incquery.execute(g_keys.name, bindings={**h_bindings, **g_keys.bindings}, patterns={
+                    **h_patterns,
+                    g_field.query: sx_field,
+                    g_keys.name: g_keys.query,
+                }))
+
+        # index selected values by join key
+        h_index = collections.defaultdict(list)
+        for g_field_row in a_field_rows:
+            h_index[tuple(g_field_row.get(si_key) for si_key in a_join_keys)].append(g_field.select(g_field_row))
+
+        # join back onto each row
+        for g_row in a_rows:
+            h_join = g_field.join(g_row)
+            g_row[si_field] = list(h_index.get(tuple(h_join[si_key] for si_key in a_join_keys), []))
+
 
 class UnionResult(NamedTuple):
     bindings: Dict[str, str]
@@ -87,61 +276,148 @@ class UnionResult(NamedTuple):
     query: str
 
 
+# compiled disjunctive patterns, keyed by signature
+_H_UNION_PATTERNS: Dict[str, str] = {}
+_Y_UNION_PATTERNS_LOCK = threading.Lock()
+
+
 def combine_unions(s_name, h_multi_fields):
+    '''
+    Build a disjunctive pattern over `artifactInfo` that matches when each given
+    column equals any of its values. Values are passed as bindings so the pattern
+    body only depends on the signature (columns and value counts), and is compiled
+    once per signature.
+
+    :param s_name: prefix for the pattern name
+    :param h_multi_fields: dict of artifactInfo column => list of accepted values
+    '''
     a_sigs = []
     a_params = []
-    a_unions = []
     h_bindings = {}
-
-    i_array = 0
+    a_alternatives = []
 
     # each multi field
     for si_field in h_multi_fields:
         a_values = h_multi_fields[si_field]
 
-        # bind key
-        si_binding_key = f'array{i_array}Key'
-        a_params.append(si_binding_key)
-        h_bindings[si_binding_key] = si_field
+        if si_field not in A_ARTIFACT_INFO_PARAMS:
+            raise Exception(f'Cannot filter on `{si_field}`; not a parameter of artifactInfo')
 
         # how many values
         nl_values = len(a_values)
 
         # update signature
-        a_sigs.append(str(nl_values))
+        a_sigs.append(f'{si_field}{nl_values}')
 
-        # each value
+        # bind each value
+        a_constraints = []
         for i_value in range(nl_values):
-            # append VQL fragment
-            a_unions.append(f'''
+            si_binding_value = f'{si_field}Value{i_value}'
+            a_params.append(si_binding_value)
+            h_bindings[si_binding_value] = a_values[i_value]
+            a_constraints.append(f'{si_field} == {si_binding_value};')
+
+        a_alternatives.append(a_constraints)
+
+    si_union = s_name+'_'+'_'.join(a_sigs)
+
+    with _Y_UNION_PATTERNS_LOCK:
+        # compile pattern for this signature
+        if si_union not in _H_UNION_PATTERNS:
+            # one body per combination of values
+            a_unions = [f'''
                 {{
                     {SX_FIND_ARTIFACT_INFO}
-
-                    find artifactAttributeStringArray(artifactId, array{i_array}Key, array{i_array}Value{i_value});
+                    {' '.join(a_combination)}
                 }}
-            ''')
+            ''' for a_combination in itertools.product(*a_alternatives)]
+
+            _H_UNION_PATTERNS[si_union] = f'''
+                (
+                    artifactName: String, artifactId: java String, artifactURL: String,
+                    artifactShapeName: String, level: String, identifier: String,
+                    primaryText: String, maturity: String,
+                    attributeKey: String, attributeValue: String,
+                    {', '.join([si+': String' for si in a_params])}
+                )
+            '''+' or '.join(a_unions)
 
-            # bind value
-            si_binding_value = f'array{i_array}Value{i_value}'
-            a_params.append(si_binding_value)
-            h_bindings[si_binding_value] = a_values[i_value]
+    # struct
+    return UnionResult(
+        bindings=h_bindings,
+        name=si_union,
+        query=_H_UNION_PATTERNS[si_union],
+    )
 
-        # increment array index
-        i_array += 1
 
-    # struct
+# compiled patterns binding join keys, keyed by signature
+_H_KEY_PATTERNS: Dict[str, str] = {}
+
+
+def combine_keys(si_query, sx_query, a_join_keys, a_values):
+    '''
+    Build a disjunctive pattern over any pattern that matches when its join parameters
+    equal any of the given key tuples. Keys are passed as bindings so the pattern body
+    only depends on the signature (pattern, join parameters and key count), and is
+    compiled once per signature.
+
+    :param si_query: name of the pattern to join
+    :param sx_query: definition of the pattern to join
+    :param a_join_keys: the pattern's parameters to bind
+    :param a_values: list of key tuples, aligned with `a_join_keys`
+    '''
+    m_header = R_PATTERN_HEADER.match(sx_query)
+    if m_header is None:
+        raise Exception(f'Cannot bind join keys of `{si_query}`; its definition does not start with a parameter list')
+
+    # parameter name => declared type, if any
+    h_params = {}
+    for s_param in m_header[1].split(','):
+        (si_param, _, s_type) = s_param.partition(':')
+        h_params[si_param.strip()] = s_type.strip()
+
+    a_params = list(h_params)
+
+    for si_key in a_join_keys:
+        if si_key not in h_params:
+            raise Exception(f'Cannot bind `{si_key}`; not a parameter of {si_query}')
+
+    nl_values = len(a_values)
+    si_keys = si_query+'Keys_'+'_'.join(a_join_keys)+f'_{nl_values}'
+
+    # bind each key
+    h_bindings = {}
+    a_key_params = []
+    for i_value, a_key in enumerate(a_values):
+        for si_key, z_value in zip(a_join_keys, a_key):
+            si_binding_value = f'{si_key}Key{i_value}'
+            a_key_params.append(si_binding_value+(': '+h_params[si_key] if h_params[si_key] else ''))
+            h_bindings[si_binding_value] = z_value
+
+    with _Y_UNION_PATTERNS_LOCK:
+        # compile pattern for this signature
+        if si_keys not in _H_KEY_PATTERNS:
+            sx_find = f'find {si_query}('+','.join(a_params)+');'
+
+            # one body per key
+            a_unions = [f'''
+                {{
+                    {sx_find}
+                    {' '.join(f'{si_key} == {si_key}Key{i_value};' for si_key in a_join_keys)}
+                }}
+            ''' for i_value in range(nl_values)]
+
+            _H_KEY_PATTERNS[si_keys] = f'''
+                (
+                    {m_header[1].strip()},
+                    {', '.join(a_key_params)}
+                )
+            '''+' or '.join(a_unions)
+
     return UnionResult(
         bindings=h_bindings,
-        name=s_name+'_'+'_'.join(a_sigs),
-        query=f'''
-            (
-                artifactName: String, artifactId: java String, artifactURL: String,
-                artifactShapeName: String, level: String, identifier: String,
-                primaryText: String, maturity: String,
-                attributeKey: String, attributeValue: String,
-                {', '.join([si+': String' for si in a_params])}
-            )
-        '''+' or '.join(a_unions),
+        name=si_keys,
+        query=_H_KEY_PATTERNS[si_keys],
     )
 
 
@@ -154,8 +430,13 @@ select_array_item_value = lambda g_row: g_row['itemValue']
 
 by_artifact_id = by('artifactId')
 
-def _req_by_level_attrstring(k_incquery, h_args, b_include_children=False, patterns=None):
-    h_patterns = {**k_incquery._h_patterns, **(patterns or {})}
+def _req_by_level_attrstring(k_incquery, h_args, b_include_children=False, patterns=None, base='artifactInfo', multi_bindings=None, child_depth=1):
+    '''
+    :param multi_bindings: optional list of bindings dicts to fan the base query out over;
+        each is merged on top of the bindings derived from `h_args`
+    :param child_depth: number of levels of children to list when children are included;
+        None for all descendants
+    '''
     k_args = _Args(h_args)
 
     h_fields = {
@@ -178,27 +459,44 @@ def _req_by_level_attrstring(k_incquery, h_args, b_include_children=False, patte
     }
 
     if b_include_children:
-        h_fields['children'] = QueryField(
-            join=by_artifact_id,
-            query='artifactChildren',
-            select=lambda g_row: g_row['childName'],
-        )
+        # direct children only
+        if 1 == child_depth:
+            h_fields['children'] = QueryField(
+                join=by_artifact_id,
+                query='artifactChildren',
+                select=lambda g_row: g_row['childName'],
+            )
+        # deeper levels from the hierarchy
+        else:
+            h_fields['children'] = QueryField(
+                join=by_artifact_id,
+                query=SI_DESCENDANTS,
+                select=lambda g_row: g_row['childName'],
+                bindings={
+                    'maxDepth': child_depth,
+                } if child_depth is not None else {},
+            )
 
     k_view = View(
-        base='artifactInfo',
+        base=base,
         fields=h_fields,
+        group_by='artifactId',
+        aggregate=['attributeKey', 'attributeValue'],
     )
 
     h_bindings = {
         **h_args,
-        'level': k_args.str('level'),  # e.g., 'L3'
         'artifactShapeName': 'Requirement',
         'attributeKey': k_args.str('attributeKey'),  # h_args[''],  # e.g., 'System VAC'
-        'attributeValue': k_args.str('attributeValue'),  # e.g., 'Sequencing'
     }
 
+    # single-valued filters; multi-valued ones are bound by the union pattern or the fan-out instead
+    for si_key in ['level', 'attributeValue']:  # e.g., 'L3', 'Sequencing'
+        if si_key in h_args:
+            h_bindings[si_key] = k_args.str(si_key)
+
     a_rows = k_view.evaluate(k_incquery,
-        bindings=h_bindings,
+        bindings=[{**h_bindings, **h_multi} for h_multi in multi_bindings] if multi_bindings is not None else h_bindings,
         patterns=patterns or {},
     )
 
@@ -220,54 +518,103 @@ def _req_by_level_attrstring(k_incquery, h_args, b_include_children=False, patte
         labels=h_display,
         rewriters={
             'primaryText': _wrap_confluence_html_macro,
-            'artifactName': lambda z_value, g_row: '<a href="{url}">{value}</a>'.format(
-                url=g_row['artifactURL'],
-                value=html.escape(z_value),
-            ),
+            'artifactName': _link_artifact_name,
         },
     )
 
 
-def _req_system_vac(k_incquery, h_args, b_include_children):
-    k_args = _Args(h_args)
+# all values given for an arg, whether it was a single string or a list
+def _values(k_args, si_key, b_required=False):
+    z_value = k_args.any(si_key)
 
-    h_bindings = {
-        'level': k_args.str('level'),  # e.g., 'L3'
-        'attributeKey': 'System VAC',
-        'attributeValue': k_args.str('functionalArea'),  # e.g., 'Sequencing'
-    }
+    if isinstance(z_value, str):
+        a_values = [z_value] if z_value else []
+    # de-duplicate, preserving order
+    else:
+        a_values = list(dict.fromkeys(k_args.list(si_key)))
 
-    z_maturity = k_args.any('maturity')
-    a_maturities = []
+    # a required filter must not silently match everything
+    if b_required and not a_values:
+        raise Exception('Argument `'+si_key+'` is missing or empty')
 
-    if isinstance(z_maturity, str) and z_maturity:
-        a_maturities = [k_args.str('maturity')]
-    elif isinstance(z_maturity, list):
-        a_maturities = k_args.list('maturity')
+    return a_values
 
-    if len(a_maturities):
-        if 1 == len(a_maturities):
-            return _req_by_level_attrstring(k_incquery, {
-                **h_bindings,
-                'maturity': a_maturities[0],
-            }, b_include_children)
 
-        g_union =combine_unions(k_incquery._h_patterns['artifactInfo']+'Includes', {
-            'Maturity': a_maturities,
-        })
+# number of levels of children to list; 'all' for every descendant
+def _child_depth(h_args):
+    z_depth = h_args.get('childDepth') or '1'
 
-        h_bindings.update(g_union.bindings)
+    if not isinstance(z_depth, str):
+        raise Exception('Argument `childDepth` is not a string')
 
-        breakpoint()
-        raise Exception('dynamic disjunctive queries not yet implemented')
-        si_query = k_incquery.define_query(g_union.name, g_union.query)
+    # every descendant
+    if 'all' == z_depth.strip().lower():
+        return None
+
+    try:
+        n_depth = int(z_depth)
+    except ValueError:
+        n_depth = 0
+
+    if n_depth < 1:
+        raise Exception(f'Argument `childDepth` must be a positive number or "all", not "{z_depth}"')
+
+    return n_depth
 
-        return _req_by_level_attrstring(k_incquery, h_bindings, b_include_children, patterns={
-            'artifactInfo': si_query,
-        })
 
+def _req_system_vac(k_incquery, h_args, b_include_children, strategy=None):
+    s_strategy = strategy or S_MULTI_VALUE_STRATEGY
+    k_args = _Args(h_args)
+
+    # children are not listed; ignore any depth given
+    n_child_depth = _child_depth(h_args) if b_include_children else 1
+
+    if s_strategy not in AS_MULTI_VALUE_STRATEGIES:
+        raise Exception(f'Unknown multi-value strategy "{s_strategy}"')
+
+    h_bindings = {
+        'level': k_args.str('level'),  # e.g., 'L3'
+        'attributeKey': 'System VAC',
+    }
+
+    # artifactInfo column => accepted values
+    h_filters = {
+        'attributeValue': _values(k_args, 'functionalArea', b_required=True),  # e.g., 'Sequencing'
+        'maturity': _values(k_args, 'maturity'),
+    }
+
+    # filters that accept several values
+    h_multi = {}
+    for si_key, a_values in h_filters.items():
+        # single value; bind directly
+        if 1 == len(a_values):
+            h_bindings[si_key] = a_values[0]
+        # multiple values
+        elif len(a_values) > 1:
+            h_multi[si_key] = a_values
+
+    # every filter is single-valued (or absent)
+    if not h_multi:
+        return _req_by_level_attrstring(k_incquery, h_bindings, b_include_children, child_depth=n_child_depth)
+
+    # one query against a disjunctive pattern
+    if 'union' == s_strategy:
+        g_union = combine_unions('artifactInfoAny', h_multi)
+
+        return _req_by_level_attrstring(k_incquery, {**h_bindings, **g_union.bindings}, b_include_children,
+            base=g_union.name,
+            patterns={
+                g_union.name: g_union.query,
+            },
+            child_depth=n_child_depth,
+        )
+    # one concurrent query per combination of values
     else:
-        return _req_by_level_attrstring(k_incquery, h_bindings, b_include_children)
+        a_keys = list(h_multi.keys())
+        return _req_by_level_attrstring(k_incquery, h_bindings, b_include_children,
+            multi_bindings=[dict(zip(a_keys, a_combination)) for a_combination in itertools.product(*h_multi.values())],
+            child_depth=n_child_depth,
+        )
 
 
 def _system_reqs(k_incquery, h_args):
@@ -280,3 +627,39 @@ method_registry = {
     'Appendix Flight System Requirements': _system_reqs,
     'Appendix Subsystem Requirements': _subsystem_reqs,
 }
+
+
+def _req_hierarchy_diagram(k_incquery, h_args):
+    '''
+    The "Child Of" hierarchy below the requirements selected by a subsystem view
+    '''
+    # every level unless limited by the template
+    n_child_depth = _child_depth({'childDepth': h_args.get('childDepth') or 'all'})
+
+    k_roots = _req_system_vac(k_incquery, h_args, False)
+
+    # hierarchy of the run, or one loaded for this diagram with a single query
+    k_hierarchy = k_incquery if callable(getattr(k_incquery, 'descendants', None)) else RequirementHierarchy(k_incquery)
+
+    h_nodes = {}
+    for g_row in k_roots.rows:
+        h_nodes.setdefault(g_row['artifactId'], g_row.get('artifactName') or g_row['artifactId'])
+
+    # everything below the selected requirements, down to the depth
+    for si_root in list(h_nodes):
+        for si_descendant, _ in k_hierarchy.descendants(si_root, n_child_depth):
+            if si_descendant not in h_nodes:
+                h_nodes[si_descendant] = k_hierarchy.name(si_descendant) or si_descendant
+
+    # edges among the nodes drawn
+    a_edges = [(si_parent, si_child) for si_parent in h_nodes for si_child in k_hierarchy.children(si_parent) if si_child in h_nodes]
+
+    return Graph(
+        nodes=list(h_nodes.items()),
+        edges=list(dict.fromkeys(a_edges)),
+    )
+
+
+diagram_registry = {
+    'Requirement Hierarchy Diagram': _req_hierarchy_diagram,
+}
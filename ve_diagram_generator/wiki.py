@@ -0,0 +1,401 @@
+import sys
+import time
+import threading
+import traceback
+import collections
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from .scheduler import _is_retryable, _http_status
+
+
+class PageSnapshot(NamedTuple):
+    '''
+    Content of a page as fetched from Confluence
+    '''
+    page_id: str
+    title: str
+    version: int
+    content: str
+
+
+# turn one result of the content REST API into a snapshot
+def _snapshot(g_page: dict) -> PageSnapshot:
+    return PageSnapshot(
+        page_id=str(g_page['id']),
+        title=g_page['title'],
+        version=g_page['version']['number'],
+        content=g_page['body']['storage']['value'],
+    )
+
+
+# split a sequence into lists of at most the given size
+def _batches(a_items: List[str], n_size: int) -> List[List[str]]:
+    return [a_items[i_start:i_start+n_size] for i_start in range(0, len(a_items), n_size)]
+
+
+class PageStore:
+    '''
+    Fetches the content and versions of many pages with a few batched CQL searches
+    rather than one request per page, and holds them in memory until the render
+    stage takes them. Batches are fetched in the background, in the order the pages
+    were given unless a page is requested ahead of its turn, and fetching pauses while
+    the content held exceeds the size bound; a page requested while fetching is paused
+    is fetched on its own. A batch that fails transiently (throttled, server error or
+    connection failure, once any retries are exhausted) is reported and its pages are
+    fetched on their own; any other failure is raised when one of its pages is requested.
+
+    :param confluence: the atlassian-python-api Confluence client, e.g., `opl.Confluence()._y_confluence`
+        (optionally bound to a Backend)
+    :param batch_size: maximum number of pages per search request
+    :param max_bytes: approximate bound on the content held in memory
+    '''
+    def __init__(self, confluence, batch_size: int=50, max_bytes: int=256*1024*1024):
+        if batch_size < 1:
+            raise ValueError('Batch size must be at least 1')
+
+        self._y_confluence = confluence
+        self._n_batch = batch_size
+        self._nb_max = max_bytes
+        self._nb_used = 0
+
+        self._h_pages: Dict[str, PageSnapshot] = {}
+        self._h_versions: Dict[str, int] = {}
+        self._as_queued = set()
+        self._as_in_flight = set()
+        self._h_errors: Dict[str, BaseException] = {}
+        self._dq_batches = collections.deque()
+        self._b_closed = False
+
+        self._y_cond = threading.Condition()
+        self._y_thread = None
+
+        # counters
+        self.requests = 0
+        self.prefetched = 0
+        self.direct = 0
+
+    def _search(self, a_page_ids: List[str], s_expand: str) -> List[dict]:
+        '''
+        Find the given pages with CQL, following pagination
+
+        :param a_page_ids: IDs of the pages
+        :param s_expand: properties to expand on each result
+        '''
+        a_results = []
+        while True:
+            g_response = self._y_confluence.get('rest/api/content/search', params={
+                'cql': f'id in ({",".join(a_page_ids)})',
+                'expand': s_expand,
+                'start': len(a_results),
+                'limit': len(a_page_ids),
+            })
+
+            with self._y_cond:
+                self.requests += 1
+
+            a_page = g_response.get('results', [])
+            a_results.extend(a_page)
+
+            # no more results
+            if not a_page or 'next' not in g_response.get('_links', {}):
+                return a_results
+
+    def fetch_versions(self, page_ids: Iterable[str]) -> Dict[str, int]:
+        '''
+        Look up the current version number of each page, in batches, without fetching content
+
+        :param page_ids: IDs of the pages
+        :return: dict mapping each page ID found to its version number
+        '''
+        h_versions = {}
+        for a_batch in _batches(list(page_ids), self._n_batch):
+            for g_page in self._search(a_batch, 'version'):
+                h_versions[str(g_page['id'])] = g_page['version']['number']
+
+        with self._y_cond:
+            self._h_versions.update(h_versions)
+
+        return h_versions
+
+    def version(self, page_id: str) -> Optional[int]:
+        '''
+        Current version number of a page, fetching it if it is not already known
+
+        :param page_id: the page ID
+        :return: the version number, or None if the page was not found
+        '''
+        with self._y_cond:
+            g_page = self._h_pages.get(page_id)
+            if g_page is not None:
+                return g_page.version
+
+            n_version = self._h_versions.get(page_id)
+            if n_version is not None:
+                return n_version
+
+        return self.fetch_versions([page_id]).get(page_id)
+
+    def prefetch(self, page_ids: Iterable[str]):
+        '''
+        Start fetching the content of the given pages in the background
+
+        :param page_ids: IDs of the pages, in the order they will be requested
+        '''
+        with self._y_cond:
+            a_page_ids = [si_page for si_page in page_ids if si_page not in self._h_pages and si_page not in self._as_queued]
+            self._as_queued.update(a_page_ids)
+
+            # top up the last batch still waiting, so that pages queued a few at a time share requests
+            if a_page_ids and self._dq_batches and len(self._dq_batches[-1]) < self._n_batch:
+                n_room = self._n_batch-len(self._dq_batches[-1])
+                self._dq_batches[-1].extend(a_page_ids[:n_room])
+                a_page_ids = a_page_ids[n_room:]
+
+            self._dq_batches.extend(_batches(a_page_ids, self._n_batch))
+
+            # start the background fetcher
+            if self._y_thread is None:
+                self._y_thread = threading.Thread(target=self._run, name='PageStore', daemon=True)
+                self._y_thread.start()
+
+            self._y_cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._y_cond:
+                # wait for work and for room below the size bound
+                while not self._b_closed and (not self._dq_batches or self._nb_used >= self._nb_max):
+                    self._y_cond.wait()
+
+                if self._b_closed:
+                    return
+
+                # take the next batch, minus any pages that were already fetched on their own
+                a_batch = [si_page for si_page in self._dq_batches.popleft() if si_page in self._as_queued]
+                self._as_queued.difference_update(a_batch)
+                self._as_in_flight.update(a_batch)
+
+            # fetch
+            e_batch = None
+            try:
+                a_results = self._search(a_batch, 'body.storage,version') if a_batch else []
+            except Exception as e_search:
+                a_results = []
+                e_batch = e_search
+                print(f'Failed to prefetch {len(a_batch)} page(s) [{", ".join(a_batch)}]:\n{traceback.format_exc()}', file=sys.stderr)
+
+            # store; pages that were not returned are left to be fetched on their own
+            with self._y_cond:
+                # failure that fetching the pages one by one would only repeat, e.g., unauthorized or a bad request
+                n_status = _http_status(e_batch) if e_batch is not None else None
+                if n_status is not None and not _is_retryable(n_status):
+                    for si_page in a_batch:
+                        self._h_errors[si_page] = e_batch
+
+                for g_page in a_results:
+                    g_snapshot = _snapshot(g_page)
+                    if g_snapshot.page_id in self._as_in_flight:
+                        self._h_pages[g_snapshot.page_id] = g_snapshot
+                        self._nb_used += len(g_snapshot.content)
+                        self.prefetched += 1
+
+                self._as_in_flight.difference_update(a_batch)
+                self._y_cond.notify_all()
+
+    # move the queued batch containing a page to the front; lock must be held
+    def _prioritize(self, si_page: str):
+        for i_batch, a_batch in enumerate(self._dq_batches):
+            if si_page in a_batch:
+                if i_batch:
+                    del self._dq_batches[i_batch]
+                    self._dq_batches.appendleft(a_batch)
+                return
+
+    def get(self, page_id: str) -> PageSnapshot:
+        '''
+        Hand over a page's snapshot and release it from the store; pages that were not
+        prefetched (or not yet) are fetched on their own
+
+        :param page_id: the page ID
+        '''
+        with self._y_cond:
+            while True:
+                # its batch is being fetched; wait for it
+                if page_id in self._as_in_flight:
+                    self._y_cond.wait()
+                # its batch is queued and the fetcher has room; move the batch up front and wait for it
+                elif page_id in self._as_queued and not self._b_closed and self._nb_used < self._nb_max:
+                    self._prioritize(page_id)
+                    self._y_cond.wait()
+                else:
+                    break
+
+            # prefetched
+            g_page = self._h_pages.pop(page_id, None)
+            if g_page is not None:
+                self._nb_used -= len(g_page.content)
+                self._y_cond.notify_all()
+                return g_page
+
+            # its batch failed for good
+            e_batch = self._h_errors.pop(page_id, None)
+            if e_batch is not None:
+                raise e_batch
+
+            # not fetched yet; take it out of its batch
+            self._as_queued.discard(page_id)
+
+            self.direct += 1
+
+        # fetch on its own
+        return _snapshot(self._y_confluence.get_page_by_id(page_id, expand='body.storage,version'))
+
+    def close(self):
+        with self._y_cond:
+            self._b_closed = True
+            self._h_pages.clear()
+            self._h_errors.clear()
+            self._nb_used = 0
+            self._y_cond.notify_all()
+
+
+class _Update:
+    '''
+    A pending write of new content to a page
+    '''
+    def __init__(self, g_page: PageSnapshot, s_content: str):
+        self.page = g_page
+        self.content = s_content
+        self.future = Future()
+
+
+class UpdateQueue:
+    '''
+    Queue of page writes drained by a fixed number of writer threads, in the order they
+    were submitted. Writes are spaced at least `interval` seconds apart across all writers.
+
+    Each write is a single request that sets the version following the one the content
+    was rendered from; a page edited in the meantime makes the write fail rather than
+    being overwritten. A write that fails with a server error or without a response is
+    not repeated; the page's version is read back, and the write succeeds if the page
+    is already at the version it set.
+
+    :param confluence: the atlassian-python-api Confluence client (optionally bound to a Backend)
+    :param writers: number of writer threads
+    :param interval: minimum number of seconds between the starts of consecutive writes
+    '''
+    def __init__(self, confluence, writers: int=1, interval: float=0.0):
+        self._y_confluence = confluence
+        self._x_interval = interval
+        self._x_next = 0.0
+
+        self._dq_pending = collections.deque()
+        self._b_closed = False
+        self._y_cond = threading.Condition()
+
+        # counters
+        self.writes = 0
+
+        self._a_threads = [threading.Thread(target=self._run, name=f'UpdateQueue-{i_writer}', daemon=True) for i_writer in range(max(1, writers))]
+        for y_thread in self._a_threads:
+            y_thread.start()
+
+    def submit(self, page: PageSnapshot, content: str) -> Future:
+        '''
+        Queue new content for a page
+
+        :param page: snapshot of the page the content was rendered from
+        :param content: the new XHTML content
+        :return: a future for the response of the write
+        '''
+        with self._y_cond:
+            if self._b_closed:
+                raise RuntimeError('Update queue is closed')
+
+            k_update = _Update(page, content)
+            self._dq_pending.append(k_update)
+            self._y_cond.notify()
+
+            return k_update.future
+
+    def _run(self):
+        while True:
+            with self._y_cond:
+                while not self._dq_pending and not self._b_closed:
+                    self._y_cond.wait()
+
+                # closed and drained
+                if not self._dq_pending:
+                    return
+
+                k_update = self._dq_pending.popleft()
+
+                # reserve the next slot
+                x_now = time.monotonic()
+                x_start = max(x_now, self._x_next)
+                self._x_next = x_start+self._x_interval
+
+            # pace
+            if x_start > x_now:
+                time.sleep(x_start-x_now)
+
+            # write
+            try:
+                z_response = self._write(k_update.page, k_update.content)
+            except BaseException as e_write:
+                # outcome unknown; the write may have been applied before the failure
+                if self._landed(k_update.page, e_write):
+                    k_update.future.set_result({})
+                else:
+                    k_update.future.set_exception(e_write)
+            else:
+                k_update.future.set_result(z_response)
+
+    def _landed(self, g_page: PageSnapshot, e_write: BaseException) -> bool:
+        '''
+        Whether a failed write is known to have been applied, i.e., the page is already at the version it set
+        '''
+        n_status = _http_status(e_write)
+
+        # the server answered that the write was not applied
+        if n_status is not None and (n_status < 500 or 429 == n_status):
+            return False
+
+        try:
+            g_current = self._y_confluence.get_page_by_id(g_page.page_id, expand='version')
+        except Exception:
+            return False
+
+        return g_current['version']['number'] == g_page.version+1
+
+    def _write(self, g_page: PageSnapshot, s_content: str) -> Any:
+        with self._y_cond:
+            self.writes += 1
+
+        return self._y_confluence.put(f'rest/api/content/{g_page.page_id}', data={
+            'id': g_page.page_id,
+            'type': 'page',
+            'title': g_page.title,
+            'body': {
+                'storage': {
+                    'value': s_content,
+                    'representation': 'storage',
+                },
+            },
+            'version': {
+                'number': g_page.version+1,
+                'minorEdit': True,
+            },
+        })
+
+    def close(self):
+        '''
+        Finish the writes already queued and stop the writer threads
+        '''
+        with self._y_cond:
+            self._b_closed = True
+            self._y_cond.notify_all()
+
+        for y_thread in self._a_threads:
+            y_thread.join()